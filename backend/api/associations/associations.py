@@ -1,19 +1,30 @@
 from datetime import datetime, timedelta, timezone
 from typing import List
+from uuid import UUID
 
 from core.deps import get_current_user, get_supabase, get_supabase_admin, get_supabase_anon
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel  # <-- NUEVO IMPORT
 from schemas.associations import (
     AcceptInvitationRequest,
     CommunityUser,
+    InvitationBatchResponse,
+    InvitationEmailStatus,
     InvitationResponse,
     InviteAdminRequest,
+    InviteBatchRequest,
     InviteTenantRequest,
     MembershipWithCommunity,
     UserMeResponse,
 )
-from services.email_service import ROLE_LABELS, send_invitation_email
+from services.chat.participant_sync import run_participant_sync
+from services.email_service import INVITATION_EMAIL_KIND, ROLE_LABELS, send_invitation_email, send_invitation_emails
+from services.helpers.account_lookup import account_lookup, normalize_email
+from services.helpers.membership_resolver import (
+    get_association_membership,
+    get_user_memberships,
+    invalidate_memberships,
+)
 from supabase import Client
 
 router = APIRouter()
@@ -78,15 +89,12 @@ def invite_admin(
         raise HTTPException(status_code=400, detail="Cannot grant ADMIN role via invitation")
 
     # Comprobar que el usuario es admin (role=1) de la asociación
-    membership = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("profile_id", current_user["id"])
-        .eq("association_id", str(body.association_id))
-        .eq("role", 1)
-        .execute()
+    is_admin = any(
+        str(membership.get("role")) == "1"
+        for membership in get_user_memberships(supabase, current_user["id"])
+        if str(membership.get("association_id")) == str(body.association_id)
     )
-    if not membership.data:
+    if not is_admin:
         raise HTTPException(status_code=403, detail="Admin access required for this action")
 
     # --- NUEVA VALIDACIÓN: Evitar invitaciones duplicadas ---
@@ -123,9 +131,7 @@ def invite_admin(
 
     invitation = result.data[0]
     role_label = ROLE_LABELS.get(body.role_to_grant, "Miembro")
-    auth_users = supabase_admin.auth.admin.list_users()
-    registered_emails = [user.email for user in auth_users]
-    if body.target_email not in registered_emails:
+    if not account_lookup.has_account(body.target_email, supabase_admin):
         send_invitation_email(body.target_email, str(invitation["id"]), role_label)
 
     return invitation
@@ -139,16 +145,13 @@ def invite_tenant(
     supabase_admin: Client = Depends(get_supabase_admin),
 ):
     # Comprobar que el usuario es owner (role=2) de la propiedad en esa asociación
-    membership = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("profile_id", current_user["id"])
-        .eq("association_id", str(body.association_id))
-        .eq("property_id", str(body.property_id))
-        .eq("role", 2)
-        .execute()
+    is_owner = any(
+        str(membership.get("role")) == "2"
+        for membership in get_user_memberships(supabase, current_user["id"])
+        if str(membership.get("association_id")) == str(body.association_id)
+        and str(membership.get("property_id")) == str(body.property_id)
     )
-    if not membership.data:
+    if not is_owner:
         raise HTTPException(status_code=403, detail="Property owner access required for this action")
 
     result = (
@@ -171,18 +174,91 @@ def invite_tenant(
 
     invitation = result.data[0]
 
-    auth_users = supabase_admin.auth.admin.list_users()
-    registered_emails = [user.email for user in auth_users]
-
-    if body.target_email not in registered_emails:
+    if not account_lookup.has_account(body.target_email, supabase_admin):
         send_invitation_email(body.target_email, str(invitation["id"]), ROLE_LABELS[3])
 
     return invitation
 
 
+@router.post("/invite/batch", response_model=InvitationBatchResponse)
+def invite_batch(
+    body: InviteBatchRequest,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+    supabase_admin: Client = Depends(get_supabase_admin),
+):
+    """
+    Invita a varios vecinos de una vez (p. ej. un edificio entero). Solo para
+    administradores. Las invitaciones se crean con un único insert y se
+    comprueba en una sola consulta qué correos ya tienen cuenta; se omiten los
+    correos repetidos y los que ya tienen una invitación pendiente.
+    """
+    if any(item.role_to_grant == 1 for item in body.invitations):
+        raise HTTPException(status_code=400, detail="Cannot grant ADMIN role via invitation")
+
+    is_admin = any(
+        str(membership.get("role")) == "1"
+        for membership in get_user_memberships(supabase, current_user["id"])
+        if str(membership.get("association_id")) == str(body.association_id)
+    )
+    if not is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required for this action")
+
+    unique_items = {}
+    skipped = []
+    for item in body.invitations:
+        email = normalize_email(item.target_email)
+        if email in unique_items:
+            skipped.append(item.target_email)
+        else:
+            unique_items[email] = item
+
+    # Invitaciones pendientes comparando los correos en minúsculas en los dos lados
+    pending_res = supabase_admin.rpc(
+        "pending_invitation_emails",
+        {"p_association_id": str(body.association_id), "p_emails": sorted(unique_items)},
+    ).execute()
+    for row in pending_res.data or []:
+        item = unique_items.pop(normalize_email(row["email"]), None)
+        if item:
+            skipped.append(item.target_email)
+
+    if not unique_items:
+        return {"created": [], "skipped": skipped}
+
+    rows = []
+    for item in unique_items.values():
+        row = {
+            "target_email": item.target_email,
+            "association_id": str(body.association_id),
+            "role_to_grant": item.role_to_grant,
+            "invited_by_profile_id": current_user["id"],
+            "status": 1,  # PENDING
+        }
+        if item.property_id:
+            row["property_id"] = str(item.property_id)
+        rows.append(row)
+
+    result = supabase_admin.table("invitations").insert(rows).execute()
+    if not result.data:
+        raise HTTPException(status_code=500, detail="Failed to create invitations")
+
+    registered = account_lookup.registered_emails([row["target_email"] for row in result.data], supabase_admin)
+    send_invitation_emails(
+        [
+            (invitation["target_email"], str(invitation["id"]), ROLE_LABELS.get(invitation["role_to_grant"], "Miembro"))
+            for invitation in result.data
+            if normalize_email(invitation["target_email"]) not in registered
+        ]
+    )
+
+    return {"created": result.data, "skipped": skipped}
+
+
 @router.post("/auth/accept-invitation")
 def accept_invitation(
     body: AcceptInvitationRequest,
+    background_tasks: BackgroundTasks,
     supabase_anon: Client = Depends(get_supabase_anon),
     supabase_admin: Client = Depends(get_supabase_admin),
 ):
@@ -237,6 +313,7 @@ def accept_invitation(
 
             user_id = str(new_user.user.id)
             is_new_user = True
+            account_lookup.mark_registered(invitation["target_email"])
 
             # Como admin.create_user solo lo crea pero no inicia sesión, iniciamos sesión ahora para obtener el token
             login_response = supabase_anon.auth.sign_in_with_password(
@@ -282,6 +359,9 @@ def accept_invitation(
 
         if not existing_member.data:
             supabase_admin.table("memberships").insert(membership_data).execute()
+            invalidate_memberships(user_id)
+            # Añadir al nuevo vecino a los canales de grupo de la comunidad
+            background_tasks.add_task(run_participant_sync, membership_data["association_id"], supabase_admin)
 
         # Marcar invitación como ACCEPTED
         (supabase_admin.table("invitations").update({"status": 2}).eq("id", str(body.invitation_token)).execute())
@@ -336,6 +416,7 @@ def get_my_pending_invitations(
 @router.post("/invitations/{invitation_id}/accept")
 def accept_invitation_internal(
     invitation_id: str,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
     supabase_admin: Client = Depends(get_supabase_admin),
@@ -374,6 +455,8 @@ def accept_invitation_internal(
     )
     if not existing.data:
         supabase_admin.table("memberships").insert(membership_data).execute()
+        invalidate_memberships(user_id)
+        background_tasks.add_task(run_participant_sync, membership_data["association_id"], supabase_admin)
 
     # 2. Marcar invitación como ACCEPTED (status = 2)
     supabase_admin.table("invitations").update({"status": 2}).eq("id", invitation_id).execute()
@@ -381,6 +464,48 @@ def accept_invitation_internal(
     return {"message": "Has entrado a la comunidad exitosamente"}
 
 
+@router.get("/invitations/{invitation_id}/email-status", response_model=InvitationEmailStatus)
+def get_invitation_email_status(
+    invitation_id: UUID,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+    supabase_admin: Client = Depends(get_supabase_admin),
+):
+    """
+    Estado del correo de una invitación en la cola de salida. Solo para quien
+    la envió o para Administradores y Presidentes de la comunidad.
+    `not_queued` significa que no hizo falta correo (el destinatario ya tenía cuenta).
+    """
+    inv_res = (
+        supabase_admin.table("invitations")
+        .select("id, association_id, invited_by_profile_id")
+        .eq("id", str(invitation_id))
+        .execute()
+    )
+    if not inv_res.data:
+        raise HTTPException(status_code=404, detail="La invitación no existe")
+
+    invitation = inv_res.data[0]
+    if str(invitation.get("invited_by_profile_id")) != current_user["id"]:
+        admin_check = get_association_membership(supabase, invitation["association_id"], current_user["id"])
+        if not (admin_check and admin_check.get("role") in [1, 4]):
+            raise HTTPException(status_code=403, detail="Admin access required for this action")
+
+    email_res = (
+        supabase_admin.table("email_outbox")
+        .select("status, attempts, last_error, next_attempt_at, sent_at")
+        .eq("kind", INVITATION_EMAIL_KIND)
+        .eq("reference_id", str(invitation_id))
+        .order("created_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    if not email_res.data:
+        return {"invitation_id": invitation_id, "status": "not_queued"}
+
+    return {"invitation_id": invitation_id, **email_res.data[0]}
+
+
 @router.post("/invitations/{invitation_id}/reject")
 def reject_invitation_internal(
     invitation_id: str,
@@ -414,6 +539,7 @@ def reject_invitation_internal(
 @router.delete("/members/{membership_id}")
 def delete_member(
     membership_id: str,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
     supabase_admin: Client = Depends(get_supabase_admin),
@@ -425,15 +551,9 @@ def delete_member(
     membership_to_delete = membership_res.data[0]
     association_id = membership_to_delete["association_id"]
 
-    admin_check = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("profile_id", current_user["id"])
-        .eq("association_id", association_id)
-        .execute()
-    )
+    admin_check = get_association_membership(supabase, association_id, current_user["id"])
 
-    is_admin = admin_check.data and admin_check.data[0].get("role") == 1
+    is_admin = admin_check and admin_check.get("role") == 1
 
     # Opcional: Permitir que un usuario se borre a sí mismo de la comunidad
     is_self = membership_to_delete["profile_id"] == current_user["id"]
@@ -450,6 +570,11 @@ def delete_member(
     except Exception:
         raise HTTPException(status_code=500, detail="Database error")
 
+    invalidate_memberships(membership_to_delete["profile_id"])
+
+    # Sacar al vecino de los canales de grupo de la comunidad
+    background_tasks.add_task(run_participant_sync, str(association_id), supabase_admin)
+
     return {"message": f"Membership {membership_id} deleted successfully"}
 
 
@@ -525,15 +650,9 @@ def create_property(
     Crea una nueva propiedad en la comunidad.
     Solo accesible para Administradores o Presidentes (Roles 1 y 4).
     """
-    admin_check = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("profile_id", current_user["id"])
-        .eq("association_id", association_id)
-        .execute()
-    )
+    admin_check = get_association_membership(supabase, association_id, current_user["id"])
 
-    is_admin = admin_check.data and admin_check.data[0].get("role") in [1, 4]
+    is_admin = admin_check and admin_check.get("role") in [1, 4]
 
     if not is_admin:
         raise HTTPException(status_code=403, detail="Acceso denegado. Se requiere ser Administrador o Presidente.")
@@ -574,15 +693,9 @@ def get_pending_community_invitations(
     Obtiene todas las invitaciones pendientes (status=1) para una comunidad específica.
     Solo accesible para Administradores o Presidentes.
     """
-    admin_check = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("profile_id", current_user["id"])
-        .eq("association_id", association_id)
-        .execute()
-    )
+    admin_check = get_association_membership(supabase, association_id, current_user["id"])
 
-    is_admin = admin_check.data and admin_check.data[0].get("role") in [1, 4]
+    is_admin = admin_check and admin_check.get("role") in [1, 4]
 
     if not is_admin:
         raise HTTPException(status_code=403, detail="Admin access required for this action")
@@ -1,23 +1,104 @@
-from typing import List
+from typing import Optional
 from uuid import UUID
 
 from core.deps import get_current_user, get_supabase
-from fastapi import APIRouter, Depends, HTTPException
-from schemas.chat.alert import Alert
+from fastapi import APIRouter, Depends, HTTPException, Query
+from postgrest.types import CountMethod, ReturnMethod
+from schemas.chat.alert import Alert, AlertPage, AlertsMarkRead, AlertsMarkReadResponse, UnreadCount
 from supabase import Client, create_client  # noqa: F401
 
+from .chat_helpers import decode_keyset_cursor, encode_keyset_cursor
+
 router = APIRouter(prefix="/alerts", tags=["alerts"])
 
+ALERT_PAGE_SIZE = 50
+MAX_ALERT_PAGE_SIZE = 200
+
 
-@router.get("", response_model=List[Alert])
+def count_unread_alerts(supabase: Client, user_id: str) -> int:
+    """
+    COUNT de las alertas sin leer sin traer filas (HEAD con count=exact). Lo
+    resuelve el índice parcial alerts_unread_by_user, así que siempre es el
+    valor actual de la base de datos, lo haya cambiado el worker que sea.
+    """
+    res = (
+        supabase.table("alerts")
+        .select("id", count=CountMethod.exact, head=True)
+        .eq("user_id", str(user_id))
+        .eq("is_read", False)
+        .execute()
+    )
+    return res.count or 0
+
+
+@router.get("", response_model=AlertPage)
 def get_alerts(
+    before: Optional[str] = Query(default=None),
+    limit: int = Query(default=ALERT_PAGE_SIZE, ge=1, le=MAX_ALERT_PAGE_SIZE),
+    unread_only: bool = Query(default=False),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
 ):
-    res = (
-        supabase.table("alerts").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True).execute()
+    """
+    Lista las alertas del usuario de la más reciente a la más antigua, paginadas
+    por cursor (created_at, id). `next_cursor` se pasa como `before` para la
+    siguiente página.
+    """
+    query = supabase.table("alerts").select("*").eq("user_id", current_user["id"])
+    if unread_only:
+        query = query.eq("is_read", False)
+    if before:
+        created_at, alert_id = decode_keyset_cursor(before, detail="Invalid alert cursor")
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{alert_id})')
+
+    res = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+
+    rows = res.data or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "alerts": rows,
+        "next_cursor": encode_keyset_cursor(rows[-1]) if has_more else None,
+        "has_more": has_more,
+    }
+
+
+@router.get("/unread-count", response_model=UnreadCount)
+def get_unread_count(
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """Número de alertas sin leer del usuario."""
+    return {"unread_count": count_unread_alerts(supabase, current_user["id"])}
+
+
+@router.put("/read", response_model=AlertsMarkReadResponse)
+def mark_alerts_read(
+    body: AlertsMarkRead,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Marca como leídas varias alertas en una sola consulta: las de `alert_ids`,
+    las creadas hasta `up_to`, o todas si no se indica ninguna de las dos.
+    """
+    if body.alert_ids is not None and not body.alert_ids:
+        return {"updated": 0, "unread_count": count_unread_alerts(supabase, current_user["id"])}
+
+    query = (
+        supabase.table("alerts")
+        .update({"is_read": True}, count=CountMethod.exact, returning=ReturnMethod.minimal)
+        .eq("user_id", current_user["id"])
+        .eq("is_read", False)
     )
-    return res.data
+    if body.alert_ids:
+        query = query.in_("id", [str(alert_id) for alert_id in body.alert_ids])
+    if body.up_to:
+        query = query.lte("created_at", body.up_to.isoformat())
+
+    res = query.execute()
+    return {"updated": res.count or 0, "unread_count": count_unread_alerts(supabase, current_user["id"])}
 
 
 @router.put("/{alert_id}/read", response_model=Alert)
@@ -26,14 +107,15 @@ def mark_alert_read(
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
 ):
-
-    # Verificamos si la alerta pertenece al usuario
-    alert_res = supabase.table("alerts").select("*").eq("id", str(alert_id)).eq("user_id", current_user["id"]).execute()
-    if not alert_res.data:
-        raise HTTPException(status_code=404, detail="Alert not found or access denied")
-
-    update_res = supabase.table("alerts").update({"is_read": True}).eq("id", str(alert_id)).execute()
+    # Filtrar también por user_id hace la comprobación de propiedad en la misma consulta
+    update_res = (
+        supabase.table("alerts")
+        .update({"is_read": True})
+        .eq("id", str(alert_id))
+        .eq("user_id", current_user["id"])
+        .execute()
+    )
     if not update_res.data:
-        raise HTTPException(status_code=400, detail="Could not update alert")
+        raise HTTPException(status_code=404, detail="Alert not found or access denied")
 
     return update_res.data[0]
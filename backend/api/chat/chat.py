@@ -1,35 +1,56 @@
+import asyncio
 import json
-from typing import Dict, List
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
 from uuid import UUID
 
-from core.deps import get_current_user, get_supabase
+from core.deps import authenticate_token, create_async_user_db, get_current_user, get_supabase
 from fastapi import (
     APIRouter,
     Depends,
     HTTPException,
+    Query,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
 from schemas.chat.chat import (
+    ChannelSummary,
     ChatChannel,
     ChatChannelCreate,
     DirectMessageCreate,
     Message,
     MessageCreate,
+    MessagePage,
+    MessageSearchPage,
+    MessageSyncPage,
     MessageUpdate,
-    MessageWithSender,
 )
+from services.chat.alert_queue import alert_dispatcher
+from services.chat.connection_manager import manager
+from services.chat.membership_cache import channel_members
+from services.chat.repository import MESSAGE_DELETED, ChatRepository, get_chat_repository
+from services.chat.send_queue import CLOSE_CODE_TOKEN_EXPIRED
 from supabase import Client, create_client  # noqa: F401
 
 from .chat_helpers import (
+    decode_message_cursor,
+    direct_message_key,
+    encode_message_cursor,
     verify_association_admin,
     verify_channel_access,
-    verify_message_ownership,
 )
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 1000
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+
 # --- REST Endpoints ---
 
 
@@ -90,6 +111,7 @@ def create_group_channel(
 
     if participants_data:
         supabase.table("channel_participants").insert(participants_data).execute()
+    channel_members.invalidate(created_channel["id"])
 
     return created_channel
 
@@ -171,6 +193,7 @@ def delete_group_channel(
     # 3. Eliminar el canal (Postgres elimina en cascada automáticamente
     # los mensajes y participantes ligados)
     (supabase.table("chat_channels").delete().eq("id", str(channel_id)).execute())
+    channel_members.invalidate(str(channel_id))
 
     return None
 
@@ -192,28 +215,205 @@ def get_user_channels(
     return channels_res.data
 
 
-@router.get("/channels/{channel_id}/messages", response_model=List[MessageWithSender])
-def get_channel_messages(
+@router.get("/inbox", response_model=List[ChannelSummary])
+def get_inbox(
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Devuelve los canales del usuario con su último mensaje (y remitente), el
+    número de mensajes sin leer y el número de participantes, ordenados por
+    actividad reciente.
+
+    Todo se calcula en la base de datos con una única llamada al RPC
+    get_user_inbox (migrations/003_chat_inbox.sql), en lugar de pedir el
+    historial de cada canal por separado.
+    """
+    res = supabase.rpc("get_user_inbox", {"p_user_id": current_user["id"]}).execute()
+    return res.data or []
+
+
+@router.get("/search", response_model=MessageSearchPage)
+def search_messages(
+    q: str = Query(min_length=2, max_length=200),
+    channel_id: Optional[UUID] = Query(default=None),
+    limit: int = Query(default=SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(default=0, ge=0),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Búsqueda de texto completo en los mensajes de los canales del usuario.
+
+    El RPC search_messages (migrations/005_message_search.sql) consulta el
+    índice de texto (tsvector + GIN sobre messages.content), limita los resultados a los canales en los que participa
+    el usuario y devuelve cada mensaje con su relevancia (ts_rank) y un
+    fragmento resaltado (ts_headline), ordenados de más a menos relevante.
+    """
+    query = q.strip()
+    if len(query) < 2:
+        raise HTTPException(status_code=400, detail="Search query is too short")
+
+    if channel_id:
+        verify_channel_access(str(channel_id), current_user["id"], supabase)
+
+    # Pedimos un resultado de más para saber si hay otra página
+    res = supabase.rpc(
+        "search_messages",
+        {
+            "p_user_id": current_user["id"],
+            "p_query": query,
+            "p_channel_id": str(channel_id) if channel_id else None,
+            "p_limit": limit + 1,
+            "p_offset": offset,
+        },
+    ).execute()
+
+    rows = res.data or []
+    has_more = len(rows) > limit
+    return {
+        "results": rows[:limit],
+        "next_offset": offset + limit if has_more else None,
+        "has_more": has_more,
+    }
+
+
+@router.put("/channels/{channel_id}/read", status_code=status.HTTP_204_NO_CONTENT)
+def mark_channel_read(
     channel_id: UUID,
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
+):
+    """Marca el canal como leído hasta ahora (last_read_at del participante)."""
+    verify_channel_access(str(channel_id), current_user["id"], supabase)
+
+    (
+        supabase.table("channel_participants")
+        .update({"last_read_at": datetime.now(timezone.utc).isoformat()})
+        .eq("channel_id", str(channel_id))
+        .eq("user_id", current_user["id"])
+        .execute()
+    )
+    return None
+
+
+@router.get("/channels/{channel_id}/messages", response_model=MessagePage)
+async def get_channel_messages(
+    channel_id: UUID,
+    before: Optional[str] = Query(default=None),
+    after: Optional[str] = Query(default=None),
+    limit: int = Query(default=MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+    repo: ChatRepository = Depends(get_chat_repository),
 ):
     """
-    Busca el historial de mensajes de un canal, incluyendo
+    Busca una página del historial de mensajes de un canal, incluyendo
     la información del remitente.
+
+    Paginación keyset sobre (created_at, id):
+    - Sin cursor devuelve la página más reciente.
+    - `before` devuelve los mensajes anteriores al cursor (scroll hacia atrás).
+    - `after` devuelve los mensajes posteriores al cursor.
+    Los mensajes de cada página vienen siempre en orden ascendente y
+    `next_cursor` indica desde dónde pedir la siguiente página en la misma dirección.
     """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+
     # Verificamos si el usuario pertenece al canal
-    verify_channel_access(str(str(channel_id)), current_user["id"], supabase)
+    await repo.verify_channel_access(str(channel_id), current_user["id"])
+
+    keyset_filter = None
+    if after:
+        created_at, message_id = decode_message_cursor(after)
+        keyset_filter = f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{message_id})'
+        descending = False
+    else:
+        if before:
+            created_at, message_id = decode_message_cursor(before)
+            keyset_filter = f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{message_id})'
+        descending = True
+
+    # Pedimos un mensaje de más para saber si quedan páginas sin un COUNT
+    rows = await repo.list_messages(str(channel_id), keyset_filter, descending, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = encode_message_cursor(rows[-1]) if has_more else None
+    if descending:
+        rows.reverse()
+
+    return {"messages": rows, "next_cursor": next_cursor, "has_more": has_more}
+
+
+def _existing_direct_message(channel: dict) -> dict:
+    """Devuelve un DM ya existente salvo que esté bloqueado."""
+    if channel.get("is_blocked"):
+        raise HTTPException(
+            status_code=403,
+            detail="This direct message chat is blocked.",
+        )
+    return channel
+
 
-    messages_res = (
-        supabase.table("messages")
-        .select("*, sender:sender_id(id, username, avatar_url, created_at)")
+@router.get("/channels/{channel_id}/sync", response_model=MessageSyncPage)
+def sync_channel_messages(
+    channel_id: UUID,
+    since: int = Query(ge=0),
+    limit: int = Query(default=SYNC_PAGE_SIZE, ge=1, le=MAX_SYNC_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Devuelve lo que ha cambiado en un canal desde la marca de agua `since`
+    (el `seq` del último evento recibido): mensajes nuevos o editados, con su
+    estado actual, y los ids de los borrados.
+
+    Se lee el registro message_changes en orden de secuencia y se cargan los
+    mensajes afectados en una sola consulta. Si `has_more` es true, se vuelve
+    a llamar con `since=high_water_mark`.
+    """
+    verify_channel_access(str(channel_id), current_user["id"], supabase)
+
+    changes_res = (
+        supabase.table("message_changes")
+        .select("id, message_id, change_type")
         .eq("channel_id", str(channel_id))
-        .order("created_at", desc=False)
+        .gt("id", since)
+        .order("id")
+        .limit(limit + 1)
         .execute()
     )
+    changes = changes_res.data or []
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Nos quedamos con el último cambio de cada mensaje
+    latest: dict[str, str] = {}
+    for change in changes:
+        latest[str(change["message_id"])] = change["change_type"]
+
+    deleted_ids = [message_id for message_id, change_type in latest.items() if change_type == MESSAGE_DELETED]
+    changed_ids = [message_id for message_id, change_type in latest.items() if change_type != MESSAGE_DELETED]
+
+    messages = []
+    if changed_ids:
+        messages_res = (
+            supabase.table("messages")
+            .select("*, sender:sender_id(id, username, avatar_url, created_at)")
+            .in_("id", changed_ids)
+            .order("created_at")
+            .order("id")
+            .execute()
+        )
+        messages = messages_res.data or []
 
-    return messages_res.data
+    return {
+        "messages": messages,
+        "deleted_ids": deleted_ids,
+        "high_water_mark": changes[-1]["id"] if changes else since,
+        "has_more": has_more,
+    }
 
 
 @router.post("/channels/{channel_id}/direct", response_model=ChatChannel)
@@ -240,14 +440,7 @@ def create_direct_message(
     # 3. Validar que el target_user_id también está en la misma comunidad
     # (comprobando su participación en canales de la comunidad,
     # o en este canal)
-    target_access_res = (
-        supabase.table("channel_participants")
-        .select("*")
-        .eq("channel_id", str(channel_id))
-        .eq("user_id", str(dm_in.target_user_id))
-        .execute()
-    )
-    if not target_access_res.data:
+    if not channel_members.is_member(str(channel_id), str(dm_in.target_user_id), supabase):
         raise HTTPException(
             status_code=400,
             detail="Target user is not a participant of this channel",
@@ -257,68 +450,32 @@ def create_direct_message(
     my_user_id = current_user["id"]
 
     # 4. Comprobar si ya existe un DM entre ellos en esta comunidad
-    # Una forma de hacerlo es buscar los DMs de la comunidad
-    # y ver si ambos participan
-    dm_channels_res = (
-        supabase.table("chat_channels")
-        .select("id, is_blocked")
-        .eq("association_id", association_id)
-        .eq("is_direct_message", True)
-        .execute()
-    )
-    if dm_channels_res.data:
-        dm_channel_ids = [c["id"] for c in dm_channels_res.data]
-
-        # Buscar en qué canales de DM participo yo
-        my_dms_res = (
-            supabase.table("channel_participants")
-            .select("channel_id")
-            .eq("user_id", my_user_id)
-            .in_("channel_id", dm_channel_ids)
-            .execute()
-        )
-        my_dm_ids = [str(p["channel_id"]) for p in my_dms_res.data]
-
-        if my_dm_ids:
-            # Buscar en cuáles de esos participa el target
-            target_dms_res = (
-                supabase.table("channel_participants")
-                .select("channel_id")
-                .eq("user_id", target_user_id)
-                .in_("channel_id", my_dm_ids)
-                .execute()
-            )
-
-            if target_dms_res.data:
-                # Ya existe un DM entre los dos en esta comunidad
-                existing_dm_id = str(target_dms_res.data[0]["channel_id"])
-
-                # Obtener la info del canal para ver si está bloqueado
-                existing_channel = next(
-                    (c for c in dm_channels_res.data if str(c["id"]) == existing_dm_id),
-                    None,
-                )
-                if existing_channel and existing_channel.get("is_blocked"):
-                    raise HTTPException(
-                        status_code=403,
-                        detail="This direct message chat is blocked.",
-                    )
-
-                # Retornar el canal existente
-                full_channel_res = supabase.table("chat_channels").select("*").eq("id", existing_dm_id).execute()
-                return full_channel_res.data[0]
-
-    # 5. Si no existe, crearlo
+    # con una única búsqueda por la clave canónica del par
+    dm_key = direct_message_key(association_id, my_user_id, target_user_id)
+    existing_res = supabase.table("chat_channels").select("*").eq("dm_key", dm_key).execute()
+    if existing_res.data:
+        return _existing_direct_message(existing_res.data[0])
+
+    # 5. Si no existe, crearlo. El índice único sobre dm_key (ver
+    # migrations/004_direct_message_key.sql) resuelve la
+    # carrera si los dos vecinos se escriben a la vez: la segunda inserción
+    # se ignora y devolvemos el canal que creó la primera.
     new_channel_data = {
         "association_id": association_id,
         "is_direct_message": True,
         "is_blocked": False,
         "blocked_by": None,
+        "dm_key": dm_key,
     }
 
-    new_channel_res = supabase.table("chat_channels").insert(new_channel_data).execute()
+    new_channel_res = (
+        supabase.table("chat_channels").upsert(new_channel_data, on_conflict="dm_key", ignore_duplicates=True).execute()
+    )
     if not new_channel_res.data:
-        raise HTTPException(status_code=500, detail="Failed to create direct message channel")
+        existing_res = supabase.table("chat_channels").select("*").eq("dm_key", dm_key).execute()
+        if not existing_res.data:
+            raise HTTPException(status_code=500, detail="Failed to create direct message channel")
+        return _existing_direct_message(existing_res.data[0])
 
     created_channel = new_channel_res.data[0]
 
@@ -328,6 +485,7 @@ def create_direct_message(
         {"channel_id": created_channel["id"], "user_id": target_user_id},
     ]
     supabase.table("channel_participants").insert(participants_data).execute()
+    channel_members.invalidate(created_channel["id"])
 
     return created_channel
 
@@ -425,7 +583,7 @@ async def send_message(
     channel_id: UUID,
     msg_in: MessageCreate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repo: ChatRepository = Depends(get_chat_repository),
 ):
     """
     Envía un nuevo mensaje a un canal a través de la API REST oficial.
@@ -440,7 +598,7 @@ async def send_message(
        'retransmitir' (broadcast) el mensaje en vivo a todos los usuarios
        conectados instantáneamente.
     """
-    verify_channel_access(str(str(channel_id)), current_user["id"], supabase)
+    await repo.verify_channel_access(str(channel_id), current_user["id"])
 
     if msg_in.channel_id != channel_id:
         raise HTTPException(status_code=400, detail="Channel ID mismatch")
@@ -451,39 +609,31 @@ async def send_message(
         "content": msg_in.content,
     }
 
-    insert_res = supabase.table("messages").insert(new_msg).execute()
-
-    if not insert_res.data:
+    saved_message = await repo.insert_message(new_msg)
+    if not saved_message:
         raise HTTPException(status_code=500, detail="Could not send message")
 
-    saved_message = insert_res.data[0]
+    # El trigger de messages ya apuntó el alta en message_changes y devuelve su secuencia
+    seq = saved_message.get("change_seq")
 
     # --- Añadimos lógica de notificaciones de chat (Alertas) ---
     sender_name = current_user.get("username", "Un vecino")
 
     # Obtenemos todos los participantes del canal para notificarles,
-    # excluyendo al remitente
-    all_participants_res = (
-        supabase.table("channel_participants").select("user_id").eq("channel_id", str(channel_id)).execute()
-    )
-    participants = [p["user_id"] for p in all_participants_res.data if p["user_id"] != current_user["id"]]
+    # excluyendo al remitente (lista servida desde la caché de participantes)
+    members = await repo.channel_members(str(channel_id))
+    participants = sorted(user_id for user_id in members if user_id != current_user["id"])
 
     if participants:
+        # Las alertas se crean en segundo plano (por lotes y con reintentos) y
+        # se empujan al socket de cada destinatario cuando ya existen en BD
         msg_preview = msg_in.content[:100] + ("..." if len(msg_in.content) > 100 else "")
-        alerts_to_insert = [
-            {
-                "user_id": p_id,
-                "title": f"Nuevo mensaje de {sender_name}",
-                "content": msg_preview,
-                "reference_id": saved_message["id"],
-            }
-            for p_id in participants
-        ]
-        supabase.rpc("create_alerts_batch", {"payload": alerts_to_insert}).execute()
+        alert_dispatcher.enqueue(participants, str(channel_id), sender_name, msg_preview, saved_message["id"])
     # -----------------------------------------------------------
 
-    # Retransmitimos el mensaje ya guardado a todos los clientes del WebSocket
-    await manager.broadcast(saved_message, str(channel_id))
+    # Retransmitimos el mensaje ya guardado a todos los clientes del WebSocket,
+    # con su número de secuencia para que el cliente sepa su marca de agua
+    await manager.broadcast({**saved_message, "seq": seq}, str(channel_id))
 
     return saved_message
 
@@ -494,44 +644,40 @@ async def update_message(
     message_id: UUID,
     msg_in: MessageUpdate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repo: ChatRepository = Depends(get_chat_repository),
 ):
     """
     Edita un mensaje existente y actualiza la notificación
     (alerta) correspondiente.
     """
     # 1. Verificar si el mensaje existe y pertenece al usuario
-    verify_message_ownership(str(message_id), str(str(channel_id)), current_user["id"], supabase)
+    await repo.verify_message_ownership(str(message_id), str(channel_id), current_user["id"])
 
     # 2. Actualizar el mensaje
-    update_res = (
-        supabase.table("messages")
-        .update(
-            {
-                "content": msg_in.content,
-                "is_edited": True,
-                "updated_at": "now()",
-            }
-        )
-        .eq("id", message_id)
-        .execute()
+    updated_message = await repo.update_message(
+        str(message_id),
+        {
+            "content": msg_in.content,
+            "is_edited": True,
+            "updated_at": "now()",
+        },
     )
-
-    if not update_res.data:
+    if not updated_message:
         raise HTTPException(status_code=500, detail="Could not update message")
 
-    updated_message = update_res.data[0]
+    seq = updated_message.get("change_seq")
 
     # 3. Actualizar la notificación (alerta) correspondiente
     msg_preview = msg_in.content[:100] + ("..." if len(msg_in.content) > 100 else "")
 
-    supabase.rpc(
+    alert_dispatcher.update_reference(str(message_id), msg_preview)
+    await repo.rpc(
         "update_alert_by_reference",
         {"p_reference_id": str(message_id), "p_content": msg_preview},
-    ).execute()
+    )
 
     # 4. Retransmitir evento de edición al WebSocket
-    broadcast_data = {"event": "message_edited", "message": updated_message}
+    broadcast_data = {"event": "message_edited", "message": updated_message, "seq": seq}
     await manager.broadcast(broadcast_data, str(channel_id))
 
     return updated_message
@@ -545,59 +691,31 @@ async def delete_message(
     channel_id: UUID,
     message_id: UUID,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repo: ChatRepository = Depends(get_chat_repository),
 ):
     """Elimina un mensaje y sus notificaciones correspondientes."""
     # 1. Verificar si el mensaje existe y pertenece al usuario
-    verify_message_ownership(str(message_id), str(str(channel_id)), current_user["id"], supabase)
+    await repo.verify_message_ownership(str(message_id), str(channel_id), current_user["id"])
 
     # 2. Eliminar el mensaje
-    (supabase.table("messages").delete().eq("id", message_id).execute())
-    # Supabase Python client .delete() might return data if it has
-    # returning=* or we can just rely on not raising
+    seq = await repo.delete_message(str(message_id))
 
-    # 3. Eliminar la alerta correspondiente (si reference_id = message_id)
-    supabase.rpc("delete_alert_by_reference", {"p_reference_id": str(message_id)}).execute()
+    # 3. Quitar el mensaje de sus alertas: las que agrupaban más mensajes se mantienen
+    alert_dispatcher.discard_reference(str(message_id))
+    await repo.rpc("discard_alert_message", {"p_message_id": str(message_id)})
 
     # 4. Retransmitir evento de borrado al WebSocket
     broadcast_data = {
         "event": "message_deleted",
         "message_id": str(message_id),
         "channel_id": channel_id,
+        "seq": seq,
     }
     await manager.broadcast(broadcast_data, str(channel_id))
 
     return None
 
 
-# --- WebSocket Manager ---
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, channel_id: UUID):
-        await websocket.accept()
-        if channel_id not in self.active_connections:
-            self.active_connections[channel_id] = []
-        self.active_connections[channel_id].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, channel_id: UUID):
-        if channel_id in self.active_connections:
-            if websocket in self.active_connections[channel_id]:
-                self.active_connections[channel_id].remove(websocket)
-            if not self.active_connections[channel_id]:
-                del self.active_connections[channel_id]
-
-    async def broadcast(self, message: dict, channel_id: UUID):
-        if channel_id in self.active_connections:
-            for connection in self.active_connections[channel_id]:
-                # Send JSON stringified data to frontend
-                await connection.send_text(json.dumps(message))
-
-
-manager = ConnectionManager()
-
-
 @router.websocket("/ws/{channel_id}")
 async def websocket_endpoint(websocket: WebSocket, channel_id: UUID):
     """
@@ -622,3 +740,80 @@ async def websocket_endpoint(websocket: WebSocket, channel_id: UUID):
             )
     except WebSocketDisconnect:
         manager.disconnect(websocket, str(channel_id))
+
+
+@router.websocket("/ws")
+async def user_websocket_endpoint(websocket: WebSocket):
+    """
+    WebSocket multiplexado: un único socket por usuario para todos sus canales.
+
+    Se autentica una sola vez con el mismo JWT que el resto de la API, en el
+    parámetro `token` (los navegadores no permiten cabeceras en WebSockets) o
+    en la cabecera Authorization. Después el cliente envía:
+        {"action": "subscribe", "channel_id": "..."}
+        {"action": "unsubscribe", "channel_id": "..."}
+    y recibe los eventos de esos canales (cada uno lleva su channel_id) junto
+    con sus alertas nuevas (`alert_created`), sin necesidad de polling.
+
+    Si el usuario deja de participar en un canal, se le da de baja y recibe
+    `channel_access_revoked`. Cuando caduca el token, el socket se cierra con
+    el código 4001 y el cliente debe reconectar con uno renovado.
+    """
+    token = websocket.query_params.get("token")
+    auth_header = websocket.headers.get("authorization", "")
+    if not token and auth_header.lower().startswith("bearer "):
+        token = auth_header[7:]
+
+    try:
+        # En un hilo: con la caché del JWKS fría o un kid nuevo, verificar descarga las claves
+        current_user = await asyncio.to_thread(authenticate_token, token or "")
+    except HTTPException as e:
+        # Si no se han podido descargar las claves, el cliente debe reintentar, no renovar la sesión
+        unavailable = e.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER if unavailable else status.WS_1008_POLICY_VIOLATION)
+        return
+
+    repo = ChatRepository(create_async_user_db(token))
+    connection = await manager.connect_user(websocket, current_user["id"])
+
+    def reply(event: dict):
+        connection.enqueue(json.dumps(event))
+
+    async def close_on_expiry(exp: float):
+        await asyncio.sleep(max(0.0, exp - time.time()))
+        await connection.close(CLOSE_CODE_TOKEN_EXPIRED)
+
+    expiry = asyncio.create_task(close_on_expiry(current_user["exp"])) if current_user.get("exp") else None
+
+    try:
+        while True:
+            try:
+                command = await websocket.receive_json()
+                action = command.get("action")
+                channel_id = str(UUID(str(command.get("channel_id"))))
+            except WebSocketDisconnect:
+                raise
+            except (ValueError, TypeError, AttributeError):
+                reply({"event": "error", "detail": "Invalid command"})
+                continue
+
+            if action == "subscribe":
+                try:
+                    await repo.verify_channel_access(channel_id, current_user["id"])
+                except HTTPException as e:
+                    reply({"event": "error", "channel_id": channel_id, "detail": e.detail})
+                    continue
+                manager.subscribe(connection, channel_id)
+                reply({"event": "subscribed", "channel_id": channel_id})
+            elif action == "unsubscribe":
+                manager.unsubscribe(connection, channel_id)
+                reply({"event": "unsubscribed", "channel_id": channel_id})
+            else:
+                reply({"event": "error", "channel_id": channel_id, "detail": "Unknown action"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # También si el bucle termina por un error: la conexión no debe quedarse registrada
+        connection.stop()
+        if expiry is not None:
+            expiry.cancel()
@@ -1,130 +1,112 @@
+import base64
+import binascii
+from datetime import datetime
 from uuid import UUID
 
 from fastapi import HTTPException
+from services.chat.membership_cache import channel_members
+from services.helpers.membership_resolver import get_association_membership, get_property_membership
 from supabase import Client
 
 
 def verify_channel_access(channel_id: UUID | str, user_id: str, admin_supabase: Client):
-    """Verifica que un usuario pertenece a un canal. Lanza 403 si no es asi."""
-    access_res = (
-        admin_supabase.table("channel_participants")
-        .select("*")
-        .eq("channel_id", str(channel_id))
-        .eq("user_id", str(user_id))
-        .execute()
-    )
-    if not access_res.data:
+    """
+    Verifica que un usuario pertenece a un canal. Lanza 403 si no es asi.
+    Se apoya en la caché de participantes para no consultar la base de datos en cada llamada.
+    """
+    if not channel_members.is_member(str(channel_id), str(user_id), admin_supabase):
         raise HTTPException(status_code=403, detail="Access denied to this channel")
-    return access_res.data[0]
-
-
-def verify_message_ownership(
-    message_id: UUID | str,
-    channel_id: UUID | str,
-    user_id: str,
-    admin_supabase: Client,
-):
-    """Verifica que un mensaje existe y pertenece al usuario. Lanza 404 o 403."""
-    msg_res = (
-        admin_supabase.table("messages")
-        .select("*")
-        .eq("id", str(message_id))
-        .eq("channel_id", str(channel_id))
-        .execute()
-    )
-    if not msg_res.data:
-        raise HTTPException(status_code=404, detail="Message not found")
-
-    original_msg = msg_res.data[0]
-    if str(original_msg["sender_id"]) != str(user_id):
-        raise HTTPException(
-            status_code=403,
-            detail="Not authorized to perform this action on this message",
-        )
+    return {"channel_id": str(channel_id), "user_id": str(user_id)}
 
-    return original_msg
+
+def direct_message_key(association_id: UUID | str, user_a: UUID | str, user_b: UUID | str) -> str:
+    """
+    Clave canónica de un DM: comunidad + ids de los dos usuarios ordenados.
+    Es la misma sea quien sea el que inicia la conversación, así que con un
+    índice único sobre chat_channels.dm_key basta una consulta para encontrarlo.
+    """
+    first, second = sorted((str(user_a), str(user_b)))
+    return f"{association_id}:{first}:{second}"
 
 
 def verify_association_admin(association_id: UUID | str, user_id: str, supabase: Client):
     """Verifica que un usuario tiene rol de administrador (role=1) en la comunidad dada. Lanza 403 o 404."""
-    membership_res = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("association_id", str(association_id))
-        .eq("profile_id", str(user_id))
-        .execute()
-    )
-
-    if not membership_res.data:
-        raise HTTPException(status_code=404, detail="Membership not found in this community")
+    membership = get_association_membership(supabase, association_id, user_id)
 
-    user_role = membership_res.data[0].get("role")
+    if not membership:
+        raise HTTPException(status_code=404, detail="Membership not found in this community")
 
-    if str(user_role) != "1":
+    if str(membership.get("role")) != "1":
         raise HTTPException(status_code=403, detail="Admin access required for this action")
 
-    return membership_res.data[0]
+    return membership
 
 
 def verify_association_membership(association_id: UUID | str, user_id: str, supabase: Client):
     """Verifica que un usuario pertenece a la comunidad dada. Lanza 403 si no."""
-    membership_res = (
-        supabase.table("memberships")
-        .select("profile_id")
-        .eq("association_id", str(association_id))
-        .eq("profile_id", str(user_id))
-        .execute()
-    )
-
-    if not membership_res.data:
+    membership = get_association_membership(supabase, association_id, user_id)
+
+    if not membership:
         raise HTTPException(status_code=403, detail="Access denied to this community")
 
-    return membership_res.data[0]
+    return membership
 
 
 def verify_association_president(association_id: UUID | str, user_id: str, supabase: Client):
     """Verifica que un usuario tiene rol de presidente (role=4) en la comunidad dada. Lanza 403 o 404."""
-    membership_res = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("association_id", str(association_id))
-        .eq("profile_id", str(user_id))
-        .execute()
-    )
-
-    if not membership_res.data:
-        raise HTTPException(status_code=404, detail="Membership not found in this community")
+    membership = get_association_membership(supabase, association_id, user_id)
 
-    user_role = membership_res.data[0].get("role")
+    if not membership:
+        raise HTTPException(status_code=404, detail="Membership not found in this community")
 
-    if str(user_role) != "4":
+    if str(membership.get("role")) != "4":
         raise HTTPException(
             status_code=403,
             detail="Association president access required for this action",
         )
 
-    return membership_res.data[0]
+    return membership
 
 
 def verify_property_owner(property_id: UUID | str, user_id: str, supabase: Client):
     """Verifica que un usuario es propietario de una propiedad dada. Lanza 403 o 404."""
-    ownership_res = (
-        supabase.table("memberships")
-        .select("*")
-        .eq("property_id", str(property_id))
-        .eq("profile_id", str(user_id))
-        .execute()
-    )
-
-    if not ownership_res.data:
-        raise HTTPException(status_code=404, detail="Property not found")
+    membership = get_property_membership(supabase, property_id, user_id)
 
-    user_role = ownership_res.data[0].get("role")
+    if not membership:
+        raise HTTPException(status_code=404, detail="Property not found")
 
-    if str(user_role) != "2":
+    if str(membership.get("role")) != "2":
         raise HTTPException(
             status_code=403,
             detail="Property owner access required for this action",
         )
 
-    return ownership_res.data[0]
+    return membership
+
+
+def encode_keyset_cursor(row: dict) -> str:
+    """Codifica la posición (created_at, id) de una fila como cursor opaco."""
+    raw = f"{row['created_at']}|{row['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_keyset_cursor(cursor: str, detail: str = "Invalid cursor") -> tuple[str, str]:
+    """Decodifica un cursor en (created_at, id). Lanza 400 con `detail` si no es válido."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        return created_at, str(UUID(row_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail=detail)
+
+
+def encode_message_cursor(message: dict) -> str:
+    """Codifica la posición (created_at, id) de un mensaje como cursor opaco."""
+    return encode_keyset_cursor(message)
+
+
+def decode_message_cursor(cursor: str) -> tuple[str, str]:
+    """Decodifica un cursor de mensajes en (created_at, id). Lanza 400 si no es válido."""
+    return decode_keyset_cursor(cursor, detail="Invalid message cursor")
@@ -1,9 +1,8 @@
-from api.chat.chat_helpers import verify_association_membership
-from core.deps import get_current_user, get_supabase
+from core.deps import get_current_user
 from fastapi import APIRouter, Depends, HTTPException
 from schemas.chatBot.chatBot import ChatBotRequest, ChatBotResponse
+from services.chat.repository import ChatRepository, get_chat_repository
 from services.chatBot.chatBotService import get_chatbot_response
-from supabase import Client
 
 router = APIRouter(prefix="/comunities", tags=["chatbot"])
 
@@ -13,7 +12,7 @@ async def chatbot_with_documents(
     comunidad_id: str,
     request: ChatBotRequest,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
+    repo: ChatRepository = Depends(get_chat_repository),
 ):
     path_comunidad_id = str(comunidad_id).strip()
 
@@ -28,7 +27,7 @@ async def chatbot_with_documents(
     if not pregunta.strip():
         raise HTTPException(status_code=400, detail="La pregunta no puede estar vacia.")
 
-    verify_association_membership(path_comunidad_id, current_user["id"], supabase)
+    await repo.verify_association_membership(path_comunidad_id, current_user["id"])
 
     # Backend stateless: no se guarda historial. El cliente puede mantenerlo si quiere.
     data = await get_chatbot_response(path_comunidad_id, pregunta, history=None)
@@ -1,24 +1,35 @@
-import io
+import asyncio
 from typing import Optional
 
-import pypdf
 from api.chat.chat_helpers import verify_association_admin
 from core.deps import get_current_user, get_supabase
 from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
-from services.chatBot.documents_ChatBotService import delete_document, index_document, list_documents
+from schemas.chatBot.documents import DocumentJobAccepted, DocumentJobStatus
+from services.chatBot.documents_ChatBotService import (
+    SUPPORTED_FILE_TYPES,
+    delete_document,
+    list_documents,
+    rebuild_catalog,
+)
+from services.chatBot.ingestion_jobs import document_ingestion
 from supabase import Client
 
 router = APIRouter(prefix="/comunities", tags=["documents"])
 
 
 @router.get("/{comunidad_id}/documents")
-async def get_documents(
+def get_documents(
     comunidad_id: str,
     uploaded_by: Optional[str] = Query(default=None),
     limit: int = Query(default=100, ge=1, le=500),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase),
 ):
+    """
+    Títulos de los documentos de la comunidad. Síncrono a propósito: la primera
+    consulta de una comunidad sin catálogo lo reconstruye desde Pinecone, y así
+    corre en el threadpool en lugar de bloquear el event loop.
+    """
     path_comunidad_id = str(comunidad_id).strip()
     verify_association_admin(path_comunidad_id, current_user["id"], supabase)
     result = list_documents(path_comunidad_id, uploaded_by=uploaded_by, limit=limit)
@@ -26,16 +37,8 @@ async def get_documents(
     return {"documents": documents}
 
 
-@router.post("/{comunidad_id}/documents")
-async def upload_document(
-    comunidad_id: str,
-    request: Request,
-    file: Optional[UploadFile] = File(None),
-    current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase),
-):
-    path_comunidad_id = str(comunidad_id).strip()
-    verify_association_admin(path_comunidad_id, current_user["id"], supabase)
+async def _read_upload(request: Request, file: Optional[UploadFile]) -> tuple[str, object, str]:
+    """Título, contenido (bytes o fichero) y tipo del documento enviado como JSON o Form-Data."""
     content_type = request.headers.get("content-type", "")
 
     if "application/json" in content_type:
@@ -49,57 +52,17 @@ async def upload_document(
                 detail="Faltan campos 'title' o 'content' en el JSON.",
             )
 
-        chunks = index_document(
-            path_comunidad_id,
-            title,
-            content,
-            uploaded_by=str(current_user["id"]),
-            uploaded_by_email=current_user.get("email"),
-            source_filename=title,
-        )
-        return {
-            "message": f"Documento '{title}' indexado con exito",
-            "chunks": chunks,
-            "uploaded_by": str(current_user["id"]),
-        }
+        return title, content.encode("utf-8"), "txt"
 
     if "multipart/form-data" in content_type:
         if not file:
             raise HTTPException(status_code=400, detail="No se ha enviado un archivo valido.")
 
-        texto_extraido = ""
-        if file.filename.endswith(".txt"):
-            contenido_bytes = await file.read()
-            texto_extraido = contenido_bytes.decode("utf-8")
-        elif file.filename.endswith(".pdf"):
-            contenido_bytes = await file.read()
-            lector_pdf = pypdf.PdfReader(io.BytesIO(contenido_bytes))
-            for pagina in lector_pdf.pages:
-                texto_pagina = pagina.extract_text()
-                if texto_pagina:
-                    texto_extraido += texto_pagina + "\n"
-        else:
+        file_type = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else ""
+        if file_type not in SUPPORTED_FILE_TYPES:
             raise HTTPException(status_code=400, detail="Formato no soportado. Sube un .txt o .pdf")
 
-        if not texto_extraido.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="El documento esta vacio o no se pudo extraer el texto.",
-            )
-
-        chunks = index_document(
-            path_comunidad_id,
-            file.filename,
-            texto_extraido,
-            uploaded_by=str(current_user["id"]),
-            uploaded_by_email=current_user.get("email"),
-            source_filename=file.filename,
-        )
-        return {
-            "message": f"Documento '{file.filename}' indexado con exito",
-            "chunks": chunks,
-            "uploaded_by": str(current_user["id"]),
-        }
+        return file.filename, file.file, file_type
 
     raise HTTPException(
         status_code=400,
@@ -107,6 +70,96 @@ async def upload_document(
     )
 
 
+async def _submit_document(
+    comunidad_id: str,
+    title: str,
+    source,
+    file_type: str,
+    current_user: dict,
+    source_filename: str,
+    incremental: bool = False,
+) -> DocumentJobAccepted:
+    job = await asyncio.to_thread(
+        document_ingestion.submit,
+        comunidad_id,
+        title,
+        source,
+        file_type,
+        uploaded_by=str(current_user["id"]),
+        uploaded_by_email=current_user.get("email"),
+        source_filename=source_filename,
+        incremental=incremental,
+    )
+    action = "actualizando" if incremental else "indexando"
+    return DocumentJobAccepted(
+        message=f"Documento '{title}' recibido, {action} en segundo plano",
+        job_id=job.id,
+        status=job.status,
+        status_url=f"/comunities/{comunidad_id}/documents/jobs/{job.id}",
+        uploaded_by=str(current_user["id"]),
+    )
+
+
+@router.post("/{comunidad_id}/documents", status_code=202, response_model=DocumentJobAccepted)
+async def upload_document(
+    comunidad_id: str,
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Acepta el documento y lo indexa en segundo plano. El progreso se consulta en
+    GET /{comunidad_id}/documents/jobs/{job_id} o llega por el socket del usuario.
+    """
+    path_comunidad_id = str(comunidad_id).strip()
+    verify_association_admin(path_comunidad_id, current_user["id"], supabase)
+
+    title, source, file_type = await _read_upload(request, file)
+    return await _submit_document(path_comunidad_id, title, source, file_type, current_user, source_filename=title)
+
+
+@router.put("/{comunidad_id}/documents", status_code=202, response_model=DocumentJobAccepted)
+async def update_document(
+    comunidad_id: str,
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    document_title: Optional[str] = Query(default=None, min_length=1),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """
+    Sustituye un documento ya indexado por una nueva versión. Solo se recalculan
+    los chunks que cambian; document_title permite subir la versión nueva con
+    otro nombre de fichero.
+    """
+    path_comunidad_id = str(comunidad_id).strip()
+    verify_association_admin(path_comunidad_id, current_user["id"], supabase)
+
+    filename, source, file_type = await _read_upload(request, file)
+    title = document_title.strip() if document_title and document_title.strip() else filename
+    return await _submit_document(
+        path_comunidad_id, title, source, file_type, current_user, source_filename=filename, incremental=True
+    )
+
+
+@router.get("/{comunidad_id}/documents/jobs/{job_id}", response_model=DocumentJobStatus)
+async def get_document_job(
+    comunidad_id: str,
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    path_comunidad_id = str(comunidad_id).strip()
+    verify_association_admin(path_comunidad_id, current_user["id"], supabase)
+
+    row = document_ingestion.lookup(job_id)
+    if row is None or str(row.get("comunidad_id")) != path_comunidad_id:
+        raise HTTPException(status_code=404, detail="Document job not found in this community")
+
+    return DocumentJobStatus(job_id=str(row["id"]), **{key: value for key, value in row.items() if key != "id"})
+
+
 @router.delete("/{comunidad_id}/documents")
 async def delete_document_by_title(
     comunidad_id: str,
@@ -125,3 +178,17 @@ async def delete_document_by_title(
         "message": f"Documento '{result['document_title']}' eliminado con exito",
         **result,
     }
+
+
+@router.post("/{comunidad_id}/documents/catalog/rebuild")
+async def rebuild_document_catalog(
+    comunidad_id: str,
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase),
+):
+    """Añade al catálogo los documentos indexados antes de que existiera."""
+    path_comunidad_id = str(comunidad_id).strip()
+    verify_association_admin(path_comunidad_id, current_user["id"], supabase)
+
+    added = await asyncio.to_thread(rebuild_catalog, path_comunidad_id)
+    return {"message": f"{added} documentos añadidos al catalogo", "added": added}
@@ -11,21 +11,14 @@ from services.common_space.common_space_service import get_common_space_by_id as
 from services.common_space.common_space_service import list_common_spaces as list_common_spaces_service
 from services.common_space.common_space_service import update_common_space as update_common_space_service
 from services.common_space.common_space_service import upload_common_space_photo as upload_common_space_photo_service
+from services.helpers.membership_resolver import get_association_membership
 from supabase import Client
 
 router = APIRouter(prefix="/common-spaces", tags=["common_spaces"])
 
 
 def verify_association_admin_or_president(association_id: UUID, user_id: str, supabase: Client) -> dict:
-    membership_res = (
-        supabase.table("memberships").select("association_id, role").eq("profile_id", str(user_id)).execute()
-    )
-
-    target_association_id = str(association_id)
-    membership = next(
-        (item for item in (membership_res.data or []) if str(item.get("association_id")) == target_association_id),
-        None,
-    )
+    membership = get_association_membership(supabase, association_id, user_id)
 
     if not membership:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta comunidad")
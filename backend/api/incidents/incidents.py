@@ -5,6 +5,7 @@ from core.config import settings
 from core.deps import get_current_user, get_supabase
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from schemas.incidents.incidents import Incident
+from services.helpers.membership_resolver import get_association_membership
 from services.helpers.role_service import get_user_role
 from supabase import Client
 
@@ -42,16 +43,10 @@ def get_latest_state(supabase: Client, incident_id: str) -> dict[str, dict]:
 
 
 def verify_own_incident(association_id: str, incident_id: str, user_id: str, supabase: Client):
-    membership_res = (
-        supabase.table("memberships")
-        .select("id")
-        .eq("association_id", association_id)
-        .eq("profile_id", user_id)
-        .execute()
-    )
-    if not membership_res.data:
+    membership = get_association_membership(supabase, association_id, user_id)
+    if not membership:
         raise HTTPException(status_code=404, detail="Membership not found in this community")
-    membership_id = membership_res.data[0].get("id")
+    membership_id = membership.get("id")
 
     incident_res = (
         supabase.table("incidents").select("id").eq("id", incident_id).eq("membership_id", membership_id).execute()
@@ -69,14 +64,8 @@ def get_incidents(
     supabase: Client = Depends(get_supabase),
 ):
     user_id = current_user["id"]
-    verify_association_membership(association_id, user_id, supabase)
-    is_admin = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("association_id", str(association_id))
-        .eq("profile_id", str(user_id))
-        .execute()
-    ).data[0].get("role") == "1"
+    membership = verify_association_membership(association_id, user_id, supabase)
+    is_admin = membership.get("role") == "1"
     if status == "DISCARDED" and not is_admin:
         raise HTTPException(status_code=403, detail="Admin access required for this action")
 
@@ -106,16 +95,7 @@ def get_incidents(
         incidents = [incident for incident in incidents if incident.get("status") == status]
 
     if mine:
-        membership_res = (
-            supabase.table("memberships")
-            .select("id")
-            .eq("association_id", association_id)
-            .eq("profile_id", user_id)
-            .execute()
-        )
-        if not membership_res.data:
-            raise HTTPException(status_code=404, detail="Membership not found in this community")
-        membership_id = membership_res.data[0].get("id")
+        membership_id = membership.get("id")
         incidents = [incident for incident in incidents if incident.get("membership_id") == membership_id]
 
     return incidents
@@ -158,20 +138,14 @@ def create_incident(
     check_type(incident_type)
     user_id = current_user["id"]
 
-    membership_res = (
-        supabase.table("memberships")
-        .select("id, role")
-        .eq("association_id", association_id)
-        .eq("profile_id", user_id)
-        .execute()
-    )
+    membership = get_association_membership(supabase, association_id, user_id)
 
-    if not membership_res.data:
+    if not membership:
         raise HTTPException(status_code=403, detail="User has no access to this association")
-    elif membership_res.data[0].get("role") == "1":
+    elif membership.get("role") == "1":
         raise HTTPException(status_code=403, detail="Admins cannot create incidents")
 
-    membership_id = membership_res.data[0].get("id")
+    membership_id = membership.get("id")
 
     image_url = None
     if file:
@@ -18,9 +18,35 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
     RESEND_API_KEY: str = os.getenv("RESEND_API_KEY", "")
+    EMAIL_SENDER: str = os.getenv("EMAIL_SENDER", "VecinUs <noreply@jesuspons.dev>")
+    # Cola de correos salientes: peticiones por segundo al proveedor e intentos antes de darlos por fallidos
+    EMAIL_RATE_LIMIT_PER_SECOND: float = float(os.getenv("EMAIL_RATE_LIMIT_PER_SECOND", "2"))
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
     APP_BASE_URL: str = os.getenv("APP_BASE_URL", "http://localhost:8081")
     SUPABASE_SCHEMA: str = os.getenv("SUPABASE_SCHEMA", "dev_s2")
     CLOUDINARY_URL: str = os.getenv("CLOUDINARY_URL", "")
+    # Backplane del chat en tiempo real: "memory" (un solo proceso) o "realtime" (Supabase Realtime)
+    CHAT_BACKPLANE: str = os.getenv("CHAT_BACKPLANE", "memory")
+    # Cola de salida por WebSocket y política cuando se llena: drop_oldest, coalesce o disconnect
+    CHAT_SEND_QUEUE_SIZE: int = int(os.getenv("CHAT_SEND_QUEUE_SIZE", "100"))
+    CHAT_BACKPRESSURE_POLICY: str = os.getenv("CHAT_BACKPRESSURE_POLICY", "drop_oldest")
+    # Pool de conexiones HTTP/2 compartido por los clientes Supabase
+    SUPABASE_POOL_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "100"))
+    SUPABASE_POOL_MAX_KEEPALIVE: int = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "20"))
+    SUPABASE_POOL_KEEPALIVE_EXPIRY: float = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30"))
+    SUPABASE_HTTP_TIMEOUT: float = float(os.getenv("SUPABASE_HTTP_TIMEOUT", "120"))
+    # Verificación local de los JWT: secreto HS256 del proyecto (legacy) o JWKS para claves asimétricas
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    SUPABASE_JWT_AUDIENCE: str = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+    SUPABASE_JWKS_CACHE_TTL: float = float(os.getenv("SUPABASE_JWKS_CACHE_TTL", "600"))
+    JWT_VERIFIED_CACHE_SIZE: int = int(os.getenv("JWT_VERIFIED_CACHE_SIZE", "10000"))
+    # Indexado de documentos del chatbot en segundo plano: trabajos simultáneos y carpeta de subidas pendientes
+    DOCUMENT_INGESTION_WORKERS: int = int(os.getenv("DOCUMENT_INGESTION_WORKERS", "2"))
+    DOCUMENT_UPLOAD_DIR: str = os.getenv("DOCUMENT_UPLOAD_DIR", "")
+    # Caché de embeddings: base SQLite local (vacío = carpeta temporal), entradas en disco y en memoria
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+    EMBEDDING_CACHE_MEMORY_SIZE: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "5000"))
 
 
 settings = Settings()
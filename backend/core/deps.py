@@ -1,12 +1,15 @@
 import base64
 import json
-from datetime import datetime, timezone
 
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from supabase import Client, ClientOptions, create_client
+from postgrest import AsyncPostgrestClient
+from supabase import Client
 
 from .config import settings
+from .jwt_verifier import JWKS_MIN_REFRESH_INTERVAL_SECONDS, JWKSUnavailable, TokenVerifierMisconfigured, token_verifier
+from .supabase_pool import supabase_pool
 
 # Authentication scheme
 security = HTTPBearer()
@@ -69,76 +72,99 @@ def get_supabase(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> Client:
     """Cliente Supabase autenticado con el JWT del usuario (respeta RLS)."""
-    token = credentials.credentials
-    options = ClientOptions(schema=settings.SUPABASE_SCHEMA)
-    client: Client = create_client(
-        settings.SUPABASE_URL,
-        _normalize_supabase_key(settings.SUPABASE_KEY),
-        options=options,
-    )
+    return create_user_client(credentials.credentials)
+
+
+def create_user_client(token: str) -> Client:
+    """Cliente Supabase que actúa con el JWT dado (respeta RLS), sobre el pool compartido."""
+    return supabase_pool.user(_normalize_supabase_key(settings.SUPABASE_KEY), token)
+
+
+async def get_async_db(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> AsyncPostgrestClient:
+    """
+    Cliente PostgREST asíncrono con el JWT del usuario, para rutas async (respeta RLS).
+    Es async para resolverse en el event loop, dueño del pool de conexiones asíncrono.
+    """
+    return create_async_user_db(credentials.credentials)
+
 
-    client.postgrest.auth(token)
-    return client
+def create_async_user_db(token: str) -> AsyncPostgrestClient:
+    """Crea el cliente PostgREST asíncrono que actúa con el JWT dado (p. ej. en WebSockets)."""
+    return supabase_pool.async_user(_normalize_supabase_key(settings.SUPABASE_KEY), token)
+
+
+async def get_async_db_admin() -> AsyncPostgrestClient:
+    """Cliente PostgREST asíncrono con service role."""
+    return supabase_pool.async_admin(get_supabase_admin_key())
 
 
 def get_supabase_anon() -> Client:
     """Cliente anon para endpoints publicos (ej: aceptar invitacion)."""
-    options = ClientOptions(schema=settings.SUPABASE_SCHEMA)
-    return create_client(
-        settings.SUPABASE_URL,
-        _normalize_supabase_key(settings.SUPABASE_KEY),
-        options=options,
-    )
+    return supabase_pool.anon(_normalize_supabase_key(settings.SUPABASE_KEY))
 
 
 def get_supabase_admin() -> Client:
-    """Cliente con service role para operaciones que bypasean RLS."""
-    options = ClientOptions(schema=settings.SUPABASE_SCHEMA)
-    return create_client(settings.SUPABASE_URL, get_supabase_admin_key(), options=options)
+    """Cliente con service role para operaciones que bypasean RLS (compartido por toda la aplicación)."""
+    return supabase_pool.admin(get_supabase_admin_key())
 
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> dict:
-    """Valida el JWT localmente y extrae datos del usuario."""
-    token = credentials.credentials
+    """Verifica el JWT localmente y extrae datos del usuario."""
+    return authenticate_token(credentials.credentials)
+
+
+def authenticate_token(token: str) -> dict:
+    """
+    Verifica la firma y la expiración de un JWT de Supabase y devuelve los datos
+    del usuario, sin llamar a Supabase Auth.
+    Compartido por get_current_user y los WebSockets, que no pasan por HTTPBearer.
+    """
     try:
-        payload = _extract_jwt_payload(token)
-        if not payload:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-
-        user_id = payload.get("sub")
-        user_role = payload.get("role")
-        user_email = payload.get("email")
-        exp = payload.get("exp")
-
-        if not user_id or user_role != "authenticated":
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-
-        if exp is not None:
-            expiration = datetime.fromtimestamp(int(exp), tz=timezone.utc)
-            if expiration <= datetime.now(timezone.utc):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Token expired",
-                )
-
-        return {
-            "id": str(user_id),
-            "role": str(user_role),
-            "email": user_email,
-        }
-
-    except HTTPException:
-        raise
+        payload = token_verifier.verify(token)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired",
+        )
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+    except TokenVerifierMisconfigured as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"JWT verification is misconfigured: {str(e)}",
+        )
+    except JWKSUnavailable:
+        # No es un token inválido: un 401 haría que el cliente cerrase la sesión
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service unavailable, try again later",
+            headers={"Retry-After": str(JWKS_MIN_REFRESH_INTERVAL_SECONDS)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Authentication failed: {str(e)}",
         )
+
+    user_id = payload.get("sub")
+    user_role = payload.get("role")
+
+    if not user_id or user_role != "authenticated":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+
+    return {
+        "id": str(user_id),
+        "role": str(user_role),
+        "email": payload.get("email"),
+        "exp": payload.get("exp"),
+    }
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Callable
+
+import jwt
+from cachetools import LRUCache
+
+from .config import settings
+from .supabase_pool import supabase_pool
+
+logger = logging.getLogger(__name__)
+
+# Algoritmos de los JWT de Supabase: secreto compartido (legacy) o claves asimétricas publicadas en el JWKS
+HMAC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+ASYMMETRIC_ALGORITHMS = {"RS256", "RS384", "RS512", "ES256", "ES384", "EdDSA"}
+# Tiempo mínimo entre descargas forzadas del JWKS por un kid desconocido
+JWKS_MIN_REFRESH_INTERVAL_SECONDS = 30
+
+
+class TokenVerifierMisconfigured(Exception):
+    """No hay clave con la que verificar el token (falta el secreto o el JWKS)."""
+
+
+class JWKSUnavailable(Exception):
+    """No se ha podido descargar el JWKS (red caída o 5xx): el token puede ser válido."""
+
+
+def _fetch_jwks(url: str) -> dict:
+    response = supabase_pool.http_client.get(url, headers={"apikey": settings.SUPABASE_KEY.strip().strip("\"'")})
+    response.raise_for_status()
+    return response.json()
+
+
+class TokenVerifier:
+    """
+    Verificación local de la firma de los JWT de Supabase.
+
+    - HS256: con el secreto del proyecto (SUPABASE_JWT_SECRET).
+    - RS256/ES256: con las claves públicas del JWKS del proyecto, cacheadas y
+      renovadas en segundo plano cuando caducan; un kid desconocido (rotación
+      de claves) fuerza una descarga, como mucho cada 30 segundos. Si la
+      descarga falla se siguen usando las últimas claves buenas, y un token que
+      no se puede comprobar sin ellas da JWKSUnavailable, no un token inválido.
+
+    Los tokens ya verificados se guardan en un LRU indexado por el SHA-256 del
+    token, así que las peticiones repetidas con el mismo token solo comprueban
+    la expiración.
+    """
+
+    def __init__(
+        self,
+        jwt_secret: str | None = None,
+        jwks_url: str | None = None,
+        audience: str | None = None,
+        cache_size: int | None = None,
+        jwks_ttl: float | None = None,
+        fetch_jwks: Callable[[str], dict] = _fetch_jwks,
+    ):
+        self.jwt_secret = jwt_secret if jwt_secret is not None else settings.SUPABASE_JWT_SECRET
+        self.jwks_url = jwks_url if jwks_url is not None else self._default_jwks_url()
+        self.audience = audience if audience is not None else settings.SUPABASE_JWT_AUDIENCE
+        self.jwks_ttl = jwks_ttl or settings.SUPABASE_JWKS_CACHE_TTL
+        self._fetch_jwks = fetch_jwks
+
+        self._verified: LRUCache = LRUCache(maxsize=cache_size or settings.JWT_VERIFIED_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self._jwks_lock = threading.Lock()
+        self._jwks_keys: dict | None = None
+        self._jwks_fetched_at = 0.0
+        self._jwks_failed_at: float | None = None
+        self._jwks_refreshing = False
+
+    @staticmethod
+    def _default_jwks_url() -> str:
+        if not settings.SUPABASE_URL:
+            return ""
+        return settings.SUPABASE_URL.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+
+    def verify(self, token: str) -> dict:
+        """Devuelve los claims del token o lanza jwt.InvalidTokenError."""
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        with self._lock:
+            payload = self._verified.get(digest)
+
+        if payload is not None:
+            if payload["exp"] <= time.time():
+                with self._lock:
+                    self._verified.pop(digest, None)
+                raise jwt.ExpiredSignatureError("Signature has expired")
+            return payload
+
+        payload = self._decode(token)
+        with self._lock:
+            self._verified[digest] = payload
+        return payload
+
+    def _decode(self, token: str) -> dict:
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+
+        if algorithm in HMAC_ALGORITHMS:
+            if not self.jwt_secret:
+                raise TokenVerifierMisconfigured("SUPABASE_JWT_SECRET is not set")
+            key = self.jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            key = self._signing_key(header.get("kid"))
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported algorithm: {algorithm}")
+
+        return jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=self.audience or None,
+            options={"require": ["exp", "sub"], "verify_aud": bool(self.audience)},
+        )
+
+    def _signing_key(self, kid: str | None):
+        if not self.jwks_url:
+            raise TokenVerifierMisconfigured("SUPABASE_URL is not set, cannot load the JWKS")
+
+        if self._jwks_keys is None:
+            self._refresh_jwks_for_request()
+        elif time.monotonic() - self._jwks_fetched_at > self.jwks_ttl:
+            # Se siguen usando las claves actuales mientras se descargan las nuevas
+            self._refresh_jwks_in_background()
+
+        key = self._jwks_keys.get(kid)
+        if key is None and time.monotonic() - self._jwks_fetched_at > JWKS_MIN_REFRESH_INTERVAL_SECONDS:
+            self._refresh_jwks_for_request()
+            key = self._jwks_keys.get(kid)
+
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key: {kid}")
+        return key
+
+    def refresh_jwks(self):
+        """Descarga el JWKS y sustituye las claves cacheadas."""
+        with self._jwks_lock:
+            jwks = self._fetch_jwks(self.jwks_url)
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    signing_key = jwt.PyJWK(jwk)
+                except jwt.PyJWKError:
+                    logger.warning("Skipping unusable JWK %s", jwk.get("kid"))
+                    continue
+                keys[signing_key.key_id] = signing_key.key
+            self._jwks_keys = keys
+            self._jwks_fetched_at = time.monotonic()
+
+    def _refresh_jwks_for_request(self):
+        """
+        refresh_jwks desde una petición. Tras un fallo no se vuelve a intentar
+        hasta pasados JWKS_MIN_REFRESH_INTERVAL_SECONDS, para no descargar el
+        JWKS en cada petición mientras Supabase Auth no responde.
+        """
+        failed_at = self._jwks_failed_at
+        if failed_at is not None and time.monotonic() - failed_at < JWKS_MIN_REFRESH_INTERVAL_SECONDS:
+            raise JWKSUnavailable("JWKS download failed recently, retrying later")
+        try:
+            self.refresh_jwks()
+        except Exception as e:
+            self._jwks_failed_at = time.monotonic()
+            logger.error("Failed to refresh JWKS: %s", str(e))
+            raise JWKSUnavailable(str(e)) from e
+        self._jwks_failed_at = None
+
+    def _refresh_jwks_in_background(self):
+        with self._lock:
+            if self._jwks_refreshing:
+                return
+            self._jwks_refreshing = True
+
+        def run():
+            try:
+                self.refresh_jwks()
+            except Exception as e:
+                logger.error("Failed to refresh JWKS: %s", str(e))
+                # Reintentar dentro de JWKS_MIN_REFRESH_INTERVAL_SECONDS, no en cada petición
+                self._jwks_fetched_at = time.monotonic() - self.jwks_ttl + JWKS_MIN_REFRESH_INTERVAL_SECONDS
+            finally:
+                with self._lock:
+                    self._jwks_refreshing = False
+
+        threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+    def prepare(self):
+        """
+        Al arrancar: descarga el JWKS, para no pagarlo en la primera petición, y
+        comprueba que hay con qué verificar los tokens. Un proyecto que firma solo
+        con el secreto HS256 publica un JWKS sin claves; entonces (o si no hay
+        JWKS) falta SUPABASE_JWT_SECRET y se lanza TokenVerifierMisconfigured.
+        """
+        if self.jwks_url:
+            try:
+                self.refresh_jwks()
+            except Exception as e:
+                # Se volverá a intentar al verificar el primer token asimétrico
+                logger.error("Failed to load JWKS at startup: %s", str(e))
+
+        if self.jwt_secret:
+            return
+        if not self.jwks_url:
+            raise TokenVerifierMisconfigured("SUPABASE_JWT_SECRET and SUPABASE_URL are not set")
+        if self._jwks_keys == {}:
+            raise TokenVerifierMisconfigured(
+                "SUPABASE_JWT_SECRET is not set and the project JWKS has no signing keys (HS256 tokens)"
+            )
+        if self._jwks_keys is None:
+            logger.warning("SUPABASE_JWT_SECRET is not set; HS256 tokens will be rejected")
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,196 @@
+import asyncio
+import copy
+import threading
+from collections import Counter
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from supabase import Client, ClientOptions, create_client
+
+from .config import settings
+
+
+class SupabaseClientPool:
+    """
+    Conexiones HTTP/2 keep-alive compartidas por todos los clientes Supabase
+    del proceso.
+
+    Antes cada dependencia llamaba a create_client y abría su propio cliente
+    HTTP (handshake TLS incluido) en cada petición. Ahora:
+    - admin(): un único cliente service-role para toda la aplicación.
+    - anon(): un cliente nuevo por petición, porque sign_in/sign_out guardan la
+      sesión en el propio cliente, pero sobre el mismo pool de conexiones.
+    - user(token): copia ligera de un cliente plantilla con el JWT del usuario
+      superpuesto en las cabeceras. Solo se usa para PostgREST/Storage; no
+      debe llamarse a su .auth, que se comparte con la plantilla.
+    - async_user(token) / async_admin(): clientes PostgREST asíncronos sobre un
+      httpx.AsyncClient compartido, para las rutas async que no deben
+      bloquear el event loop.
+    """
+
+    def __init__(
+        self,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+        timeout: float | None = None,
+        transport: httpx.BaseTransport | None = None,
+        async_transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.max_connections = max_connections or settings.SUPABASE_POOL_MAX_CONNECTIONS
+        self.max_keepalive_connections = max_keepalive_connections or settings.SUPABASE_POOL_MAX_KEEPALIVE
+        self.keepalive_expiry = keepalive_expiry or settings.SUPABASE_POOL_KEEPALIVE_EXPIRY
+        self.timeout = timeout or settings.SUPABASE_HTTP_TIMEOUT
+        self._transport = transport
+        self._async_transport = async_transport
+
+        # Reentrante: admin()/user() crean el cliente HTTP compartido con el lock tomado
+        self._lock = threading.RLock()
+        self._http_client: httpx.Client | None = None
+        self._admin: Client | None = None
+        self._user_template: Client | None = None
+        self._async_http_client: httpx.AsyncClient | None = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+        self._stats: Counter = Counter()
+
+    @property
+    def http_client(self) -> httpx.Client:
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        http2=True,
+                        follow_redirects=True,
+                        transport=self._transport,
+                        timeout=self.timeout,
+                        limits=self._limits(),
+                        event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                    )
+        return self._http_client
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def async_http_client(self) -> httpx.AsyncClient:
+        # Las conexiones de un AsyncClient pertenecen al event loop que las abrió
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_http_client is None or self._async_loop is not loop:
+                self._async_http_client = httpx.AsyncClient(
+                    http2=True,
+                    follow_redirects=True,
+                    transport=self._async_transport,
+                    timeout=self.timeout,
+                    limits=self._limits(),
+                    event_hooks={"request": [self._on_async_request], "response": [self._on_async_response]},
+                )
+                self._async_loop = loop
+        return self._async_http_client
+
+    def _options(self, headers: dict | None = None) -> ClientOptions:
+        return ClientOptions(schema=settings.SUPABASE_SCHEMA, headers=headers or {}, httpx_client=self.http_client)
+
+    def admin(self, key: str) -> Client:
+        if self._admin is None:
+            with self._lock:
+                if self._admin is None:
+                    self._admin = create_client(settings.SUPABASE_URL, key, options=self._options())
+                    self._stats["clients_created"] += 1
+        return self._admin
+
+    def anon(self, key: str) -> Client:
+        self._stats["clients_created"] += 1
+        return create_client(settings.SUPABASE_URL, key, options=self._options())
+
+    def user(self, key: str, token: str) -> Client:
+        if self._user_template is None:
+            with self._lock:
+                if self._user_template is None:
+                    self._user_template = create_client(settings.SUPABASE_URL, key, options=self._options())
+                    self._stats["clients_created"] += 1
+
+        # Copia superficial: solo cambian las cabeceras y los subclientes
+        # perezosos, que se vuelven a crear con ellas sobre el mismo pool
+        client = copy.copy(self._user_template)
+        client.options = copy.copy(self._user_template.options)
+        client.options.headers = {**self._user_template.options.headers, "Authorization": f"Bearer {token}"}
+        client._postgrest = None
+        client._storage = None
+        client._functions = None
+        self._stats["user_overlays"] += 1
+        return client
+
+    def _async_db(self, key: str, authorization: str) -> AsyncPostgrestClient:
+        headers = {**DEFAULT_POSTGREST_CLIENT_HEADERS, "apikey": key, "Authorization": authorization}
+        return AsyncPostgrestClient(
+            settings.SUPABASE_URL.rstrip("/") + "/rest/v1",
+            schema=settings.SUPABASE_SCHEMA,
+            headers=headers,
+            http_client=self.async_http_client,
+        )
+
+    def async_user(self, key: str, token: str) -> AsyncPostgrestClient:
+        """Cliente PostgREST asíncrono con el JWT del usuario (respeta RLS)."""
+        self._stats["user_overlays"] += 1
+        return self._async_db(key, f"Bearer {token}")
+
+    def async_admin(self, key: str) -> AsyncPostgrestClient:
+        """Cliente PostgREST asíncrono con service role."""
+        return self._async_db(key, f"Bearer {key}")
+
+    def _on_request(self, request: httpx.Request):
+        self._stats["requests"] += 1
+
+    def _on_response(self, response: httpx.Response):
+        self._stats[f"responses_{response.status_code // 100}xx"] += 1
+        if response.http_version == "HTTP/2":
+            self._stats["responses_http2"] += 1
+
+    async def _on_async_request(self, request: httpx.Request):
+        self._on_request(request)
+
+    async def _on_async_response(self, response: httpx.Response):
+        self._on_response(response)
+
+    def metrics(self) -> dict:
+        """Tamaño configurado del pool, conexiones abiertas y contadores de uso."""
+        connections = []
+        for http_client in (self._http_client, self._async_http_client):
+            if http_client is not None:
+                pool = getattr(http_client._transport, "_pool", None)
+                connections.extend(getattr(pool, "connections", []) or [])
+
+        return {
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for conn in connections if conn.is_idle()),
+            **dict(self._stats),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._admin = None
+            self._user_template = None
+
+    async def aclose(self):
+        """Cierra el pool asíncrono (en el apagado de la aplicación) y el síncrono."""
+        client = self._async_http_client
+        self._async_http_client = None
+        self._async_loop = None
+        if client is not None:
+            await client.aclose()
+        self.close()
+
+
+supabase_pool = SupabaseClientPool()
@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from api.associations.associations import router as associations_router
 from api.auth.login import router as auth_router
 from api.chat.alerts import router as alerts_router
@@ -10,13 +13,37 @@ from api.common_space.reservations import router as reservations_router
 from api.feedback.feedback import router as feedback_router
 from api.incidents.incidents import router as incidents_router
 from api.transcription.minutes import router as minutes_router
+from core.jwt_verifier import token_verifier
+from core.supabase_pool import supabase_pool
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from services.chat.alert_queue import alert_dispatcher
+from services.chat.connection_manager import manager
+from services.chatBot.ingestion_jobs import document_ingestion
+from services.email_queue import email_queue
+from services.helpers.membership_resolver import MembershipScopeMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Fallo al arrancar si no hay con qué verificar los JWT (p. ej. HS256 sin secreto)
+    await asyncio.to_thread(token_verifier.prepare)
+    await manager.start()
+    email_queue.start()
+    document_ingestion.start()
+    yield
+    await alert_dispatcher.stop()
+    await email_queue.stop()
+    await document_ingestion.stop()
+    await manager.stop()
+    await supabase_pool.aclose()
+
 
 app = FastAPI(
     title="Vecinus API",
     description="Backend API for community management (Chat & Alerts)",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Set up CORS
@@ -27,6 +54,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Memo de membresías por petición compartido por todos los helpers de autorización
+app.add_middleware(MembershipScopeMiddleware)
 
 app.include_router(chatBotRouter)
 app.include_router(documentsRouter)
@@ -45,3 +74,18 @@ app.include_router(feedback_router)
 @app.get("/health")
 def health():
     return {"status": "ok", "message": "Backend funcionando perfectamente"}
+
+
+@app.get("/health/supabase-pool")
+def supabase_pool_health():
+    return supabase_pool.metrics()
+
+
+@app.get("/health/email-queue")
+def email_queue_health():
+    return email_queue.metrics()
+
+
+@app.get("/health/document-ingestion")
+def document_ingestion_health():
+    return document_ingestion.metrics()
@@ -0,0 +1,88 @@
+-- Alertas de chat idempotentes: como mucho una por destinatario y mensaje.
+-- El AlertDispatcher reintenta create_alerts_batch ante errores transitorios;
+-- si la llamada anterior sí llegó a escribir, el reintento no debe duplicarlas.
+
+-- Duplicados previos: se conserva la alerta más antigua de cada par
+delete from alerts a
+using alerts b
+where a.reference_id is not null
+  and a.user_id = b.user_id
+  and a.reference_id = b.reference_id
+  and (a.created_at, a.id) > (b.created_at, b.id);
+
+create unique index if not exists alerts_user_reference_key
+    on alerts (user_id, reference_id);
+
+-- Mensajes que agrupa cada alerta, en orden; reference_id es el último. Al
+-- borrar uno, la alerta se mantiene con los demás (discard_alert_message).
+alter table alerts
+    add column if not exists message_ids uuid[];
+
+-- Devuelve las alertas del lote: las que inserta y, si un intento anterior ya
+-- las escribió, las que ya existían, para empujarlas con su id.
+drop function if exists create_alerts_batch(jsonb);
+create or replace function create_alerts_batch(payload jsonb)
+returns setof alerts
+language sql
+as $$
+    with inserted as (
+        insert into alerts (user_id, title, content, reference_id, message_ids)
+        select user_id, title, content, reference_id, message_ids
+        from jsonb_populate_recordset(null::alerts, payload)
+        on conflict (user_id, reference_id) do nothing
+        returning *
+    )
+    select * from inserted
+    union all
+    -- La consulta ve la tabla de antes del insert: solo las que ya existían
+    select a.*
+    from alerts a
+    join jsonb_populate_recordset(null::alerts, payload) p
+      on p.user_id = a.user_id and p.reference_id = a.reference_id;
+$$;
+
+-- discard_alert_message(p_message_id): quita un mensaje borrado de las
+-- alertas. La de un solo mensaje se borra; la que agrupaba varios se queda con
+-- el resto y, si era el último, pasa a apuntar al anterior (título y vista
+-- previa incluidos). Solo actúa si el mensaje ya no existe: se llama después
+-- de borrarlo y, como security definer, no debe servir para tocar alertas de
+-- mensajes vivos.
+create or replace function discard_alert_message(p_message_id uuid)
+returns void
+language sql
+security definer
+set search_path from current
+as $$
+    delete from alerts
+    where reference_id = p_message_id
+      and coalesce(cardinality(message_ids), 0) <= 1
+      and not exists (select 1 from messages where id = p_message_id);
+
+    update alerts a
+    set message_ids = r.remaining,
+        reference_id = r.last_id,
+        title = case
+            when cardinality(r.remaining) = 1 then 'Nuevo mensaje de ' || coalesce(p.username, 'Un vecino')
+            else cardinality(r.remaining) || ' mensajes nuevos'
+        end,
+        content = case
+            when r.last_id = a.reference_id or m.id is null then a.content
+            else left(m.content, 100) || case when length(m.content) > 100 then '...' else '' end
+        end
+    from (
+        select x.id, x.remaining, x.remaining[cardinality(x.remaining)] as last_id
+        from (
+            select id, array_remove(message_ids, p_message_id) as remaining
+            from alerts
+            where p_message_id = any(message_ids)
+        ) x
+        where cardinality(x.remaining) > 0
+    ) r
+    left join messages m on m.id = r.last_id
+    left join profiles p on p.id = m.sender_id
+    where a.id = r.id
+      and not exists (select 1 from messages where id = p_message_id);
+$$;
+
+revoke execute on function discard_alert_message(uuid) from public, anon;
+grant execute on function discard_alert_message(uuid) to authenticated, service_role;
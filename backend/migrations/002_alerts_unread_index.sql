@@ -0,0 +1,7 @@
+-- Índice parcial para contar las alertas sin leer de un usuario
+-- (GET /alerts/unread-count hace un COUNT con HEAD en cada petición).
+-- Solo contiene las filas sin leer, así que sigue siendo pequeño aunque el
+-- historial de alertas crezca.
+create index if not exists alerts_unread_by_user
+    on alerts (user_id)
+    where not is_read;
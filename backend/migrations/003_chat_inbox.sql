@@ -0,0 +1,66 @@
+-- Bandeja de entrada del chat (GET /chat/inbox): una sola llamada devuelve los
+-- canales del usuario con su último mensaje, los mensajes sin leer y el número
+-- de participantes.
+
+-- Hasta dónde ha leído cada participante (PUT /chat/channels/{id}/read)
+alter table channel_participants
+    add column if not exists last_read_at timestamptz;
+
+-- Los participantes que ya existían empiezan con el historial leído
+update channel_participants
+set last_read_at = now()
+where last_read_at is null;
+
+create index if not exists channel_participants_user
+    on channel_participants (user_id);
+
+-- Último mensaje y mensajes sin leer de un canal sin recorrer todo su historial
+create index if not exists messages_channel_created_at
+    on messages (channel_id, created_at desc, id desc);
+
+create or replace function get_user_inbox(p_user_id uuid)
+returns setof jsonb
+language sql
+stable
+as $$
+    select to_jsonb(c) || jsonb_build_object(
+        'last_message', last_message.data,
+        'unread_count', unread.total,
+        'participant_count', participants.total,
+        'last_read_at', me.last_read_at
+    )
+    from channel_participants me
+    join chat_channels c on c.id = me.channel_id
+    left join lateral (
+        select
+            m.created_at,
+            to_jsonb(m) || jsonb_build_object(
+                'sender',
+                case when p.id is null then null else jsonb_build_object(
+                    'id', p.id,
+                    'username', p.username,
+                    'avatar_url', p.avatar_url,
+                    'created_at', p.created_at
+                ) end
+            ) as data
+        from messages m
+        left join profiles p on p.id = m.sender_id
+        where m.channel_id = c.id
+        order by m.created_at desc, m.id desc
+        limit 1
+    ) last_message on true
+    cross join lateral (
+        select count(*) as total
+        from messages m
+        where m.channel_id = c.id
+          and m.sender_id <> p_user_id
+          and m.created_at > coalesce(me.last_read_at, '-infinity'::timestamptz)
+    ) unread
+    cross join lateral (
+        select count(*) as total
+        from channel_participants cp
+        where cp.channel_id = c.id
+    ) participants
+    where me.user_id = p_user_id
+    order by last_message.created_at desc nulls last, c.id;
+$$;
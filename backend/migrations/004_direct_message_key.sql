@@ -0,0 +1,45 @@
+-- Clave canónica de los mensajes directos (POST /chat/channels/{id}/dm):
+-- "<association_id>:<usuario menor>:<usuario mayor>", la misma que calcula
+-- direct_message_key() en api/chat/chat_helpers.py. El índice único permite
+-- encontrar el DM con una sola consulta y resuelve la carrera cuando los dos
+-- vecinos lo abren a la vez (upsert con on_conflict=dm_key).
+
+alter table chat_channels
+    add column if not exists dm_key text;
+
+-- Backfill de los DM existentes a partir de sus dos participantes. Si por una
+-- carrera anterior hay varios canales para el mismo par, la clave se queda en
+-- el que tiene el primer mensaje más antiguo; los demás siguen accesibles por
+-- id pero ya no se devuelven al abrir el DM.
+with pairs as (
+    select
+        c.id,
+        c.association_id::text
+            || ':' || min(cp.user_id::text collate "C")
+            || ':' || max(cp.user_id::text collate "C") as key
+    from chat_channels c
+    join channel_participants cp on cp.channel_id = c.id
+    where c.is_direct_message
+      and c.dm_key is null
+    group by c.id, c.association_id
+    having count(*) = 2
+),
+ranked as (
+    select
+        pairs.id,
+        pairs.key,
+        row_number() over (
+            partition by pairs.key
+            order by (select min(m.created_at) from messages m where m.channel_id = pairs.id) nulls last, pairs.id
+        ) as position
+    from pairs
+)
+update chat_channels c
+set dm_key = ranked.key
+from ranked
+where c.id = ranked.id
+  and ranked.position = 1
+  and not exists (select 1 from chat_channels other where other.dm_key = ranked.key);
+
+create unique index if not exists chat_channels_dm_key
+    on chat_channels (dm_key);
@@ -0,0 +1,56 @@
+-- Búsqueda de texto completo en el chat (GET /chat/search).
+--
+-- Índice GIN sobre la expresión to_tsvector('spanish', content) en lugar de
+-- una columna generada: así las consultas con select=* sobre messages (y los
+-- eventos del WebSocket) no arrastran el tsvector. La función usa la misma
+-- expresión para que el planificador utilice el índice.
+create index if not exists messages_content_search
+    on messages using gin (to_tsvector('spanish', content));
+
+create or replace function search_messages(
+    p_user_id uuid,
+    p_query text,
+    p_channel_id uuid default null,
+    p_limit integer default 20,
+    p_offset integer default 0
+)
+returns setof jsonb
+language sql
+stable
+as $$
+    with search as (
+        select websearch_to_tsquery('spanish', p_query) as tsquery
+    ),
+    hits as (
+        select m.id, ts_rank(to_tsvector('spanish', m.content), search.tsquery) as rank
+        from messages m
+        cross join search
+        where to_tsvector('spanish', m.content) @@ search.tsquery
+          and m.channel_id in (
+              select cp.channel_id from channel_participants cp where cp.user_id = p_user_id
+          )
+          and (p_channel_id is null or m.channel_id = p_channel_id)
+        order by rank desc, m.created_at desc, m.id desc
+        limit p_limit
+        offset p_offset
+    )
+    -- El fragmento resaltado solo se calcula para la página devuelta
+    select to_jsonb(m) || jsonb_build_object(
+        'sender',
+        case when p.id is null then null else jsonb_build_object(
+            'id', p.id,
+            'username', p.username,
+            'avatar_url', p.avatar_url,
+            'created_at', p.created_at
+        ) end,
+        'rank', hits.rank,
+        'snippet', ts_headline(
+            'spanish', m.content, search.tsquery, 'StartSel=<b>, StopSel=</b>, MaxWords=30, MinWords=10'
+        )
+    )
+    from hits
+    join messages m on m.id = hits.id
+    cross join search
+    left join profiles p on p.id = m.sender_id
+    order by hits.rank desc, m.created_at desc, m.id desc;
+$$;
@@ -0,0 +1,76 @@
+-- Registro de cambios del chat (altas, ediciones y borrados) que usan los
+-- clientes para sincronizarse tras reconectar (GET /chat/channels/{id}/sync).
+--
+-- Lo escriben triggers sobre messages, en la misma transacción que el propio
+-- mensaje: no puede quedar un mensaje guardado sin su entrada en el registro.
+-- El id de la entrada es el número de secuencia (marca de agua) del cambio;
+-- en altas y ediciones se copia también en messages.change_seq para que la
+-- API lo reciba en la misma respuesta del insert/update.
+
+create table if not exists message_changes (
+    id bigint generated always as identity primary key,
+    channel_id uuid not null,
+    message_id uuid not null,
+    change_type text not null check (change_type in ('created', 'edited', 'deleted')),
+    created_at timestamptz not null default now()
+);
+
+create index if not exists message_changes_channel_seq
+    on message_changes (channel_id, id);
+
+create index if not exists message_changes_message
+    on message_changes (message_id, id);
+
+alter table messages
+    add column if not exists change_seq bigint;
+
+-- security definer: el usuario que escribe el mensaje no necesita permisos
+-- sobre message_changes. search_path fijado al del esquema de la migración.
+create or replace function log_message_change()
+returns trigger
+language plpgsql
+security definer
+set search_path from current
+as $$
+begin
+    if tg_op = 'DELETE' then
+        insert into message_changes (channel_id, message_id, change_type)
+        values (old.channel_id, old.id, 'deleted');
+        return old;
+    end if;
+
+    insert into message_changes (channel_id, message_id, change_type)
+    values (new.channel_id, new.id, case when tg_op = 'INSERT' then 'created' else 'edited' end)
+    returning id into new.change_seq;
+    return new;
+end;
+$$;
+
+drop trigger if exists messages_log_change on messages;
+create trigger messages_log_change
+    before insert or update of content on messages
+    for each row execute function log_message_change();
+
+drop trigger if exists messages_log_delete on messages;
+create trigger messages_log_delete
+    after delete on messages
+    for each row execute function log_message_change();
+
+-- GET /chat/channels/{id}/sync lee el registro con el JWT del usuario: cada
+-- uno solo ve los cambios de los canales en los que participa. Nadie escribe
+-- en la tabla desde la API (solo los triggers, como security definer).
+alter table message_changes enable row level security;
+revoke all on message_changes from anon, authenticated;
+grant select on message_changes to authenticated;
+
+drop policy if exists message_changes_select_participant on message_changes;
+create policy message_changes_select_participant on message_changes
+    for select to authenticated
+    using (
+        exists (
+            select 1
+            from channel_participants cp
+            where cp.channel_id = message_changes.channel_id
+              and cp.user_id = (select auth.uid())
+        )
+    );
@@ -0,0 +1,43 @@
+-- Consultas por correo de las invitaciones (POST /invite, /invite/batch).
+
+-- registered_emails(p_emails): cuáles de los correos ya tienen cuenta. Busca en
+-- auth.users por su índice de email; AccountLookup le pasa los correos ya
+-- normalizados (trim + minúsculas), igual que los guarda Supabase Auth.
+-- security definer porque el esquema auth no es accesible desde la API; solo
+-- lo puede llamar el service_role.
+create or replace function registered_emails(p_emails text[])
+returns table (email text)
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select u.email::text
+    from auth.users u
+    where u.email = any(p_emails);
+$$;
+
+revoke execute on function registered_emails(text[]) from public, anon, authenticated;
+grant execute on function registered_emails(text[]) to service_role;
+
+-- pending_invitation_emails(p_association_id, p_emails): cuáles de los correos
+-- tienen ya una invitación pendiente (status = 1) en la comunidad. Compara en
+-- minúsculas en los dos lados: las invitaciones guardan el correo tal y como
+-- se escribió.
+create index if not exists invitations_pending_email
+    on invitations (association_id, lower(target_email))
+    where status = 1;
+
+create or replace function pending_invitation_emails(p_association_id uuid, p_emails text[])
+returns table (email text)
+language sql
+stable
+as $$
+    select distinct lower(i.target_email)
+    from invitations i
+    where i.association_id = p_association_id
+      and i.status = 1
+      and lower(i.target_email) = any(
+          select lower(requested) from unnest(p_emails) as requested
+      );
+$$;
@@ -0,0 +1,100 @@
+-- Cola persistente de correos salientes (services/email_queue.py).
+
+create table if not exists email_outbox (
+    id uuid primary key default gen_random_uuid(),
+    to_email text not null,
+    subject text not null,
+    html text not null,
+    text text,
+    kind text not null default 'generic',
+    reference_id text,
+    status text not null default 'pending'
+        check (status in ('pending', 'sending', 'sent', 'failed')),
+    attempts integer not null default 0,
+    last_error text,
+    next_attempt_at timestamptz not null default now(),
+    claimed_at timestamptz,
+    sent_at timestamptz,
+    created_at timestamptz not null default now()
+);
+
+-- Índices parciales: la tabla conserva los enviados, pero el emisor solo mira
+-- las filas listas para enviar y las que llevan tiempo en "sending"
+create index if not exists email_outbox_ready
+    on email_outbox (next_attempt_at)
+    where status = 'pending';
+
+create index if not exists email_outbox_claimed
+    on email_outbox (claimed_at)
+    where status = 'sending';
+
+-- Estado del correo de una invitación (GET /invitations/{id}/email-status)
+create index if not exists email_outbox_reference
+    on email_outbox (kind, reference_id, created_at desc);
+
+-- Lote de envío al que pertenece la fila: es la clave de idempotencia de la
+-- llamada al proveedor, así que si un worker cae después de enviar el lote y
+-- antes de marcarlo, al reclamarlo se reenvía con la misma clave y el
+-- proveedor no lo duplica.
+alter table email_outbox
+    add column if not exists batch_key text;
+
+-- claim_email_outbox(p_limit, p_lease_seconds): reclama hasta p_limit correos y
+-- los marca como "sending". Toma los pendientes cuyo next_attempt_at ya pasó,
+-- que reciben un batch_key nuevo, y antes el lote más antiguo de los que siguen
+-- en "sending" desde hace más de p_lease_seconds (lo dejó un worker caído a
+-- mitad de envío), entero y con su batch_key. FOR UPDATE SKIP LOCKED para que
+-- varios workers reclamen lotes distintos a la vez.
+create or replace function claim_email_outbox(p_limit integer, p_lease_seconds integer default 300)
+returns setof email_outbox
+language sql
+as $$
+    with abandoned_batch as (
+        select e.batch_key
+        from email_outbox e
+        where e.status = 'sending'
+          and e.claimed_at < now() - make_interval(secs => p_lease_seconds)
+        order by e.claimed_at
+        limit 1
+    ),
+    abandoned as (
+        select e.id
+        from email_outbox e
+        where e.status = 'sending'
+          and e.claimed_at < now() - make_interval(secs => p_lease_seconds)
+          and e.batch_key is not distinct from (select batch_key from abandoned_batch)
+        limit p_limit
+        for update skip locked
+    ),
+    ready as (
+        select e.id
+        from email_outbox e
+        where e.status = 'pending'
+          and e.next_attempt_at <= now()
+        order by e.next_attempt_at
+        limit greatest(p_limit - (select count(*) from abandoned), 0)
+        for update skip locked
+    ),
+    new_batch as (
+        select gen_random_uuid()::text as batch_key
+    )
+    update email_outbox o
+    set status = 'sending',
+        claimed_at = now(),
+        batch_key = case
+            when o.id in (select id from ready) then (select batch_key from new_batch)
+            else o.batch_key
+        end
+    where o.id in (select id from abandoned union all select id from ready)
+    returning o.*;
+$$;
+
+-- Los correos guardan el html con el enlace de la invitación (su token): la
+-- tabla y la RPC solo son accesibles con service_role, que ignora RLS. RLS
+-- activado y sin políticas para que anon y authenticated no vean ninguna fila
+-- aunque el esquema les conceda permisos por defecto.
+alter table email_outbox enable row level security;
+revoke all on email_outbox from anon, authenticated;
+
+revoke execute on function claim_email_outbox(integer, integer) from public, anon, authenticated;
+grant execute on function claim_email_outbox(integer, integer) to service_role;
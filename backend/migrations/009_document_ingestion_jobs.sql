@@ -0,0 +1,35 @@
+-- Trabajos de indexado de documentos del chatbot
+-- (services/chatBot/ingestion_jobs.py). Cada worker guarda aquí el estado y el
+-- progreso de los trabajos que ejecuta para que cualquier otro pueda responder
+-- a GET /comunities/{id}/documents/jobs/{job_id}.
+
+create table if not exists document_ingestion_jobs (
+    id uuid primary key,
+    comunidad_id uuid not null,
+    document_title text not null,
+    source_filename text not null,
+    uploaded_by uuid,
+    status text not null default 'queued'
+        check (status in ('queued', 'extracting', 'chunking', 'diffing', 'embedding', 'upserting',
+                          'completed', 'failed')),
+    progress_done integer not null default 0,
+    progress_total integer not null default 0,
+    chunks integer not null default 0,
+    error text,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists document_ingestion_jobs_community
+    on document_ingestion_jobs (comunidad_id, created_at desc);
+
+-- Al arrancar, el backend da por fallidos los trabajos sin terminar que llevan
+-- tiempo sin avanzar (su worker se cayó a mitad)
+create index if not exists document_ingestion_jobs_unfinished
+    on document_ingestion_jobs (updated_at)
+    where status not in ('completed', 'failed');
+
+-- Solo el backend (service_role, que ignora RLS) lee y escribe los trabajos;
+-- la API responde al estado tras comprobar la comunidad del usuario
+alter table document_ingestion_jobs enable row level security;
+revoke all on document_ingestion_jobs from anon, authenticated;
@@ -0,0 +1,34 @@
+-- Catálogo de documentos del chatbot (services/chatBot/documents_ChatBotService.py):
+-- una fila por comunidad y título con el número de chunks que tiene en Pinecone
+-- y el hash del texto indexado. Los documentos subidos antes de que existiera
+-- se registran solos la primera vez que se listan los de su comunidad
+-- (o con POST /comunities/{id}/documents/catalog/rebuild).
+
+create table if not exists chatbot_documents (
+    comunidad_id uuid not null,
+    document_title text not null,
+    source_filename text,
+    uploaded_by uuid,
+    uploaded_by_email text,
+    chunks integer not null default 0,
+    content_hash text,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now(),
+    -- on_conflict="comunidad_id,document_title" en los upserts
+    primary key (comunidad_id, document_title)
+);
+
+-- Hash de cada chunk indexado, en orden: de él salen los ids de los chunks en
+-- Pinecone, así que al actualizar el documento se sabe cuáles ya están sin
+-- leerlos. Null en los documentos indexados con ids por posición.
+alter table chatbot_documents
+    add column if not exists chunk_hashes text[];
+
+-- Listado de documentos, del más reciente al más antiguo
+create index if not exists chatbot_documents_recent
+    on chatbot_documents (comunidad_id, updated_at desc);
+
+-- Solo el backend (service_role, que ignora RLS) lee y escribe el catálogo;
+-- el listado de la API ya comprueba que el usuario administra la comunidad
+alter table chatbot_documents enable row level security;
+revoke all on chatbot_documents from anon, authenticated;
@@ -0,0 +1,20 @@
+-- Autorización del canal privado de Supabase Realtime que reparte el chat
+-- entre workers (services/chat/backplane.py, CHAT_BACKPLANE=realtime).
+--
+-- Por el topic "chat-fanout" pasan los mensajes de todos los canales y las
+-- alertas de todos los usuarios, así que solo el backend (service_role) puede
+-- unirse (select) y difundir (insert). Los clientes con la clave anon o con su
+-- JWT no pasan ninguna política para este topic y Realtime les rechaza la
+-- suscripción. realtime.messages es común a todos los esquemas del proyecto.
+
+alter table realtime.messages enable row level security;
+
+drop policy if exists chat_fanout_service_role_select on realtime.messages;
+create policy chat_fanout_service_role_select on realtime.messages
+    for select to service_role
+    using ((select realtime.topic()) = 'chat-fanout');
+
+drop policy if exists chat_fanout_service_role_insert on realtime.messages;
+create policy chat_fanout_service_role_insert on realtime.messages
+    for insert to service_role
+    with check ((select realtime.topic()) = 'chat-fanout');
@@ -2,8 +2,12 @@ from schemas.associations.associations import (
     AcceptInvitationRequest,
     AssociationInfo,
     CommunityUser,
+    InvitationBatchItem,
+    InvitationBatchResponse,
+    InvitationEmailStatus,
     InvitationResponse,
     InviteAdminRequest,
+    InviteBatchRequest,
     InviteTenantRequest,
     MembershipWithCommunity,
     UserMeResponse,
@@ -13,7 +17,11 @@ __all__ = [
     "AcceptInvitationRequest",
     "AssociationInfo",
     "CommunityUser",
+    "InvitationBatchItem",
+    "InvitationBatchResponse",
+    "InvitationEmailStatus",
     "InvitationResponse",
+    "InviteBatchRequest",
     "InviteAdminRequest",
     "InviteTenantRequest",
     "MembershipWithCommunity",
@@ -1,8 +1,11 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
+
+# Invitaciones como máximo por petición de /invite/batch
+MAX_INVITATION_BATCH_SIZE = 200
 
 
 class AssociationInfo(BaseModel):
@@ -33,6 +36,17 @@ class InviteTenantRequest(BaseModel):
     target_email: EmailStr
 
 
+class InvitationBatchItem(BaseModel):
+    target_email: EmailStr
+    role_to_grant: int  # 2-5, no puede ser 1 (ADMIN)
+    property_id: Optional[UUID] = None
+
+
+class InviteBatchRequest(BaseModel):
+    association_id: UUID
+    invitations: List[InvitationBatchItem] = Field(..., min_length=1, max_length=MAX_INVITATION_BATCH_SIZE)
+
+
 class AcceptInvitationRequest(BaseModel):
     invitation_token: UUID
     password: str  # Para crear la cuenta en Supabase Auth
@@ -46,6 +60,20 @@ class InvitationResponse(BaseModel):
     status: int
 
 
+class InvitationBatchResponse(BaseModel):
+    created: List[InvitationResponse]
+    skipped: List[str]  # correos repetidos o que ya tenían una invitación pendiente
+
+
+class InvitationEmailStatus(BaseModel):
+    invitation_id: UUID
+    status: str  # not_queued, pending, sending, sent o failed
+    attempts: int = 0
+    last_error: Optional[str] = None
+    next_attempt_at: Optional[datetime] = None
+    sent_at: Optional[datetime] = None
+
+
 class CommunityUser(BaseModel):
     id: UUID
     membership_id: UUID
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -21,3 +22,24 @@ class Alert(AlertBase):
 
     class Config:
         from_attributes = True
+
+
+class AlertPage(BaseModel):
+    alerts: List[Alert]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+class AlertsMarkRead(BaseModel):
+    # Sin alert_ids ni up_to se marcan como leídas todas las alertas del usuario
+    alert_ids: Optional[List[UUID]] = None
+    up_to: Optional[datetime] = None
+
+
+class AlertsMarkReadResponse(BaseModel):
+    updated: int
+    unread_count: int
+
+
+class UnreadCount(BaseModel):
+    unread_count: int
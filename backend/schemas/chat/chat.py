@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -66,3 +66,38 @@ class Message(MessageBase):
 # Extended Message Model para incluir el nombre del remitente (útil para la UI)
 class MessageWithSender(Message):
     sender: Optional[ProfileResponse] = None
+
+
+# Página de historial paginada por cursor (keyset sobre created_at, id)
+class MessagePage(BaseModel):
+    messages: List[MessageWithSender]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+
+# Cambios de un canal desde una marca de agua (sincronización tras reconectar)
+class MessageSyncPage(BaseModel):
+    messages: List[MessageWithSender]
+    deleted_ids: List[UUID]
+    high_water_mark: int
+    has_more: bool = False
+
+
+# Resultado de búsqueda: mensaje con su relevancia y un fragmento resaltado
+class MessageSearchHit(MessageWithSender):
+    rank: float = 0.0
+    snippet: Optional[str] = None
+
+
+class MessageSearchPage(BaseModel):
+    results: List[MessageSearchHit]
+    next_offset: Optional[int] = None
+    has_more: bool = False
+
+
+# Resumen de un canal para la bandeja de entrada: último mensaje y contadores
+class ChannelSummary(ChatChannel):
+    last_message: Optional[MessageWithSender] = None
+    unread_count: int = 0
+    participant_count: int = 0
+    last_read_at: Optional[datetime] = None
@@ -0,0 +1,26 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class DocumentJobStatus(BaseModel):
+    job_id: str
+    comunidad_id: str
+    document_title: str
+    source_filename: Optional[str] = None
+    uploaded_by: Optional[str] = None
+    status: str
+    progress_done: int = 0
+    progress_total: int = 0
+    chunks: int = 0
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+class DocumentJobAccepted(BaseModel):
+    message: str
+    job_id: str
+    status: str
+    status_url: str
+    uploaded_by: str
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from core.deps import get_supabase_admin
+
+from .connection_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# Se vacía la cola cuando hay tantas alertas pendientes o, como muy tarde, tras este intervalo
+ALERT_BATCH_SIZE = 500
+ALERT_FLUSH_INTERVAL_SECONDS = 1.0
+
+# Reintentos del RPC create_alerts_batch ante errores transitorios (es idempotente,
+# ver migrations/001_alerts_idempotent_batch.sql)
+ALERT_MAX_RETRIES = 3
+ALERT_RETRY_BASE_DELAY = 0.5  # segundos
+
+
+@dataclass
+class PendingAlert:
+    user_id: str
+    channel_id: str
+    # Mensajes agrupados en la alerta, en orden: (reference_id, remitente, vista previa)
+    messages: list[tuple[str, str, str]] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.messages)
+
+    @property
+    def reference_id(self) -> str:
+        return self.messages[-1][0]
+
+    @property
+    def content(self) -> str:
+        return self.messages[-1][2]
+
+    @property
+    def title(self) -> str:
+        if self.count == 1:
+            return f"Nuevo mensaje de {self.messages[0][1]}"
+        return f"{self.count} mensajes nuevos"
+
+    def as_row(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "title": self.title,
+            "content": self.content,
+            "reference_id": self.reference_id,
+            "message_ids": [message[0] for message in self.messages],
+        }
+
+
+class AlertDispatcher:
+    """
+    Cola en segundo plano para las alertas de mensajes nuevos del chat.
+
+    send_message solo encola y responde; una tarea de fondo agrupa las alertas
+    pendientes en una sola llamada a create_alerts_batch, reintenta si falla y
+    después las empuja por el socket multiplexado de cada destinatario. El RPC
+    ignora las alertas que ya existen para el mismo (user_id, reference_id), así
+    que reintentar una llamada que sí llegó a escribir no duplica nada.
+
+    Si llegan varios mensajes de un mismo canal antes de vaciar la cola, cada
+    destinatario recibe una única alerta que apunta al último mensaje y guarda
+    los ids de todos en message_ids, para que borrar uno no se lleve la alerta
+    de los demás (RPC discard_alert_message).
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], object] = get_supabase_admin,
+        notifier: Callable[[dict, list[str]], Awaitable[dict]] | None = None,
+        batch_size: int = ALERT_BATCH_SIZE,
+        flush_interval: float = ALERT_FLUSH_INTERVAL_SECONDS,
+    ):
+        self._client_factory = client_factory
+        self._notifier = notifier
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: OrderedDict[tuple[str, str], PendingAlert] = OrderedDict()
+        self._worker: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, recipients: list[str], channel_id: str, sender_name: str, preview: str, reference_id: str):
+        """Encola (o fusiona) una alerta de mensaje nuevo para cada destinatario."""
+        channel_id = str(channel_id)
+        for user_id in recipients:
+            key = (str(user_id), channel_id)
+            alert = self._pending.get(key)
+            if alert is None:
+                alert = self._pending[key] = PendingAlert(user_id=str(user_id), channel_id=channel_id)
+            alert.messages.append((str(reference_id), sender_name, preview))
+
+        self._ensure_worker()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def update_reference(self, reference_id: str, preview: str) -> int:
+        """Actualiza el texto de las alertas aún no enviadas de un mensaje editado."""
+        updated = 0
+        for alert in self._pending.values():
+            for position, (message_id, sender_name, _) in enumerate(alert.messages):
+                if message_id == str(reference_id):
+                    alert.messages[position] = (message_id, sender_name, preview)
+                    updated += 1
+        return updated
+
+    def discard_reference(self, reference_id: str) -> int:
+        """
+        Quita un mensaje borrado de las alertas aún no enviadas. Una alerta que
+        agrupaba más mensajes se mantiene y pasa a apuntar al anterior.
+        """
+        discarded = 0
+        for key, alert in list(self._pending.items()):
+            remaining = [message for message in alert.messages if message[0] != str(reference_id)]
+            if len(remaining) == alert.count:
+                continue
+            discarded += 1
+            if remaining:
+                alert.messages = remaining
+            else:
+                del self._pending[key]
+        return discarded
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # asyncio.wait (y no wait_for) para no tragarse una cancelación en Python 3.10
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.flush_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Unexpected error flushing chat alerts: %s", str(e))
+
+    async def flush(self) -> int:
+        """Envía todas las alertas pendientes. Devuelve cuántas se han creado."""
+        if not self._pending:
+            return 0
+
+        alerts = list(self._pending.values())
+        self._pending.clear()
+
+        created = 0
+        for start in range(0, len(alerts), self.batch_size):
+            batch = alerts[start : start + self.batch_size]
+            stored = await self._create_with_retry([alert.as_row() for alert in batch])
+            if stored is not None:
+                created += len(batch)
+                await self._notify(batch, stored)
+        return created
+
+    async def _create_with_retry(self, rows: list[dict]) -> list[dict] | None:
+        """Devuelve las alertas guardadas (con su id) o None si se han descartado."""
+        for attempt in range(ALERT_MAX_RETRIES):
+            try:
+                client = self._client_factory()
+                res = await asyncio.to_thread(lambda: client.rpc("create_alerts_batch", {"payload": rows}).execute())
+                return res.data or []
+            except Exception as e:
+                if attempt < ALERT_MAX_RETRIES - 1:
+                    delay = ALERT_RETRY_BASE_DELAY * (2**attempt)
+                    logger.warning("create_alerts_batch failed (%s), retrying in %ss", str(e), delay)
+                    await asyncio.sleep(delay)
+                    continue
+                logger.error("Dropping %d chat alerts after %d attempts: %s", len(rows), ALERT_MAX_RETRIES, str(e))
+        return None
+
+    async def _notify(self, alerts: list[PendingAlert], stored: list[dict]):
+        if self._notifier is None:
+            return
+
+        # Cada destinatario recibe el id de su alerta para poder marcarla como leída
+        alert_ids = {(str(row["user_id"]), str(row["reference_id"])): row["id"] for row in stored}
+        await asyncio.gather(
+            *(self._push(alert, alert_ids.get((alert.user_id, alert.reference_id))) for alert in alerts)
+        )
+
+    async def _push(self, alert: PendingAlert, alert_id: str | None):
+        try:
+            await self._notifier(
+                {
+                    "event": "alert_created",
+                    "channel_id": alert.channel_id,
+                    "alert": {
+                        "id": alert_id,
+                        "title": alert.title,
+                        "content": alert.content,
+                        "reference_id": alert.reference_id,
+                    },
+                },
+                [alert.user_id],
+            )
+        except Exception as e:
+            logger.warning("Failed to push chat alert for user %s: %s", alert.user_id, str(e))
+
+    async def stop(self):
+        """Detiene la tarea de fondo y envía lo que quede pendiente."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        await self.flush()
+
+
+alert_dispatcher = AlertDispatcher(notifier=manager.notify_users)
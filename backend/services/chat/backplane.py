@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable
+
+from core.config import settings
+from core.deps import get_supabase_admin_key
+
+logger = logging.getLogger(__name__)
+
+# Callback que entrega un mensaje a los sockets locales de un canal y
+# devuelve el recuento {"delivered": n, "dropped": m}
+DeliverCallback = Callable[[dict, str], Awaitable[dict]]
+
+REALTIME_TOPIC = "chat-fanout"
+REALTIME_EVENT = "message"
+# Canal privado: Realtime solo deja unirse a quien pase las políticas de
+# realtime.messages (migrations/011_realtime_backplane.sql), que solo admiten
+# service_role. Por el topic viajan los mensajes de todos los canales y las
+# alertas de todos los usuarios.
+REALTIME_CHANNEL_CONFIG = {"config": {"broadcast": {"self": False, "ack": False}, "private": True}}
+
+
+def merge_delivery_results(results) -> dict:
+    """Suma los recuentos de entrega de varios canales."""
+    merged = {"delivered": 0, "dropped": 0}
+    for result in results:
+        if result:
+            merged["delivered"] += result.get("delivered", 0)
+            merged["dropped"] += result.get("dropped", 0)
+    return merged
+
+
+class ChannelBackplane:
+    """
+    Bus pub/sub que reparte los mensajes de chat entre todos los procesos
+    (workers de uvicorn o réplicas) que mantienen WebSockets abiertos.
+
+    Cada proceso arranca el backplane con un callback `deliver` que envía el
+    mensaje a sus sockets locales; `publish` hace que el mensaje llegue al
+    callback de todos los procesos suscritos, incluido el propio.
+    """
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        raise NotImplementedError
+
+    async def publish(self, message: dict, channel_id: str) -> dict | None:
+        """Publica el mensaje y devuelve el resultado de la entrega local, si la hubo."""
+        raise NotImplementedError
+
+    async def publish_many(self, message: dict, channel_ids: list[str]) -> dict:
+        """Publica el mismo mensaje en varios canales (p. ej. alertas a varios usuarios)."""
+        return merge_delivery_results([await self.publish(message, channel_id) for channel_id in channel_ids])
+
+    async def stop(self) -> None:
+        return None
+
+
+class InProcessBackplane(ChannelBackplane):
+    """Backplane por defecto: entrega directa dentro del propio proceso."""
+
+    def __init__(self):
+        self._deliver: DeliverCallback | None = None
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+
+    async def publish(self, message: dict, channel_id: str) -> dict | None:
+        if self._deliver is not None:
+            return await self._deliver(message, channel_id)
+        return None
+
+
+def _default_realtime_client():
+    from realtime import AsyncRealtimeClient
+
+    realtime_url = settings.SUPABASE_URL.replace("http", "ws", 1).rstrip("/") + "/realtime/v1"
+    # Con la clave anon no se puede entrar en el canal privado
+    return AsyncRealtimeClient(realtime_url, token=get_supabase_admin_key())
+
+
+class RealtimeBackplane(ChannelBackplane):
+    """
+    Backplane sobre los canales broadcast de Supabase Realtime.
+
+    El proceso que publica entrega primero a sus propios sockets y después
+    difunde el mensaje por el broker; los demás procesos lo reciben y lo
+    entregan a los suyos. Cada proceso se identifica con `node_id` para
+    descartar sus propios mensajes si el broker los devolviera.
+    """
+
+    def __init__(self, client_factory: Callable[[], object] | None = None, topic: str = REALTIME_TOPIC):
+        self._client_factory = client_factory or _default_realtime_client
+        self._topic = topic
+        self._client = None
+        self._channel = None
+        self._deliver: DeliverCallback | None = None
+        self._pending: set[asyncio.Task] = set()
+        self.node_id = uuid.uuid4().hex
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+        if self._channel is not None:
+            return
+
+        self._client = self._client_factory()
+        await self._client.connect()
+        channel = self._client.channel(self._topic, REALTIME_CHANNEL_CONFIG)
+        channel.on_broadcast(REALTIME_EVENT, self._on_broadcast)
+        await channel.subscribe()
+        self._channel = channel
+
+    async def publish(self, message: dict, channel_id: str) -> dict | None:
+        return await self.publish_many(message, [channel_id])
+
+    async def publish_many(self, message: dict, channel_ids: list[str]) -> dict:
+        # Un único mensaje al broker aunque vaya a varios canales
+        result = await self._deliver_all(message, channel_ids)
+
+        if self._channel is None:
+            logger.warning("Realtime backplane not started; message for %s delivered locally only", channel_ids)
+            return result
+
+        try:
+            await self._channel.send_broadcast(
+                REALTIME_EVENT,
+                {"channel_ids": channel_ids, "message": message, "origin": self.node_id},
+            )
+        except Exception as e:
+            logger.error("Failed to publish chat message for %s: %s", channel_ids, str(e))
+
+        return result
+
+    async def _deliver_all(self, message: dict, channel_ids: list[str]) -> dict:
+        if self._deliver is None:
+            return merge_delivery_results([])
+        return merge_delivery_results([await self._deliver(message, channel_id) for channel_id in channel_ids])
+
+    def _on_broadcast(self, payload: dict) -> None:
+        data = payload.get("payload") or {}
+        if data.get("origin") == self.node_id or self._deliver is None:
+            return
+
+        # El callback del cliente Realtime es síncrono: programamos la entrega
+        # en el event loop y guardamos la referencia para que no se recolecte.
+        task = asyncio.get_running_loop().create_task(
+            self._deliver_all(data.get("message") or {}, list(data.get("channel_ids") or []))
+        )
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+        self._channel = None
+
+
+def build_backplane(kind: str | None = None) -> ChannelBackplane:
+    """Construye el backplane configurado en CHAT_BACKPLANE ("memory" o "realtime")."""
+    kind = (kind or settings.CHAT_BACKPLANE).strip().lower()
+    if kind == "realtime":
+        return RealtimeBackplane()
+    if kind not in ("", "memory"):
+        logger.warning("Unknown CHAT_BACKPLANE '%s', falling back to in-process delivery", kind)
+    return InProcessBackplane()
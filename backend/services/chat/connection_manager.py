@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Set
+
+from core.config import settings
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from .backplane import ChannelBackplane, build_backplane, merge_delivery_results
+from .send_queue import BackpressurePolicy, ClientConnection, coalesce_key
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de las claves de entrega por usuario (socket multiplexado y alertas)
+USER_CHANNEL_PREFIX = "user:"
+# Evento para los sockets de un usuario que ha dejado de participar en algunos canales
+ACCESS_REVOKED_EVENT = "channel_access_revoked"
+# Si el backplane no arranca, no se reintenta en cada mensaje sino como mucho cada tanto
+BACKPLANE_RETRY_SECONDS = 30.0
+
+
+def user_channel(user_id: str) -> str:
+    """Clave interna en la que escucha el socket multiplexado de un usuario."""
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+
+class ConnectionManager:
+    """
+    Gestiona los WebSockets abiertos en este proceso y reparte los mensajes
+    a través del backplane para que lleguen también a los demás workers.
+
+    Cada socket tiene su propia cola de salida acotada (ver ClientConnection),
+    con la política de backpressure configurada en CHAT_BACKPRESSURE_POLICY.
+    """
+
+    def __init__(
+        self,
+        backplane: ChannelBackplane | None = None,
+        max_queue: int | None = None,
+        policy: BackpressurePolicy | str | None = None,
+    ):
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        self.backplane = backplane or build_backplane()
+        self.max_queue = max_queue or settings.CHAT_SEND_QUEUE_SIZE
+        self.policy = BackpressurePolicy(policy or settings.CHAT_BACKPRESSURE_POLICY)
+        self._started = False
+        self._failed_at: float | None = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """
+        Arranca el backplane (en el lifespan). Si no se puede, lo registra y
+        este proceso sigue entregando solo a sus propios sockets hasta el
+        siguiente intento, como mucho cada BACKPLANE_RETRY_SECONDS.
+        """
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < BACKPLANE_RETRY_SECONDS:
+                return
+            try:
+                await self.backplane.start(self.deliver_local)
+                self._started = True
+                self._failed_at = None
+            except Exception as e:
+                self._failed_at = time.monotonic()
+                logger.error("Chat backplane failed to start, delivering to local sockets only: %s", str(e))
+
+    async def stop(self):
+        async with self._start_lock:
+            if self._started:
+                await self.backplane.stop()
+                self._started = False
+
+    async def connect(self, websocket: WebSocket, channel_id: str) -> ClientConnection:
+        """Acepta un socket suscrito a un único canal (/chat/ws/{channel_id})."""
+        connection = await self._open(websocket)
+        self.subscribe(connection, channel_id)
+        return connection
+
+    async def connect_user(self, websocket: WebSocket, user_id: str) -> ClientConnection:
+        """
+        Acepta el socket multiplexado de un usuario. Recibe sus alertas desde el
+        principio y los canales a los que se vaya suscribiendo.
+        """
+        connection = await self._open(websocket)
+        self.subscribe(connection, user_channel(user_id))
+        return connection
+
+    async def _open(self, websocket: WebSocket) -> ClientConnection:
+        await self.start()
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.max_queue, self.policy, on_close=self._forget)
+        connection.start()
+        return connection
+
+    def subscribe(self, connection: ClientConnection, channel_id: str):
+        if not connection.closed:
+            self.active_connections.setdefault(str(channel_id), set()).add(connection)
+
+    def unsubscribe(self, connection: ClientConnection, channel_id: str):
+        self._remove(connection, str(channel_id))
+
+    def disconnect(self, websocket: WebSocket, channel_id: str):
+        for connection in list(self.active_connections.get(channel_id, ())):
+            if connection.websocket is websocket:
+                connection.stop()
+
+    def _remove(self, connection: ClientConnection, channel_id: str):
+        connections = self.active_connections.get(channel_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[channel_id]
+
+    def _forget(self, connection: ClientConnection):
+        for channel_id in list(self.active_connections):
+            self._remove(connection, channel_id)
+
+    async def broadcast(self, message: dict, channel_id: str) -> dict:
+        """
+        Publica el mensaje en el backplane para todos los procesos.
+        Devuelve los sockets locales en cuya cola se dejó y los payloads descartados.
+        """
+        # El mensaje ya está guardado: un fallo del backplane no puede convertirse en un 500
+        await self.start()
+        payload = jsonable_encoder(message)
+        try:
+            result = await self.backplane.publish(payload, str(channel_id))
+        except Exception as e:
+            logger.error("Chat backplane publish failed for channel %s: %s", channel_id, str(e))
+            result = await self.deliver_local(payload, str(channel_id))
+        return result or {"delivered": 0, "dropped": 0}
+
+    async def notify_users(self, message: dict, user_ids: list[str]) -> dict:
+        """Empuja un evento (p. ej. una alerta nueva) a los sockets multiplexados de varios usuarios."""
+        if not user_ids:
+            return {"delivered": 0, "dropped": 0}
+        await self.start()
+        payload = jsonable_encoder(message)
+        channels = [user_channel(user_id) for user_id in user_ids]
+        try:
+            return await self.backplane.publish_many(payload, channels)
+        except Exception as e:
+            logger.error("Chat backplane publish failed for %d users: %s", len(user_ids), str(e))
+            return merge_delivery_results([await self.deliver_local(payload, channel_id) for channel_id in channels])
+
+    async def revoke_channels(self, user_id: str, channel_ids: list[str]) -> dict:
+        """
+        Da de baja de esos canales los sockets multiplexados del usuario, estén en
+        el proceso que estén: el aviso viaja por el backplane hasta su canal de
+        usuario y deliver_local lo aplica antes de reenviárselo al cliente.
+        """
+        return await self.notify_users(
+            {"event": ACCESS_REVOKED_EVENT, "channel_ids": [str(channel_id) for channel_id in channel_ids]},
+            [user_id],
+        )
+
+    async def deliver_local(self, message: dict, channel_id: str) -> dict:
+        """
+        Encola el mensaje en los sockets del canal abiertos en este proceso.
+
+        Serializa una sola vez y solo encola: el envío real lo hace la tarea
+        escritora de cada conexión, así que un cliente lento no retrasa al resto.
+        """
+        connections = list(self.active_connections.get(channel_id, ()))
+        if not connections:
+            return {"delivered": 0, "dropped": 0}
+
+        if message.get("event") == ACCESS_REVOKED_EVENT and channel_id.startswith(USER_CHANNEL_PREFIX):
+            for connection in connections:
+                for revoked in message.get("channel_ids") or []:
+                    self.unsubscribe(connection, revoked)
+
+        payload = json.dumps(message)
+        key = coalesce_key(message)
+
+        delivered = 0
+        dropped = 0
+        for connection in connections:
+            discarded = connection.enqueue(payload, key)
+            dropped += discarded
+            if not connection.closed:
+                delivered += 1
+
+        if dropped:
+            logger.info("Backpressure on channel %s: %d payload(s) dropped", channel_id, dropped)
+
+        return {"delivered": delivered, "dropped": dropped}
+
+
+manager = ConnectionManager()
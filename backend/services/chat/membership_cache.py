@@ -0,0 +1,103 @@
+import threading
+
+from cachetools import TTLCache
+from postgrest import AsyncPostgrestClient
+from supabase import Client
+
+# Canales cuya lista de participantes mantenemos en memoria (LRU) y durante cuánto tiempo.
+# El TTL acota lo que puede tardar en verse un cambio hecho desde otro worker.
+MEMBERSHIP_CACHE_SIZE = 2048
+MEMBERSHIP_CACHE_TTL_SECONDS = 60
+
+
+class ChannelMembershipCache:
+    """
+    Caché en proceso de los participantes de cada canal (TTL + desalojo LRU).
+
+    Solo se usa para respuestas positivas: si el usuario no aparece en la lista
+    cacheada se vuelve a preguntar a la base de datos, de modo que una entrada
+    obsoleta nunca deja fuera a un participante recién añadido.
+    """
+
+    def __init__(self, maxsize: int = MEMBERSHIP_CACHE_SIZE, ttl: float = MEMBERSHIP_CACHE_TTL_SECONDS):
+        self._members: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Los endpoints síncronos corren en el threadpool de Starlette
+        self._lock = threading.Lock()
+
+    def get_members(self, channel_id: str, supabase: Client) -> frozenset[str]:
+        """Devuelve los user_id de los participantes del canal, desde memoria si es posible."""
+        channel_id = str(channel_id)
+        with self._lock:
+            members = self._members.get(channel_id)
+        if members is not None:
+            return members
+
+        res = supabase.table("channel_participants").select("user_id").eq("channel_id", channel_id).execute()
+        return self._store(channel_id, res.data)
+
+    async def get_members_async(self, channel_id: str, db: AsyncPostgrestClient) -> frozenset[str]:
+        """Igual que get_members, con el cliente PostgREST asíncrono."""
+        channel_id = str(channel_id)
+        with self._lock:
+            members = self._members.get(channel_id)
+        if members is not None:
+            return members
+
+        res = await db.table("channel_participants").select("user_id").eq("channel_id", channel_id).execute()
+        return self._store(channel_id, res.data)
+
+    def _store(self, channel_id: str, rows) -> frozenset[str]:
+        members = frozenset(str(p["user_id"]) for p in rows or [])
+        with self._lock:
+            self._members[channel_id] = members
+        return members
+
+    def is_member(self, channel_id: str, user_id: str, supabase: Client) -> bool:
+        channel_id = str(channel_id)
+        user_id = str(user_id)
+        if user_id in self.get_members(channel_id, supabase):
+            return True
+
+        # Fallo de caché negativo: confirmamos contra la base de datos
+        res = (
+            supabase.table("channel_participants")
+            .select("user_id")
+            .eq("channel_id", channel_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        if not res.data:
+            return False
+
+        self.invalidate(channel_id)
+        return True
+
+    async def is_member_async(self, channel_id: str, user_id: str, db: AsyncPostgrestClient) -> bool:
+        channel_id = str(channel_id)
+        user_id = str(user_id)
+        if user_id in await self.get_members_async(channel_id, db):
+            return True
+
+        res = await (
+            db.table("channel_participants")
+            .select("user_id")
+            .eq("channel_id", channel_id)
+            .eq("user_id", user_id)
+            .execute()
+        )
+        if not res.data:
+            return False
+
+        self.invalidate(channel_id)
+        return True
+
+    def invalidate(self, channel_id: str):
+        with self._lock:
+            self._members.pop(str(channel_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._members.clear()
+
+
+channel_members = ChannelMembershipCache()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+from supabase import Client
+
+from .connection_manager import manager
+from .membership_cache import channel_members
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de página al leer participantes (límite de filas por defecto de PostgREST)
+PARTICIPANT_PAGE_SIZE = 1000
+# Filas por upsert y canales por consulta al aplicar los cambios
+PARTICIPANT_SYNC_BATCH_SIZE = 500
+
+
+def _chunks(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _fetch_participants(channel_ids: list[str], supabase: Client) -> dict[str, set[str]]:
+    """Participantes actuales de varios canales, leídos por páginas en consultas agrupadas."""
+    current: dict[str, set[str]] = {channel_id: set() for channel_id in channel_ids}
+    for chunk in _chunks(channel_ids, PARTICIPANT_SYNC_BATCH_SIZE):
+        offset = 0
+        while True:
+            res = (
+                supabase.table("channel_participants")
+                .select("channel_id, user_id")
+                .in_("channel_id", chunk)
+                .order("channel_id")
+                .order("user_id")
+                .range(offset, offset + PARTICIPANT_PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = res.data or []
+            for row in rows:
+                current.setdefault(str(row["channel_id"]), set()).add(str(row["user_id"]))
+            if len(rows) < PARTICIPANT_PAGE_SIZE:
+                break
+            offset += PARTICIPANT_PAGE_SIZE
+    return current
+
+
+def sync_association_participants(association_id: str, supabase: Client) -> dict:
+    """
+    Alinea los participantes de todos los canales de grupo de una comunidad con
+    sus miembros actuales.
+
+    Calcula la diferencia de todos los canales a la vez y la aplica con upserts
+    en bloque (altas) y un DELETE por usuario dado de baja, en lugar de una
+    llamada por fila. Los DMs no se tocan.
+    """
+    result, _ = _sync_participants(association_id, supabase)
+    return result
+
+
+def _sync_participants(association_id: str, supabase: Client) -> tuple[dict, dict[str, list[str]]]:
+    """sync_association_participants que devuelve además los canales quitados a cada usuario."""
+    association_id = str(association_id)
+
+    channels_res = (
+        supabase.table("chat_channels")
+        .select("id")
+        .eq("association_id", association_id)
+        .eq("is_direct_message", False)
+        .execute()
+    )
+    channel_ids = [str(channel["id"]) for channel in channels_res.data or []]
+    if not channel_ids:
+        return {"channels": 0, "added": 0, "removed": 0}, {}
+
+    members_res = supabase.table("memberships").select("profile_id").eq("association_id", association_id).execute()
+    members = {str(member["profile_id"]) for member in members_res.data or []}
+
+    current = _fetch_participants(channel_ids, supabase)
+
+    to_add = []
+    to_remove: dict[str, list[str]] = defaultdict(list)
+    changed = set()
+    for channel_id in channel_ids:
+        participants = current.get(channel_id, set())
+        for user_id in sorted(members - participants):
+            to_add.append({"channel_id": channel_id, "user_id": user_id})
+            changed.add(channel_id)
+        for user_id in sorted(participants - members):
+            to_remove[user_id].append(channel_id)
+            changed.add(channel_id)
+
+    for batch in _chunks(to_add, PARTICIPANT_SYNC_BATCH_SIZE):
+        (
+            supabase.table("channel_participants")
+            .upsert(batch, on_conflict="channel_id,user_id", ignore_duplicates=True)
+            .execute()
+        )
+
+    # Normalmente se va un único vecino: un DELETE cubre todos sus canales
+    removed = 0
+    for user_id, user_channels in to_remove.items():
+        for chunk in _chunks(user_channels, PARTICIPANT_SYNC_BATCH_SIZE):
+            supabase.table("channel_participants").delete().eq("user_id", user_id).in_("channel_id", chunk).execute()
+            removed += len(chunk)
+
+    for channel_id in changed:
+        channel_members.invalidate(channel_id)
+
+    return {"channels": len(channel_ids), "added": len(to_add), "removed": removed}, dict(to_remove)
+
+
+async def run_participant_sync(association_id: str, supabase: Client):
+    """
+    Punto de entrada para BackgroundTasks: registra el fallo en lugar de propagarlo.
+
+    Después saca a los usuarios dados de baja de los canales a los que siguieran
+    suscritos por WebSocket, que solo comprueba el acceso al suscribirse.
+    """
+    try:
+        result, revoked = await asyncio.to_thread(_sync_participants, association_id, supabase)
+        logger.info("Synced chat participants for association %s: %s", association_id, result)
+    except Exception as e:
+        logger.error("Failed to sync chat participants for association %s: %s", association_id, str(e))
+        return
+
+    for user_id, channel_ids in revoked.items():
+        try:
+            await manager.revoke_channels(user_id, channel_ids)
+        except Exception as e:
+            logger.warning("Failed to revoke chat subscriptions of user %s: %s", user_id, str(e))
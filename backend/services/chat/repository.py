@@ -0,0 +1,99 @@
+from core.deps import get_async_db
+from fastapi import Depends, HTTPException
+from postgrest import AsyncPostgrestClient
+from services.helpers.membership_resolver import find_association_membership, get_user_memberships_async
+
+from .membership_cache import channel_members
+
+MESSAGE_WITH_SENDER = "*, sender:sender_id(id, username, avatar_url, created_at)"
+
+# Tipos de cambio que los triggers de messages apuntan en message_changes
+# (sincronización delta, ver migrations/006_message_changes.sql)
+MESSAGE_CREATED = "created"
+MESSAGE_EDITED = "edited"
+MESSAGE_DELETED = "deleted"
+
+
+class ChatRepository:
+    """
+    Acceso a datos del chat con el cliente PostgREST asíncrono.
+
+    Las rutas async (envío, edición y borrado de mensajes, historial,
+    WebSockets) lo usan en lugar del cliente síncrono de supabase-py para no
+    bloquear el event loop mientras esperan a la base de datos. Las
+    comprobaciones lanzan las mismas HTTPException que chat_helpers.
+    """
+
+    def __init__(self, db: AsyncPostgrestClient):
+        self.db = db
+
+    async def channel_members(self, channel_id: str) -> frozenset[str]:
+        return await channel_members.get_members_async(str(channel_id), self.db)
+
+    async def verify_channel_access(self, channel_id: str, user_id: str) -> dict:
+        if not await channel_members.is_member_async(str(channel_id), str(user_id), self.db):
+            raise HTTPException(status_code=403, detail="Access denied to this channel")
+        return {"channel_id": str(channel_id), "user_id": str(user_id)}
+
+    async def verify_message_ownership(self, message_id: str, channel_id: str, user_id: str) -> dict:
+        msg_res = await (
+            self.db.table("messages").select("*").eq("id", str(message_id)).eq("channel_id", str(channel_id)).execute()
+        )
+        if not msg_res.data:
+            raise HTTPException(status_code=404, detail="Message not found")
+
+        original_msg = msg_res.data[0]
+        if str(original_msg["sender_id"]) != str(user_id):
+            raise HTTPException(
+                status_code=403,
+                detail="Not authorized to perform this action on this message",
+            )
+        return original_msg
+
+    async def verify_association_membership(self, association_id: str, user_id: str) -> dict:
+        memberships = await get_user_memberships_async(self.db, user_id)
+        membership = find_association_membership(memberships, association_id)
+        if not membership:
+            raise HTTPException(status_code=403, detail="Access denied to this community")
+        return membership
+
+    async def list_messages(self, channel_id: str, keyset_filter: str | None, descending: bool, limit: int) -> list:
+        """Página de mensajes con remitente, ordenada por (created_at, id)."""
+        query = self.db.table("messages").select(MESSAGE_WITH_SENDER).eq("channel_id", str(channel_id))
+        if keyset_filter:
+            query = query.or_(keyset_filter)
+        res = await query.order("created_at", desc=descending).order("id", desc=descending).limit(limit).execute()
+        return res.data or []
+
+    async def insert_message(self, row: dict) -> dict | None:
+        res = await self.db.table("messages").insert(row).execute()
+        return res.data[0] if res.data else None
+
+    async def update_message(self, message_id: str, values: dict) -> dict | None:
+        res = await self.db.table("messages").update(values).eq("id", str(message_id)).execute()
+        return res.data[0] if res.data else None
+
+    async def delete_message(self, message_id: str) -> int | None:
+        """
+        Borra el mensaje y devuelve el número de secuencia del borrado. Lo apunta
+        en message_changes un trigger en la misma transacción
+        (migrations/006_message_changes.sql); aquí solo se lee.
+        """
+        await self.db.table("messages").delete().eq("id", str(message_id)).execute()
+        res = await (
+            self.db.table("message_changes")
+            .select("id")
+            .eq("message_id", str(message_id))
+            .eq("change_type", MESSAGE_DELETED)
+            .order("id", desc=True)
+            .limit(1)
+            .execute()
+        )
+        return res.data[0]["id"] if res.data else None
+
+    async def rpc(self, fn: str, params: dict):
+        return await self.db.rpc(fn, params).execute()
+
+
+async def get_chat_repository(db: AsyncPostgrestClient = Depends(get_async_db)) -> ChatRepository:
+    return ChatRepository(db)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from collections import deque
+from enum import Enum
+from typing import Callable
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo que esperamos a un socket antes de darlo por muerto
+SEND_TIMEOUT_SECONDS = 5.0
+
+# Código de cierre WebSocket "Try Again Later" para clientes que no dan abasto
+CLOSE_CODE_TRY_AGAIN_LATER = 1013
+
+# Código de cierre (rango privado 4000-4999) cuando caduca el JWT del socket: el
+# cliente debe reconectar con un token renovado
+CLOSE_CODE_TOKEN_EXPIRED = 4001
+
+
+class BackpressurePolicy(str, Enum):
+    """Qué hacer cuando la cola de salida de un socket está llena."""
+
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+def coalesce_key(message: dict) -> str | None:
+    """
+    Clave para fusionar eventos sobre el mismo mensaje: una edición o un borrado
+    deja obsoletas las ediciones anteriores del mismo mensaje que sigan en cola.
+    """
+    event = message.get("event")
+    if event == "message_edited":
+        edited = message.get("message") or {}
+        return str(edited.get("id")) if edited.get("id") else None
+    if event == "message_deleted":
+        return str(message.get("message_id")) if message.get("message_id") else None
+    return None
+
+
+class ClientConnection:
+    """
+    Un WebSocket con su cola de salida acotada y su propia tarea escritora.
+
+    Los broadcasts solo encolan (operación O(1) que nunca espera a la red) y la
+    tarea escritora drena la cola al ritmo que el cliente aguanta. Así la memoria
+    por conexión queda limitada a `max_queue` mensajes y la latencia de un canal
+    no depende de su miembro más lento.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        policy: BackpressurePolicy,
+        on_close: Callable[["ClientConnection"], None] | None = None,
+    ):
+        self.websocket = websocket
+        self.max_queue = max(1, max_queue)
+        self.policy = BackpressurePolicy(policy)
+        self.closed = False
+        self.dropped = 0
+        self._on_close = on_close
+        self._queue: deque[tuple[str | None, str]] = deque()
+        self._ready = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._closing: asyncio.Task | None = None
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._drain())
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, payload: str, key: str | None = None) -> int:
+        """
+        Encola un payload ya serializado.
+        Devuelve cuántos payloads se han descartado (0 si no hizo falta descartar).
+        """
+        if self.closed:
+            return 1
+
+        discarded = 0
+        if len(self._queue) >= self.max_queue:
+            if self.policy == BackpressurePolicy.DISCONNECT:
+                logger.warning("Chat socket send queue full (%d), disconnecting client", self.max_queue)
+                self.dropped += 1
+                self.stop()
+                self._closing = asyncio.get_running_loop().create_task(self._shutdown(CLOSE_CODE_TRY_AGAIN_LATER))
+                return 1
+
+            if self.policy == BackpressurePolicy.COALESCE and key is not None:
+                before = len(self._queue)
+                self._queue = deque(item for item in self._queue if item[0] != key)
+                discarded += before - len(self._queue)
+
+            if len(self._queue) >= self.max_queue:
+                self._queue.popleft()
+                discarded += 1
+
+        self._queue.append((key, payload))
+        self._ready.set()
+        self.dropped += discarded
+        return discarded
+
+    async def _drain(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                _, payload = self._queue.popleft()
+                await self._send(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Dropping chat socket after failed send: %r", e)
+            await self.close()
+
+    async def _send(self, payload: str):
+        # asyncio.wait en lugar de wait_for: en Python 3.10 wait_for puede
+        # tragarse la cancelación si el envío termina a la vez, y la tarea
+        # escritora quedaría viva tras el cierre.
+        send = asyncio.ensure_future(self.websocket.send_text(payload))
+        try:
+            done, _ = await asyncio.wait({send}, timeout=SEND_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            send.cancel()
+            raise
+        if not done:
+            send.cancel()
+            raise asyncio.TimeoutError("WebSocket send timed out")
+        send.result()
+
+    def stop(self) -> bool:
+        """
+        Detiene la tarea escritora, descarta la cola y avisa al gestor para que
+        olvide la conexión. Devuelve False si ya estaba parada.
+        """
+        if self.closed:
+            return False
+        self.closed = True
+        self._queue.clear()
+
+        if self._on_close is not None:
+            self._on_close(self)
+
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        return True
+
+    async def close(self, code: int = 1000):
+        """Detiene la conexión y cierra el socket."""
+        if self.stop():
+            await self._shutdown(code)
+
+    async def _shutdown(self, code: int):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
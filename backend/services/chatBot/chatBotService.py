@@ -3,6 +3,8 @@ import time
 
 from core.config import settings
 
+from .embedding_cache import embedding_cache
+
 # Lazy singletons -- se crean la primera vez que se usan,
 # no al importar el modulo (evita llamadas de red en tests).
 _index = None
@@ -38,8 +40,15 @@ DISCLAIMER = "Respuesta meramente informativa basada en estatutos. No sustituye
 
 
 def _get_gemini_embedding(text: str):
+    # Las preguntas frecuentes se repiten tal cual: la caché evita volver a pedir su embedding
+    cached = embedding_cache.get(EMBEDDING_MODEL, text)
+    if cached is not None:
+        return cached
+
     response = _get_client().models.embed_content(model=EMBEDDING_MODEL, contents=text)
-    return response.embeddings[0].values
+    values = response.embeddings[0].values
+    embedding_cache.put(EMBEDDING_MODEL, text, values)
+    return values
 
 
 def _normalize_namespace(comunidad_id: str) -> str:
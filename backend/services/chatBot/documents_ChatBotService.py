@@ -1,7 +1,20 @@
 import hashlib
+import io
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from typing import Callable
 
+import pypdf
 from core.config import settings
+from core.deps import get_supabase_admin
+
+from .embedding_cache import embedding_cache
+
+logger = logging.getLogger(__name__)
 
 # Lazy singletons -- se crean la primera vez que se usan,
 # no al importar el modulo (evita llamadas de red en tests).
@@ -31,17 +44,127 @@ def _get_client():
 EMBEDDING_MODEL = "gemini-embedding-001"
 MAX_LIST_QUERY = 500
 
+# Lotes de embeddings: textos por llamada (límite de batchEmbedContents) y
+# caracteres por llamada, para no pasar del límite de tokens por petición
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_BATCH_MAX_CHARS = 60_000
+# Llamadas de embeddings simultáneas por documento
+EMBEDDING_MAX_CONCURRENCY = 4
+EMBEDDING_MAX_RETRIES = 3
+EMBEDDING_RETRY_BASE_DELAY = 1.0  # segundos
+
+# Lotes de upsert en Pinecone: vectores por petición y tamaño aproximado
+# (Pinecone rechaza peticiones de más de 2 MB)
+UPSERT_BATCH_SIZE = 100
+UPSERT_BATCH_MAX_BYTES = 1_500_000
+
+# Catálogo de documentos indexados (uno por comunidad y título)
+CATALOG_TABLE = "chatbot_documents"
+CATALOG_COLUMNS = (
+    "comunidad_id, document_title, source_filename, uploaded_by, uploaded_by_email, "
+    "chunks, content_hash, created_at, updated_at"
+)
+
+# Troceado: los cortes caen entre párrafos o frases y los decide el contenido
+# (el hash de cada párrafo o frase), no la posición en el texto, así que al
+# editar un documento solo cambian los chunks de alrededor de la edición
+CHUNK_MIN_CHARS = 400
+CHUNK_TARGET_CHARS = 800
+CHUNK_MAX_CHARS = 1200
+# La última frase de cada chunk se repite al principio del siguiente si no es más larga
+CHUNK_OVERLAP_MAX_CHARS = 150
+
+_PARAGRAPH_RE = re.compile(r"\S.*?(?:\n[ \t]*\n\s*|\Z)", re.S)
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?](?=\s)\s*|\n\s*|\Z)", re.S)
+
+# Ids por petición al leer de Pinecone los chunks guardados y al borrar los sobrantes
+FETCH_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+
+# Etapas de index_document que se notifican a on_progress(etapa, hechos, total)
+STAGE_CHUNKING = "chunking"
+STAGE_DIFFING = "diffing"
+STAGE_EMBEDDING = "embedding"
+STAGE_UPSERTING = "upserting"
+
+ProgressCallback = Callable[[str, int, int], None]
+
+SUPPORTED_FILE_TYPES = ("txt", "pdf")
+
+# Comunidades cuyo catálogo ya se ha completado con lo que hay en Pinecone en este proceso
+_backfilled_namespaces: set[str] = set()
+_backfill_lock = threading.Lock()
+
+
+def extract_text(data: bytes, file_type: str) -> str:
+    """Texto de un .txt (UTF-8) o de las páginas de un .pdf."""
+    if file_type == "txt":
+        return data.decode("utf-8")
+    if file_type == "pdf":
+        texto_extraido = ""
+        lector_pdf = pypdf.PdfReader(io.BytesIO(data))
+        for pagina in lector_pdf.pages:
+            texto_pagina = pagina.extract_text()
+            if texto_pagina:
+                texto_extraido += texto_pagina + "\n"
+        return texto_extraido
+    raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _split_units(text: str) -> list[str]:
+    """Párrafos del texto; los que pasan de CHUNK_MAX_CHARS, en frases, y las frases aún más largas, en trozos."""
+    units = []
+    for paragraph in _PARAGRAPH_RE.findall(text):
+        if len(paragraph) <= CHUNK_MAX_CHARS:
+            units.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.findall(paragraph):
+            while len(sentence) > CHUNK_MAX_CHARS:
+                cut = sentence.rfind(" ", 1, CHUNK_MAX_CHARS)
+                cut = cut if cut > 0 else CHUNK_MAX_CHARS
+                units.append(sentence[:cut])
+                sentence = sentence[cut:]
+            units.append(sentence)
+    return units
+
+
+def _is_chunk_boundary(unit: str) -> bool:
+    # Corta tras el párrafo o frase con probabilidad len(unit) / (TARGET - MIN):
+    # pasado el mínimo, cada chunk crece de media hasta unos CHUNK_TARGET_CHARS
+    digest = int.from_bytes(hashlib.sha256(unit.strip().encode("utf-8")).digest()[:4], "big")
+    return digest % (CHUNK_TARGET_CHARS - CHUNK_MIN_CHARS) < len(unit)
+
+
+def _chunk_text(text: str) -> list[str]:
+    """
+    Trocea el texto por párrafos y frases. Un chunk termina en el primer
+    párrafo o frase que, pasado CHUNK_MIN_CHARS, cumple _is_chunk_boundary, o
+    antes de pasar de CHUNK_MAX_CHARS. Como el corte depende del contenido y
+    no del desplazamiento, insertar o borrar texto solo cambia los chunks de
+    alrededor: el resto se reparte igual y conserva su hash.
+    """
+    groups: list[list[str]] = []
+    current: list[str] = []
+    size = 0
+    for unit in _split_units(text.strip()):
+        if current and size + len(unit) > CHUNK_MAX_CHARS:
+            groups.append(current)
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit)
+        if size >= CHUNK_MIN_CHARS and _is_chunk_boundary(unit):
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
 
-def _chunk_text_with_overlap(text, chunk_size=800, overlap=150):
-    """Corta el texto con solapamiento."""
-    text = text.strip()
     chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
+    overlap = ""
+    for units in groups:
+        body = "".join(units).strip()
+        chunks.append(f"{overlap} {body}" if overlap else body)
+        tail = _SENTENCE_RE.findall(units[-1])[-1].strip()
+        overlap = tail if len(tail) <= CHUNK_OVERLAP_MAX_CHARS else ""
     return chunks
 
 
@@ -50,16 +173,219 @@ def _normalize_namespace(comunidad_id) -> str:
     return str(comunidad_id).strip()
 
 
-def _build_chunk_id(namespace: str, document_title: str, chunk_index: int) -> str:
+def _build_chunk_id(namespace: str, document_title: str, chunk_hash: str, occurrence: int = 0) -> str:
     """
-    Pinecone impone restricciones de longitud/formato en record IDs.
-    Usamos hash estable para evitar fallos con ids largas o titulos complejos.
+    Id del chunk en Pinecone. Depende de su contenido y no de su posición: al
+    editar el documento, los chunks que solo se desplazan conservan el id y no
+    se vuelven a subir. occurrence distingue los chunks repetidos dentro del
+    mismo documento. Pinecone impone restricciones de longitud/formato en
+    record IDs: usamos un hash estable.
     """
+    seed = f"{namespace}|{document_title}|{chunk_hash}|{occurrence}".encode("utf-8")
+    digest = hashlib.sha256(seed).hexdigest()[:40]
+    return f"chunk-{digest}"
+
+
+def _build_legacy_chunk_id(namespace: str, document_title: str, chunk_index: int) -> str:
+    """Id por posición de los chunks indexados antes de que el id dependiera del contenido."""
     seed = f"{namespace}|{document_title}|{chunk_index}".encode("utf-8")
     digest = hashlib.sha256(seed).hexdigest()[:40]
     return f"chunk-{digest}"
 
 
+def _chunk_ids(namespace: str, document_title: str, hashes: list[str]) -> list[str]:
+    """Ids de los chunks de un documento, en orden, a partir del hash de cada uno."""
+    occurrences: dict[str, int] = {}
+    ids = []
+    for chunk_hash in hashes:
+        occurrence = occurrences.get(chunk_hash, 0)
+        occurrences[chunk_hash] = occurrence + 1
+        ids.append(_build_chunk_id(namespace, document_title, chunk_hash, occurrence))
+    return ids
+
+
+def _get_catalog():
+    return get_supabase_admin().table(CATALOG_TABLE)
+
+
+def get_catalog_entry(comunidad_id: str, document_title: str) -> dict | None:
+    res = (
+        _get_catalog()
+        .select(f"{CATALOG_COLUMNS}, chunk_hashes")
+        .eq("comunidad_id", _normalize_namespace(comunidad_id))
+        .eq("document_title", document_title)
+        .limit(1)
+        .execute()
+    )
+    return res.data[0] if res.data else None
+
+
+def _save_catalog_entry(
+    namespace: str,
+    document_title: str,
+    source_filename: str | None,
+    uploaded_by: str | None,
+    uploaded_by_email: str | None,
+    chunks: int,
+    content_hash: str | None,
+    chunk_hashes: list[str] | None = None,
+):
+    # created_at lo pone la base de datos al insertar; un upsert posterior no lo toca
+    _get_catalog().upsert(
+        {
+            "comunidad_id": namespace,
+            "document_title": document_title,
+            "source_filename": source_filename or document_title,
+            "uploaded_by": str(uploaded_by) if uploaded_by else None,
+            "uploaded_by_email": uploaded_by_email,
+            "chunks": chunks,
+            "content_hash": content_hash,
+            "chunk_hashes": chunk_hashes,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        },
+        on_conflict="comunidad_id,document_title",
+    ).execute()
+
+
+def _content_hash(chunk_text: str) -> str:
+    return hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+
+
+def _field(obj, name: str):
+    # Las respuestas de Pinecone son modelos OpenAPI; en los tests, diccionarios
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _fetch_chunks(namespace: str, ids: list[str]) -> dict[str, tuple[str, list[float]]]:
+    """Hash del contenido y vector de los chunks que existen entre `ids`."""
+    chunks = {}
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        res = _get_index().fetch(ids=ids[start : start + FETCH_BATCH_SIZE], namespace=namespace)
+        for chunk_id, vector in (_field(res, "vectors") or {}).items():
+            metadata = _field(vector, "metadata") or {}
+            # Los chunks indexados antes de guardar content_hash se comparan por su texto
+            chunk_hash = metadata.get("content_hash") or _content_hash(metadata.get("texto") or "")
+            chunks[chunk_id] = (chunk_hash, list(_field(vector, "values") or []))
+    return chunks
+
+
+def _stored_legacy_chunks(namespace: str, document_title: str, expected: int) -> dict[int, tuple[str, list[float]]]:
+    """
+    Chunks guardados con ids por posición, con su hash y su vector. Los ids
+    son consecutivos, así que se leen los `expected` primeros y después se
+    sigue por tandas hasta dar con el final de la versión guardada.
+    """
+    stored = {}
+    start, count = 0, max(expected, FETCH_BATCH_SIZE)
+    while True:
+        ids = [_build_legacy_chunk_id(namespace, document_title, i) for i in range(start, start + count)]
+        found = _fetch_chunks(namespace, ids)
+        for i, chunk_id in enumerate(ids, start=start):
+            if chunk_id in found:
+                stored[i] = found[chunk_id]
+        if start + count > expected and ids[-1] not in found:
+            return stored
+        start, count = start + count, FETCH_BATCH_SIZE
+
+
+def _stored_chunks(namespace: str, document_title: str, entry: dict | None) -> tuple[list[str], dict[str, list]]:
+    """
+    Ids de la versión guardada del documento. Si el catálogo tiene sus hashes
+    se deducen sin leer Pinecone; si se indexó con ids por posición, se leen
+    de Pinecone y se devuelven también sus vectores por hash, para
+    reutilizarlos en lugar de volver a calcularlos.
+    """
+    if entry and entry.get("chunk_hashes") is not None:
+        return _chunk_ids(namespace, document_title, entry["chunk_hashes"]), {}
+
+    stored = _stored_legacy_chunks(namespace, document_title, int(entry["chunks"]) if entry else 0)
+    ids = [_build_legacy_chunk_id(namespace, document_title, i) for i in sorted(stored)]
+    return ids, {chunk_hash: values for chunk_hash, values in stored.values() if values}
+
+
+def _batch_by_size(items: list, max_items: int, max_size: int, size_of) -> list[list]:
+    """Agrupa en orden sin pasar de max_items elementos ni de max_size (un elemento grande va solo)."""
+    batches = []
+    current = []
+    current_size = 0
+    for item in items:
+        item_size = size_of(item)
+        if current and (len(current) >= max_items or current_size + item_size > max_size):
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(item)
+        current_size += item_size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    """Una sola llamada a embed_content con varios textos, reintentando errores transitorios."""
+    for attempt in range(EMBEDDING_MAX_RETRIES):
+        try:
+            response = _get_client().models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+            embeddings = [embedding.values for embedding in response.embeddings]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
+        except Exception as e:
+            if attempt == EMBEDDING_MAX_RETRIES - 1:
+                raise
+            delay = EMBEDDING_RETRY_BASE_DELAY * (2**attempt)
+            logger.warning("embed_content failed (%s), retrying in %ss", str(e), delay)
+            time.sleep(delay)
+
+
+def _embed_chunks(chunks: list[str], on_progress: ProgressCallback | None = None) -> list[list[float]]:
+    """
+    Embeddings de todos los chunks, en el mismo orden. Los que ya están en la
+    caché no se piden; el resto va en lotes y con concurrencia acotada.
+    """
+    embeddings = embedding_cache.get_many(EMBEDDING_MODEL, chunks)
+    pending: dict[str, list[int]] = {}
+    for i, (chunk_text, values) in enumerate(zip(chunks, embeddings)):
+        if values is None:
+            pending.setdefault(chunk_text, []).append(i)
+
+    done = len(chunks) - sum(len(positions) for positions in pending.values())
+    if on_progress and done:
+        on_progress(STAGE_EMBEDDING, done, len(chunks))
+    if not pending:
+        return embeddings
+
+    batches = _batch_by_size(list(pending), EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_CHARS, len)
+    with ThreadPoolExecutor(max_workers=min(EMBEDDING_MAX_CONCURRENCY, len(batches))) as executor:
+        futures = {executor.submit(_embed_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            vectors = future.result()
+            embedding_cache.put_many(EMBEDDING_MODEL, batch, vectors)
+            for chunk_text, values in zip(batch, vectors):
+                for i in pending[chunk_text]:
+                    embeddings[i] = values
+                done += len(pending[chunk_text])
+            if on_progress:
+                on_progress(STAGE_EMBEDDING, done, len(chunks))
+    return embeddings
+
+
+def _estimate_vector_bytes(vector: dict) -> int:
+    # JSON: ~12 bytes por float, más el texto del chunk y el resto de metadatos
+    metadata = vector.get("metadata") or {}
+    return len(vector["values"]) * 12 + sum(len(str(value)) for value in metadata.values()) + 256
+
+
+def _upsert_vectors(vectors: list[dict], namespace: str, on_progress: ProgressCallback | None = None):
+    done = 0
+    for batch in _batch_by_size(vectors, UPSERT_BATCH_SIZE, UPSERT_BATCH_MAX_BYTES, _estimate_vector_bytes):
+        _get_index().upsert(vectors=batch, namespace=namespace)
+        done += len(batch)
+        if on_progress:
+            on_progress(STAGE_UPSERTING, done, len(vectors))
+
+
 def _get_list_query_vector():
     return (
         _get_client()
@@ -79,112 +405,166 @@ def index_document(
     uploaded_by: str | None = None,
     uploaded_by_email: str | None = None,
     source_filename: str | None = None,
+    on_progress: ProgressCallback | None = None,
+    incremental: bool = False,
 ):
+    """
+    Trocea, calcula los embeddings y sube el documento a Pinecone. Devuelve el
+    número de chunks. on_progress recibe (etapa, hechos, total) al avanzar.
+
+    Los ids de los chunks dependen de su contenido y el catálogo guarda los
+    hashes de la versión indexada. Con incremental=True (actualizar un
+    documento ya indexado) solo se calculan y suben los chunks nuevos, por
+    mucho que se hayan desplazado los demás, y los que ya no están se borran
+    de una vez. Sin él se suben todos.
+    """
     namespace = _normalize_namespace(comunidad_id)
-    chunks = _chunk_text_with_overlap(raw_text)
+    if on_progress:
+        on_progress(STAGE_CHUNKING, 0, 1)
+    chunks = _chunk_text(raw_text)
     if not chunks:
         return 0
+    hashes = [_content_hash(chunk_text) for chunk_text in chunks]
+    ids = _chunk_ids(namespace, document_title, hashes)
+    document_hash = _content_hash(raw_text.strip())
+
+    if incremental and on_progress:
+        on_progress(STAGE_DIFFING, 0, 1)
+    previous_ids, stored_vectors = _stored_chunks(
+        namespace, document_title, get_catalog_entry(namespace, document_title)
+    )
+    existing = set(previous_ids) if incremental else set()
+    changed = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+    current = set(ids)
+    orphan_ids = [chunk_id for chunk_id in previous_ids if chunk_id not in current]
+    if incremental:
+        logger.info(
+            "Updating '%s' in %s: %d of %d chunks changed, %d removed",
+            document_title,
+            namespace,
+            len(changed),
+            len(chunks),
+            len(orphan_ids),
+        )
 
+    # Los chunks de una versión con ids por posición conservan su vector
+    pending = [i for i in changed if hashes[i] not in stored_vectors]
     uploaded_at = datetime.now(timezone.utc).isoformat()
+    if on_progress:
+        on_progress(STAGE_EMBEDDING, 0, len(pending))
+    embeddings = _embed_chunks([chunks[i] for i in pending], on_progress) if pending else []
+    computed = dict(zip(pending, embeddings))
     vectors = []
-    for i, chunk_text in enumerate(chunks):
-        chunk_id = _build_chunk_id(namespace, document_title, i)
-
-        response = _get_client().models.embed_content(model=EMBEDDING_MODEL, contents=chunk_text)
-
+    for i in changed:
         vectors.append(
             {
-                "id": chunk_id,
-                "values": response.embeddings[0].values,
+                "id": ids[i],
+                "values": computed[i] if i in computed else stored_vectors[hashes[i]],
                 "metadata": {
                     "comunidad_id": namespace,
                     "document_title": document_title,
                     "source_filename": source_filename or document_title,
-                    "chunk_index": i,
                     "uploaded_by": str(uploaded_by) if uploaded_by else None,
                     "uploaded_by_email": uploaded_by_email,
                     "uploaded_at": uploaded_at,
-                    "texto": chunk_text,
+                    "content_hash": hashes[i],
+                    "texto": chunks[i],
                 },
             }
         )
 
+    if on_progress:
+        on_progress(STAGE_UPSERTING, 0, len(vectors))
     if vectors:
-        _get_index().upsert(
-            vectors=vectors,
-            namespace=namespace,
-        )
+        _upsert_vectors(vectors, namespace, on_progress)
+
+    _delete_chunks(namespace, orphan_ids)
+
+    _save_catalog_entry(
+        namespace,
+        document_title,
+        source_filename,
+        uploaded_by,
+        uploaded_by_email,
+        chunks=len(chunks),
+        content_hash=document_hash,
+        chunk_hashes=hashes,
+    )
+    return len(chunks)
 
-    return len(vectors)
 
+def _delete_chunks(namespace: str, ids: list[str]):
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        _get_index().delete(namespace=namespace, ids=ids[start : start + DELETE_BATCH_SIZE])
 
-def list_documents(comunidad_id: str, uploaded_by: str | None = None, limit: int = 100):
-    namespace = _normalize_namespace(comunidad_id)
-    safe_limit = max(1, min(limit, MAX_LIST_QUERY))
 
-    stats = _get_index().describe_index_stats()
-    namespaces = stats.get("namespaces", {}) if isinstance(stats, dict) else {}
-    vector_count = int(namespaces.get(namespace, {}).get("vector_count", 0))
-
-    top_k = min(max(safe_limit * 20, 100), MAX_LIST_QUERY)
-    query_kwargs = {
-        "namespace": namespace,
-        "vector": _get_list_query_vector(),
-        "top_k": top_k,
-        "include_metadata": True,
+def _catalog_document(row: dict) -> dict:
+    return {
+        "document_title": row.get("document_title"),
+        "source_filename": row.get("source_filename"),
+        "uploaded_by": row.get("uploaded_by"),
+        "uploaded_by_email": row.get("uploaded_by_email"),
+        "uploaded_at": row.get("updated_at"),
+        "chunks": row.get("chunks"),
+        "content_hash": row.get("content_hash"),
+        "created_at": row.get("created_at"),
+        "updated_at": row.get("updated_at"),
     }
+
+
+def _query_catalog(namespace: str, uploaded_by: str | None, limit: int) -> list[dict]:
+    query = _get_catalog().select(CATALOG_COLUMNS).eq("comunidad_id", namespace)
     if uploaded_by:
-        query_kwargs["filter"] = {"uploaded_by": {"$eq": str(uploaded_by)}}
-
-    matches = _get_index().query(**query_kwargs).get("matches", [])
-
-    documents_by_title = {}
-    for match in matches:
-        metadata = match.get("metadata", {})
-        title = metadata.get("document_title") or "Documento sin titulo"
-        current = documents_by_title.get(title)
-
-        if current is None:
-            documents_by_title[title] = {
-                "document_title": title,
-                "source_filename": metadata.get("source_filename"),
-                "uploaded_by": metadata.get("uploaded_by"),
-                "uploaded_by_email": metadata.get("uploaded_by_email"),
-                "uploaded_at": metadata.get("uploaded_at"),
-                "chunks": 1,
-            }
-            continue
+        query = query.eq("uploaded_by", str(uploaded_by))
+    # Uno de más para saber si quedan documentos sin devolver
+    return query.order("updated_at", desc=True).limit(limit + 1).execute().data or []
+
+
+def _backfill_catalog(namespace: str) -> bool:
+    """
+    La primera vez que una comunidad aparece sin documentos en el catálogo,
+    registra los que solo están en Pinecone (subidos antes de que existiera).
+    Una vez por comunidad y proceso; si falla, se reintenta en el siguiente
+    listado. Devuelve True si ha añadido alguno.
+    """
+    with _backfill_lock:
+        if namespace in _backfilled_namespaces:
+            return False
+        _backfilled_namespaces.add(namespace)
+    try:
+        added = rebuild_catalog(namespace)
+    except Exception as e:
+        logger.warning("Failed to backfill the document catalog of %s: %s", namespace, str(e))
+        with _backfill_lock:
+            _backfilled_namespaces.discard(namespace)
+        return False
+    if added:
+        logger.info("Backfilled %d documents into the catalog of %s", added, namespace)
+    return added > 0
 
-        current["chunks"] += 1
 
-        current_uploaded_at = current.get("uploaded_at") or ""
-        new_uploaded_at = metadata.get("uploaded_at") or ""
-        if new_uploaded_at > current_uploaded_at:
-            current["uploaded_at"] = metadata.get("uploaded_at")
-            current["uploaded_by"] = metadata.get("uploaded_by")
-            current["uploaded_by_email"] = metadata.get("uploaded_by_email")
+def list_documents(comunidad_id: str, uploaded_by: str | None = None, limit: int = 100):
+    """
+    Documentos de la comunidad, del más reciente al más antiguo, leídos del
+    catálogo. Si la comunidad no tiene ninguno, antes se registran los que
+    solo están en Pinecone.
+    """
+    namespace = _normalize_namespace(comunidad_id)
+    safe_limit = max(1, min(limit, MAX_LIST_QUERY))
 
-    documents = sorted(
-        documents_by_title.values(),
-        key=lambda doc: (doc.get("uploaded_at") or "", doc.get("document_title") or ""),
-        reverse=True,
-    )[:safe_limit]
+    rows = _query_catalog(namespace, uploaded_by, safe_limit)
+    if not rows and _backfill_catalog(namespace):
+        rows = _query_catalog(namespace, uploaded_by, safe_limit)
 
     return {
-        "documents": documents,
+        "documents": [_catalog_document(row) for row in rows[:safe_limit]],
         "namespace": namespace,
-        "vector_count": vector_count,
-        "queried_vectors": top_k,
-        "truncated": len(matches) >= top_k,
+        "truncated": len(rows) > safe_limit,
     }
 
 
-def delete_document(comunidad_id: str, document_title: str):
-    namespace = _normalize_namespace(comunidad_id)
-    title = str(document_title).strip()
-    if not title:
-        return {"deleted_chunks": 0, "namespace": namespace, "document_title": title}
-
+def _delete_by_query(namespace: str, title: str) -> int:
+    """Borra los chunks de un documento que no está en el catálogo (indexado antes de que existiera)."""
     deleted_chunks = 0
     query_vector = _get_list_query_vector()
 
@@ -214,8 +594,82 @@ def delete_document(comunidad_id: str, document_title: str):
         if len(ids) < MAX_LIST_QUERY:
             break
 
+    return deleted_chunks
+
+
+def delete_document(comunidad_id: str, document_title: str):
+    namespace = _normalize_namespace(comunidad_id)
+    title = str(document_title).strip()
+    if not title:
+        return {"deleted_chunks": 0, "namespace": namespace, "document_title": title}
+
+    entry = get_catalog_entry(namespace, title)
+    if entry is None:
+        deleted_chunks = _delete_by_query(namespace, title)
+    else:
+        chunk_ids, _ = _stored_chunks(namespace, title, entry)
+        deleted_chunks = len(chunk_ids)
+        _delete_chunks(namespace, chunk_ids)
+        _get_catalog().delete().eq("comunidad_id", namespace).eq("document_title", title).execute()
+
     return {
         "deleted_chunks": deleted_chunks,
         "namespace": namespace,
         "document_title": title,
     }
+
+
+def rebuild_catalog(comunidad_id: str) -> int:
+    """
+    Registra en el catálogo los documentos que solo están en Pinecone (subidos
+    antes de que existiera). Los títulos se descubren con consultas que excluyen
+    los ya vistos y los chunks se cuentan leyendo sus ids. Devuelve cuántos
+    documentos se han añadido.
+    """
+    namespace = _normalize_namespace(comunidad_id)
+    query_vector = _get_list_query_vector()
+    known = {
+        row["document_title"]
+        for row in _get_catalog().select("document_title").eq("comunidad_id", namespace).execute().data or []
+    }
+
+    found: dict[str, dict] = {}
+    while True:
+        query_kwargs = {
+            "namespace": namespace,
+            "vector": query_vector,
+            "top_k": MAX_LIST_QUERY,
+            "include_metadata": True,
+        }
+        seen = sorted(known | found.keys())
+        if seen:
+            query_kwargs["filter"] = {"document_title": {"$nin": seen}}
+        matches = _get_index().query(**query_kwargs).get("matches", [])
+
+        new_titles = 0
+        for match in matches:
+            metadata = match.get("metadata", {})
+            title = metadata.get("document_title")
+            if not title or title in known:
+                continue
+            current = found.get(title)
+            if current is None:
+                new_titles += 1
+            if current is None or (metadata.get("uploaded_at") or "") > (current.get("uploaded_at") or ""):
+                found[title] = metadata
+
+        if new_titles == 0:
+            break
+
+    for title, metadata in found.items():
+        chunks = len(_stored_legacy_chunks(namespace, title, 0))
+        _save_catalog_entry(
+            namespace,
+            title,
+            metadata.get("source_filename"),
+            metadata.get("uploaded_by"),
+            metadata.get("uploaded_by_email"),
+            chunks=chunks,
+            content_hash=None,
+        )
+    return len(found)
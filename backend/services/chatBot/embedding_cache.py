@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from array import array
+
+from cachetools import LRUCache
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Cuántas entradas de la base local se borran de golpe al pasar del máximo,
+# para no ejecutar la limpieza en cada inserción
+EMBEDDING_CACHE_EVICTION_SLACK = 0.1
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS embeddings ("
+    "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)",
+)
+
+
+def normalize_text(text: str) -> str:
+    """Misma clave para textos que solo cambian en espacios o en la forma Unicode."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _pack(values) -> bytes:
+    return array("f", values).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    values = array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+
+class EmbeddingCache:
+    """
+    Caché de embeddings direccionada por contenido: la clave es el SHA-256 del
+    modelo y del texto normalizado, así que un chunk o una pregunta que ya se
+    calcularon no vuelven a pasar por la API, vengan del documento que vengan.
+
+    Dos niveles: un LRU en memoria para lo más usado y una base SQLite local
+    que sobrevive a los reinicios y se comparte entre los workers de la
+    máquina. La base guarda los vectores en float32 (lo que almacena Pinecone)
+    y, al pasar de max_entries, borra los menos usados recientemente.
+    """
+
+    def __init__(self, path: str | None = None, memory_size: int | None = None, max_entries: int | None = None):
+        self.path = (
+            path
+            or settings.EMBEDDING_CACHE_PATH
+            or os.path.join(tempfile.gettempdir(), "vecinus-embedding-cache.sqlite3")
+        )
+        self.max_entries = max_entries or settings.EMBEDDING_CACHE_MAX_ENTRIES
+        self._memory: LRUCache = LRUCache(maxsize=memory_size or settings.EMBEDDING_CACHE_MEMORY_SIZE)
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        self._since_eviction = 0
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _open(path: str) -> sqlite3.Connection:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            db.execute(statement)
+        return db
+
+    def _connection(self) -> sqlite3.Connection:
+        # Se abre al primer uso; si no se puede, la caché sigue funcionando sin persistir
+        if self._db is None:
+            try:
+                self._db = self._open(self.path)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Embedding cache store unavailable at %s: %s", self.path, str(e))
+                self.path = ":memory:"
+                self._db = self._open(self.path)
+        return self._db
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """Vector de cada texto, o None si no está en la caché."""
+        keys = [embedding_key(model, text) for text in texts]
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    found[key] = self._memory[key]
+
+            missing = list({key for key in keys if key not in found})
+            if missing:
+                now = time.time()
+                try:
+                    db = self._connection()
+                    # Por tandas: SQLite limita el número de parámetros por sentencia
+                    for start in range(0, len(missing), 500):
+                        part = missing[start : start + 500]
+                        placeholders = ",".join("?" * len(part))
+                        rows = db.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",  # nosec B608
+                            part,
+                        ).fetchall()
+                        for key, blob in rows:
+                            found[key] = self._memory[key] = _unpack(blob)
+                        if rows:
+                            db.executemany(
+                                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key, _ in rows]
+                            )
+                except sqlite3.Error as e:
+                    logger.warning("Embedding cache read failed: %s", str(e))
+
+            hits = sum(key in found for key in keys)
+            self._hits += hits
+            self._misses += len(keys) - hits
+        return [found.get(key) for key in keys]
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: list[str], vectors: list[list[float]]):
+        rows = []
+        now = time.time()
+        with self._lock:
+            for text, values in zip(texts, vectors):
+                key = embedding_key(model, text)
+                self._memory[key] = list(values)
+                rows.append((key, model, _pack(values), now))
+
+            try:
+                db = self._connection()
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)", rows
+                )
+                self._since_eviction += len(rows)
+                if self._since_eviction >= self.max_entries * EMBEDDING_CACHE_EVICTION_SLACK:
+                    self._evict(db)
+            except sqlite3.Error as e:
+                logger.warning("Embedding cache write failed: %s", str(e))
+
+    def put(self, model: str, text: str, values: list[float]):
+        self.put_many(model, [text], [values])
+
+    def _evict(self, db: sqlite3.Connection):
+        self._since_eviction = 0
+        (count,) = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "hits": self._hits,
+                "misses": self._misses,
+                "path": self.path,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._hits = 0
+            self._misses = 0
+            try:
+                self._connection().execute("DELETE FROM embeddings")
+            except sqlite3.Error as e:
+                logger.warning("Failed to clear the embedding cache: %s", str(e))
+
+
+embedding_cache = EmbeddingCache()
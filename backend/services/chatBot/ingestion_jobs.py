@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, BinaryIO, Callable
+
+from cachetools import TTLCache
+from core.config import settings
+from core.deps import get_supabase_admin
+from services.chat.connection_manager import manager
+
+from .documents_ChatBotService import extract_text, index_document
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = "document_ingestion_jobs"
+
+# Estados de un trabajo: en cola, una etapa del pipeline o terminado
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = {JOB_COMPLETED, JOB_FAILED}
+
+# Dentro de una misma etapa, como mucho un informe de progreso por intervalo
+JOB_PROGRESS_INTERVAL_SECONDS = 1.0
+# Trabajos terminados que se siguen consultando en memoria antes de ir a la tabla
+FINISHED_JOB_CACHE_SIZE = 1000
+FINISHED_JOB_TTL_SECONDS = 3600
+# Un trabajo sin terminar que lleva este tiempo sin avanzar se da por perdido
+# (su worker se cayó). Con margen: otro worker puede seguir con él en una
+# tanda de embeddings con reintentos
+JOB_ORPHAN_AFTER_SECONDS = 600
+
+EMPTY_DOCUMENT_ERROR = "El documento esta vacio o no se pudo extraer el texto."
+INTERRUPTED_JOB_ERROR = "Interrumpido al reiniciar el servidor. Vuelve a subir el documento."
+
+
+class DocumentIngestionError(Exception):
+    """El documento no se puede indexar (vacío, ilegible...)."""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _is_stale(updated_at: str) -> bool:
+    updated = datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - updated > timedelta(seconds=JOB_ORPHAN_AFTER_SECONDS)
+
+
+@dataclass
+class IngestionJob:
+    comunidad_id: str
+    document_title: str
+    source_filename: str
+    file_type: str
+    path: str
+    uploaded_by: str | None = None
+    uploaded_by_email: str | None = None
+    incremental: bool = False
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = JOB_QUEUED
+    progress_done: int = 0
+    progress_total: int = 0
+    chunks: int = 0
+    error: str | None = None
+    created_at: str = field(default_factory=_now)
+    updated_at: str = field(default_factory=_now)
+    reported_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def as_row(self) -> dict:
+        return {
+            "id": self.id,
+            "comunidad_id": self.comunidad_id,
+            "document_title": self.document_title,
+            "source_filename": self.source_filename,
+            "uploaded_by": self.uploaded_by,
+            "status": self.status,
+            "progress_done": self.progress_done,
+            "progress_total": self.progress_total,
+            "chunks": self.chunks,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class DocumentIngestionQueue:
+    """
+    Indexado de documentos del chatbot en segundo plano.
+
+    El endpoint solo guarda el fichero subido en disco, crea el trabajo y
+    responde con su id; un pool de hilos ejecuta después el pipeline (extraer
+    el texto, trocear, comparar con la versión guardada si es una
+    actualización, embeddings y upsert en Pinecone). Cada cambio de etapa
+    (y el avance dentro de ella, como mucho una vez por segundo) se guarda en
+    la tabla document_ingestion_jobs, para que cualquier worker pueda responder
+    a la consulta de estado, y se empuja por el socket del usuario que lo subió.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], object] = get_supabase_admin,
+        notifier: Callable[[dict, list[str]], Awaitable[dict]] | None = None,
+        workers: int | None = None,
+        upload_dir: str | None = None,
+    ):
+        self._client_factory = client_factory
+        self._notifier = notifier
+        self.workers = workers or settings.DOCUMENT_INGESTION_WORKERS
+        self.upload_dir = (
+            upload_dir or settings.DOCUMENT_UPLOAD_DIR or os.path.join(tempfile.gettempdir(), "vecinus-documents")
+        )
+        self._executor: ThreadPoolExecutor | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._active: dict[str, IngestionJob] = {}
+        self._finished: TTLCache = TTLCache(maxsize=FINISHED_JOB_CACHE_SIZE, ttl=FINISHED_JOB_TTL_SECONDS)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Recuerda el event loop de la aplicación para empujar el progreso (en el lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._ensure_executor().submit(self.fail_orphaned_jobs)
+
+    def fail_orphaned_jobs(self) -> int:
+        """
+        Da por fallidos los trabajos de la tabla que quedaron a medias porque su
+        worker se cayó: sin terminar y sin avanzar desde hace más de
+        JOB_ORPHAN_AFTER_SECONDS. Devuelve cuántos se han marcado.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=JOB_ORPHAN_AFTER_SECONDS)).isoformat()
+        try:
+            res = (
+                self._client_factory()
+                .table(JOBS_TABLE)
+                .update({"status": JOB_FAILED, "error": INTERRUPTED_JOB_ERROR, "updated_at": _now()})
+                .not_.in_("status", sorted(FINISHED_STATUSES))
+                .lt("updated_at", cutoff)
+                .execute()
+            )
+        except Exception as e:
+            logger.warning("Failed to close orphaned document ingestion jobs: %s", str(e))
+            return 0
+        if res.data:
+            logger.info("Marked %d orphaned document ingestion jobs as failed", len(res.data))
+        return len(res.data or [])
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="document-ingestion")
+            return self._executor
+
+    def _store(self, source: BinaryIO | bytes, file_type: str) -> str:
+        os.makedirs(self.upload_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=f".{file_type}", dir=self.upload_dir)
+        with os.fdopen(fd, "wb") as target:
+            if isinstance(source, bytes):
+                target.write(source)
+            else:
+                shutil.copyfileobj(source, target)
+        return path
+
+    def submit(
+        self,
+        comunidad_id: str,
+        document_title: str,
+        source: BinaryIO | bytes,
+        file_type: str,
+        uploaded_by: str | None = None,
+        uploaded_by_email: str | None = None,
+        source_filename: str | None = None,
+        incremental: bool = False,
+    ) -> IngestionJob:
+        """
+        Guarda el fichero, registra el trabajo y lo deja en cola. No espera a que
+        se indexe. incremental=True actualiza un documento ya indexado.
+        """
+        job = IngestionJob(
+            comunidad_id=comunidad_id,
+            document_title=document_title,
+            source_filename=source_filename or document_title,
+            file_type=file_type,
+            path=self._store(source, file_type),
+            uploaded_by=str(uploaded_by) if uploaded_by else None,
+            uploaded_by_email=uploaded_by_email,
+            incremental=incremental,
+        )
+        with self._lock:
+            self._active[job.id] = job
+
+        self._persist(job, insert=True)
+        self._ensure_executor().submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        with self._lock:
+            return self._active.get(str(job_id)) or self._finished.get(str(job_id))
+
+    def lookup(self, job_id: str) -> dict | None:
+        """Estado del trabajo: de memoria si lo lleva este proceso, si no de la tabla."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.as_row()
+
+        res = self._client_factory().table(JOBS_TABLE).select("*").eq("id", str(job_id)).limit(1).execute()
+        if not res.data:
+            return None
+        row = res.data[0]
+        if row["status"] not in FINISHED_STATUSES and _is_stale(row["updated_at"]):
+            # Se cayó el worker después del último arranque: se cierra al consultarlo
+            self.fail_orphaned_jobs()
+            row = {**row, "status": JOB_FAILED, "error": INTERRUPTED_JOB_ERROR}
+        return row
+
+    def _run(self, job: IngestionJob):
+        try:
+            self._advance(job, JOB_EXTRACTING, 0, 1)
+            with open(job.path, "rb") as source:
+                text = extract_text(source.read(), job.file_type)
+            if not text.strip():
+                raise DocumentIngestionError(EMPTY_DOCUMENT_ERROR)
+
+            job.chunks = index_document(
+                job.comunidad_id,
+                job.document_title,
+                text,
+                uploaded_by=job.uploaded_by,
+                uploaded_by_email=job.uploaded_by_email,
+                source_filename=job.source_filename,
+                incremental=job.incremental,
+                on_progress=lambda stage, done, total: self._advance(job, stage, done, total),
+            )
+            if job.chunks == 0:
+                raise DocumentIngestionError(EMPTY_DOCUMENT_ERROR)
+            self._finish(job, JOB_COMPLETED)
+        except Exception as e:
+            if not isinstance(e, DocumentIngestionError):
+                logger.error("Document ingestion job %s failed: %s", job.id, str(e))
+            self._finish(job, JOB_FAILED, str(e)[:500])
+
+    def _advance(self, job: IngestionJob, stage: str, done: int, total: int):
+        changed = stage != job.status
+        job.status = stage
+        job.progress_done = done
+        job.progress_total = total
+        if changed or done >= total or time.monotonic() - job.reported_at >= JOB_PROGRESS_INTERVAL_SECONDS:
+            self._report(job)
+
+    def _finish(self, job: IngestionJob, status: str, error: str | None = None):
+        job.status = status
+        job.error = error
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+        with self._lock:
+            self._active.pop(job.id, None)
+            self._finished[job.id] = job
+        self._report(job)
+
+    def _report(self, job: IngestionJob):
+        job.updated_at = _now()
+        job.reported_at = time.monotonic()
+        self._persist(job)
+        self._push(job)
+
+    def _persist(self, job: IngestionJob, insert: bool = False):
+        # Si falla, este proceso sigue respondiendo con su copia en memoria
+        try:
+            table = self._client_factory().table(JOBS_TABLE)
+            if insert:
+                table.insert(job.as_row()).execute()
+            else:
+                row = job.as_row()
+                row.pop("id")
+                table.update(row).eq("id", job.id).execute()
+        except Exception as e:
+            logger.warning("Failed to save document ingestion job %s: %s", job.id, str(e))
+
+    def _push(self, job: IngestionJob):
+        loop = self._loop
+        if self._notifier is None or not job.uploaded_by or loop is None or not loop.is_running():
+            return
+        message = {"event": "document_job_updated", "job": job.as_row()}
+        try:
+            asyncio.run_coroutine_threadsafe(self._notifier(message, [job.uploaded_by]), loop)
+        except RuntimeError:
+            # El loop se ha cerrado entre la comprobación y el envío
+            pass
+
+    def metrics(self) -> dict:
+        with self._lock:
+            active = list(self._active.values())
+        return {
+            "workers": self.workers,
+            "queued": sum(job.status == JOB_QUEUED for job in active),
+            "running": sum(job.status != JOB_QUEUED for job in active),
+        }
+
+    async def stop(self):
+        """Espera a los trabajos en curso; los que seguían en cola se dan por fallidos."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+        with self._lock:
+            pending = [job for job in self._active.values() if job.status == JOB_QUEUED]
+        for job in pending:
+            self._finish(job, JOB_FAILED, INTERRUPTED_JOB_ERROR)
+        self._loop = None
+
+
+document_ingestion = DocumentIngestionQueue(notifier=manager.notify_users)
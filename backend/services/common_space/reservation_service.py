@@ -2,6 +2,7 @@ from datetime import date, datetime, timezone
 
 from fastapi import HTTPException, status
 from schemas.common_space import QRValidateRequest, ReservationCreate
+from services.helpers.membership_resolver import get_association_membership
 from supabase import Client
 
 COMMON_SPACE_TABLE = "common_space"
@@ -54,16 +55,7 @@ def _has_basic_overlap(supabase: Client, space_id: int, start_at: datetime, end_
 
 
 def _ensure_user_belongs_to_association(supabase: Client, association_id: str, user_id: str) -> None:
-    membership_response = (
-        supabase.table("memberships")
-        .select("profile_id")
-        .eq("association_id", association_id)
-        .eq("profile_id", user_id)
-        .limit(1)
-        .execute()
-    )
-
-    if not membership_response.data:
+    if not get_association_membership(supabase, association_id, user_id):
         raise HTTPException(status_code=403, detail="No tienes acceso a esta comunidad")
 
 
@@ -241,19 +233,12 @@ def list_occupied_slots(supabase: Client, user_id: str, space_id: int, reservati
 
 
 def _verify_employee_membership(supabase_admin: Client, association_id: str, user_id: str) -> None:
-    membership_response = (
-        supabase_admin.table("memberships")
-        .select("role")
-        .eq("association_id", association_id)
-        .eq("profile_id", user_id)
-        .limit(1)
-        .execute()
-    )
+    membership = get_association_membership(supabase_admin, association_id, user_id)
 
-    if not membership_response.data:
+    if not membership:
         raise HTTPException(status_code=403, detail="No tienes acceso a esta comunidad")
 
-    if str(membership_response.data[0].get("role")) != EMPLOYEE_ROLE_ID:
+    if str(membership.get("role")) != EMPLOYEE_ROLE_ID:
         raise HTTPException(status_code=403, detail="Se requiere rol de empleado para validar el QR")
 
 
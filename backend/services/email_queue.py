@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Protocol
+
+import resend
+from core.config import settings
+from core.deps import get_supabase_admin
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_TABLE = "email_outbox"
+
+# Estados de una fila de email_outbox
+EMAIL_PENDING = "pending"
+EMAIL_SENDING = "sending"
+EMAIL_SENT = "sent"
+EMAIL_FAILED = "failed"
+
+# Límite de la API batch de Resend
+EMAIL_BATCH_SIZE = 100
+EMAIL_POLL_INTERVAL_SECONDS = 5.0
+EMAIL_RETRY_BASE_DELAY_SECONDS = 30
+EMAIL_RETRY_MAX_DELAY_SECONDS = 3600
+# Una fila en "sending" con una reclamación más antigua se da por abandonada (el
+# worker murió a mitad de envío) y se vuelve a reclamar. Muy por encima de lo
+# que tarda un lote, para no reenviar uno que sigue en curso.
+EMAIL_CLAIM_LEASE_SECONDS = 300
+
+
+class EmailConfigurationError(Exception):
+    """El proveedor no está configurado: reintentar no sirve de nada."""
+
+
+class EmailRejectedError(Exception):
+    """El proveedor rechaza este correo en concreto (destinatario inválido...): reintentar no sirve de nada."""
+
+
+@dataclass
+class OutboundEmail:
+    to: str
+    subject: str
+    html: str
+    text: str | None = None
+    kind: str = "generic"
+    reference_id: str | None = None
+
+    def as_row(self) -> dict:
+        return {
+            "to_email": self.to,
+            "subject": self.subject,
+            "html": self.html,
+            "text": self.text,
+            "kind": self.kind,
+            "reference_id": self.reference_id,
+            "status": EMAIL_PENDING,
+            "attempts": 0,
+        }
+
+
+class EmailTransport(Protocol):
+    def send_batch(self, rows: list[dict], idempotency_key: str) -> dict[int, str]:
+        """Envía el lote y devuelve los correos rechazados: {posición en rows: motivo}."""
+        ...
+
+
+class ResendTransport:
+    """
+    Envía un lote de filas de email_outbox con una sola llamada a la API batch
+    de Resend. En modo de validación "permissive": un destinatario inválido no
+    tumba el lote entero, Resend envía el resto y devuelve el error de ese.
+    """
+
+    def __init__(self, sender: str):
+        self.sender = sender
+
+    def send_batch(self, rows: list[dict], idempotency_key: str) -> dict[int, str]:
+        if not settings.RESEND_API_KEY:
+            raise EmailConfigurationError("RESEND_API_KEY is not set")
+
+        resend.api_key = settings.RESEND_API_KEY
+        messages = []
+        for row in rows:
+            message = {"from": self.sender, "to": [row["to_email"]], "subject": row["subject"], "html": row["html"]}
+            if row.get("text"):
+                message["text"] = row["text"]
+            messages.append(message)
+        response = resend.Batch.send(messages, {"idempotency_key": idempotency_key, "batch_validation": "permissive"})
+        return {int(error["index"]): error.get("message") or "Rejected" for error in response.get("errors") or []}
+
+
+def _ids_key(rows: list[dict]) -> str:
+    # Filas sin batch_key (reclamadas antes de que existiera la columna)
+    return hashlib.sha256(",".join(sorted(str(row["id"]) for row in rows)).encode()).hexdigest()
+
+
+class TokenBucket:
+    """Limita las llamadas al proveedor a `rate` por segundo, con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EmailQueue:
+    """
+    Cola persistente de correos salientes con un emisor en segundo plano.
+
+    Los endpoints solo insertan las filas en email_outbox (un insert por lote)
+    y responden; la tarea de fondo reclama las pendientes con el RPC
+    claim_email_outbox (FOR UPDATE SKIP LOCKED, así que varios workers no se
+    pisan; ver migrations/008_email_outbox.sql), las envía en lotes con la API
+    batch del proveedor respetando el límite de peticiones por segundo, y
+    reintenta los fallos con backoff exponencial hasta EMAIL_MAX_ATTEMPTS. Los
+    correos que el proveedor rechaza uno a uno se marcan como fallidos sin
+    afectar al resto del lote. Lo que queda pendiente al apagar se envía en el
+    siguiente arranque, y los lotes que un worker caído dejó en "sending" se
+    reclaman de nuevo al pasar EMAIL_CLAIM_LEASE_SECONDS, con la misma clave de
+    idempotencia (batch_key) que la primera vez.
+    """
+
+    def __init__(
+        self,
+        transport: EmailTransport,
+        client_factory: Callable[[], object] = get_supabase_admin,
+        batch_size: int = EMAIL_BATCH_SIZE,
+        rate_per_second: float | None = None,
+        max_attempts: int | None = None,
+        poll_interval: float = EMAIL_POLL_INTERVAL_SECONDS,
+    ):
+        self.transport = transport
+        self._client_factory = client_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts or settings.EMAIL_MAX_ATTEMPTS
+        self.poll_interval = poll_interval
+        self._rate_limiter = TokenBucket(rate_per_second or settings.EMAIL_RATE_LIMIT_PER_SECOND)
+        self._worker: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stats: Counter = Counter()
+
+    def enqueue(self, emails: list[OutboundEmail]) -> list[dict]:
+        """Guarda los correos en la cola y despierta al emisor. Se puede llamar desde cualquier hilo."""
+        if not emails:
+            return []
+
+        res = self._client_factory().table(OUTBOX_TABLE).insert([email.as_row() for email in emails]).execute()
+        self._stats["enqueued"] += len(emails)
+        self.wake()
+        return res.data or []
+
+    def wake(self):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def start(self):
+        """Arranca el emisor en el event loop actual (en el lifespan de la aplicación)."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # asyncio.wait (y no wait_for) para no tragarse una cancelación en Python 3.10
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=self.poll_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error("Unexpected error sending queued emails: %s", str(e))
+
+    async def drain(self) -> int:
+        """Envía lotes hasta que no quedan correos listos. Devuelve cuántos se han enviado."""
+        sent = 0
+        while True:
+            client = self._client_factory()
+            res = await asyncio.to_thread(
+                lambda: client.rpc(
+                    "claim_email_outbox", {"p_limit": self.batch_size, "p_lease_seconds": EMAIL_CLAIM_LEASE_SECONDS}
+                ).execute()
+            )
+            rows = res.data or []
+            if not rows:
+                return sent
+            # Un lote reclamado tras caer su worker llega con su batch_key y se
+            # envía aparte, tal cual: misma clave, el proveedor no lo duplica
+            batches: dict[str | None, list[dict]] = {}
+            for row in rows:
+                batches.setdefault(row.get("batch_key"), []).append(row)
+            for batch_key, batch in batches.items():
+                sent += await self._send(batch, batch_key or _ids_key(batch))
+
+    async def _send(self, rows: list[dict], idempotency_key: str) -> int:
+        await self._rate_limiter.acquire()
+        try:
+            rejected = await asyncio.to_thread(self.transport.send_batch, rows, idempotency_key) or {}
+        except Exception as e:
+            await self._record_failure(rows, e)
+            return 0
+
+        ids = [str(row["id"]) for i, row in enumerate(rows) if i not in rejected]
+        if ids:
+            client = self._client_factory()
+            now = datetime.now(timezone.utc).isoformat()
+            await asyncio.to_thread(
+                lambda: client.table(OUTBOX_TABLE)
+                .update({"status": EMAIL_SENT, "sent_at": now, "last_error": None})
+                .in_("id", ids)
+                .execute()
+            )
+        for i, reason in rejected.items():
+            await self._record_failure([rows[i]], EmailRejectedError(reason))
+
+        self._stats["batches"] += 1
+        self._stats["sent"] += len(ids)
+        return len(ids)
+
+    async def _record_failure(self, rows: list[dict], error: Exception):
+        retryable = not isinstance(error, (EmailConfigurationError, EmailRejectedError))
+        client = self._client_factory()
+
+        # Agrupadas por número de intentos: normalmente todo el lote comparte uno
+        by_attempts: dict[int, list[str]] = {}
+        for row in rows:
+            by_attempts.setdefault(int(row.get("attempts") or 0) + 1, []).append(str(row["id"]))
+
+        for attempts, ids in by_attempts.items():
+            values = {"attempts": attempts, "last_error": str(error)[:500]}
+            if retryable and attempts < self.max_attempts:
+                delay = min(EMAIL_RETRY_BASE_DELAY_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_DELAY_SECONDS)
+                values["status"] = EMAIL_PENDING
+                values["next_attempt_at"] = (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat()
+                self._stats["retried"] += len(ids)
+                logger.warning("Email batch failed (%s), retrying %d emails in %ss", str(error), len(ids), delay)
+            else:
+                values["status"] = EMAIL_FAILED
+                self._stats["failed"] += len(ids)
+                logger.error("Giving up on %d emails after %d attempts: %s", len(ids), attempts, str(error))
+
+            await asyncio.to_thread(
+                lambda values=values, ids=ids: client.table(OUTBOX_TABLE).update(values).in_("id", ids).execute()
+            )
+
+    def metrics(self) -> dict:
+        return {
+            "running": self._worker is not None and not self._worker.done(),
+            "batch_size": self.batch_size,
+            "rate_per_second": self._rate_limiter.rate,
+            "max_attempts": self.max_attempts,
+            **dict(self._stats),
+        }
+
+    async def stop(self):
+        """Detiene el emisor y envía lo que ya esté listo."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._wakeup = None
+        self._loop = None
+        try:
+            await self.drain()
+        except Exception as e:
+            logger.error("Failed to drain the email queue on shutdown: %s", str(e))
+
+
+email_queue = EmailQueue(ResendTransport(settings.EMAIL_SENDER))
@@ -0,0 +1,294 @@
+import html
+import re
+import threading
+from dataclasses import dataclass
+from string import Template
+
+from cachetools import LRUCache
+
+# Colores de la app (theme.ts)
+_PRIMARY = "#0a7ea4"
+_PRIMARY_DARK = "#086a8a"
+_GREEN = "#3aab5e"
+_BG = "#eef4f7"
+_CARD_BG = "#ffffff"
+_TEXT = "#11181C"
+_TEXT_MUTED = "#687076"
+
+# Logo alojado en Supabase Storage (URL pública, evita base64 que dispara el límite de Gmail)
+_LOGO_BLOCK = ""
+
+# Combinaciones (plantilla, valores fijos) precompiladas que se guardan
+TEMPLATE_SHELL_CACHE_SIZE = 256
+
+_SLOT = re.compile(r"\x00(\w+)\x00")
+
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    subject: str
+    html: str
+    text: str
+
+
+@dataclass(frozen=True)
+class _CompiledText:
+    """Texto partido por los huecos variables: segments[0] + valor + segments[1] + ..."""
+
+    segments: tuple[str, ...]
+    slots: tuple[str, ...]
+
+    def render(self, values: dict, escape) -> str:
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(escape(str(values[slot])))
+            parts.append(segment)
+        return "".join(parts)
+
+
+def _compile(source: str, fixed: dict, slots: tuple[str, ...], escape) -> _CompiledText:
+    marked = Template(source).substitute(
+        {**{key: escape(str(value)) for key, value in fixed.items()}, **{slot: f"\x00{slot}\x00" for slot in slots}}
+    )
+    pieces = _SLOT.split(marked)
+    return _CompiledText(segments=tuple(pieces[0::2]), slots=tuple(pieces[1::2]))
+
+
+def _no_escape(value: str) -> str:
+    return value
+
+
+@dataclass(frozen=True)
+class _CompiledEmail:
+    subject: _CompiledText
+    html: _CompiledText
+    text: _CompiledText
+
+    def render(self, values: dict) -> RenderedEmail:
+        return RenderedEmail(
+            subject=self.subject.render(values, _no_escape),
+            html=self.html.render(values, html.escape),
+            text=self.text.render(values, _no_escape),
+        )
+
+
+@dataclass(frozen=True)
+class EmailTemplate:
+    """
+    Plantilla de correo con sintaxis de string.Template ($campo).
+
+    `fixed` son los campos con pocos valores posibles (rol, estado...): cada
+    combinación se precompila una vez. `slots` son los que cambian en cada
+    envío (enlaces, fechas...) y se insertan en la versión precompilada.
+    """
+
+    name: str
+    subject: str
+    html_body: str
+    text_body: str
+    fixed: tuple[str, ...] = ()
+    slots: tuple[str, ...] = ()
+    title: str = "VecinUs"
+    footer: str = ""
+
+    def compile(self, fixed_values: dict) -> _CompiledEmail:
+        missing = set(self.fixed) - fixed_values.keys()
+        if missing:
+            raise KeyError(f"Missing fixed fields for template {self.name}: {sorted(missing)}")
+
+        page = Template(_LAYOUT).substitute(title=self.title, body=self.html_body, footer=self.footer)
+        text = self.text_body + "\n\n--\nVecinUs — Gestión de comunidades de vecinos\n"
+        return _CompiledEmail(
+            subject=_compile(self.subject, fixed_values, self.slots, _no_escape),
+            html=_compile(page, fixed_values, self.slots, html.escape),
+            text=_compile(text, fixed_values, self.slots, _no_escape),
+        )
+
+
+class TemplateRegistry:
+    """Plantillas registradas y caché LRU de sus versiones precompiladas."""
+
+    def __init__(self, cache_size: int = TEMPLATE_SHELL_CACHE_SIZE):
+        self._templates: dict[str, EmailTemplate] = {}
+        self._shells: LRUCache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def register(self, template: EmailTemplate) -> EmailTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def shell(self, name: str, **fixed_values) -> _CompiledEmail:
+        key = (name, tuple(sorted(fixed_values.items())))
+        with self._lock:
+            compiled = self._shells.get(key)
+        if compiled is None:
+            compiled = self._templates[name].compile(fixed_values)
+            with self._lock:
+                self._shells[key] = compiled
+        return compiled
+
+    def render(self, name: str, fixed: dict | None = None, values: dict | None = None) -> RenderedEmail:
+        return self.shell(name, **(fixed or {})).render(values or {})
+
+    def warm(self, name: str, variants: list[dict]):
+        """Precompila de antemano las combinaciones conocidas (p. ej. una por rol)."""
+        for fixed_values in variants:
+            self.shell(name, **fixed_values)
+
+    @property
+    def cached_shells(self) -> int:
+        return len(self._shells)
+
+
+_LAYOUT = f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+  <title>$title</title>
+</head>
+<body style="margin:0; padding:0; background-color:{_BG};
+             font-family: system-ui, -apple-system, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;">
+
+  <!-- wrapper -->
+  <table width="100%" cellpadding="0" cellspacing="0" role="presentation"
+         style="background-color:{_BG}; padding:40px 16px;">
+    <tr>
+      <td align="center">
+
+        <!-- card -->
+        <table width="480" cellpadding="0" cellspacing="0" role="presentation"
+               style="background-color:{_CARD_BG}; border-radius:16px;
+                      box-shadow:0 4px 24px rgba(0,0,0,0.08); overflow:hidden;
+                      max-width:480px; width:100%;">
+
+          <!-- header band -->
+          <tr>
+            <td style="background: linear-gradient(135deg, {_PRIMARY} 0%, {_PRIMARY_DARK} 100%);
+                       padding:32px 40px 28px; text-align:center;">
+              {_LOGO_BLOCK}
+              <span style="font-size:26px; font-weight:700; color:#ffffff;
+                           letter-spacing:-0.5px;">VecinUs</span>
+            </td>
+          </tr>
+
+          <!-- body -->
+          <tr>
+            <td style="padding:36px 40px 20px;">
+$body
+            </td>
+          </tr>
+
+          <!-- divider -->
+          <tr>
+            <td style="padding:0 40px;">
+              <hr style="border:none; border-top:1px solid #e8edf0; margin:0;" />
+            </td>
+          </tr>
+
+          <!-- footer -->
+          <tr>
+            <td style="padding:20px 40px 32px; text-align:center;">
+              <p style="margin:0; font-size:12px; color:{_TEXT_MUTED}; line-height:1.6;">
+                $footer
+              </p>
+              <p style="margin:12px 0 0; font-size:11px; color:#9BA1A6;">
+                © VecinUs — Gestión de comunidades de vecinos
+              </p>
+            </td>
+          </tr>
+
+        </table>
+        <!-- /card -->
+
+      </td>
+    </tr>
+  </table>
+  <!-- /wrapper -->
+
+</body>
+</html>"""
+
+
+def _button(url_field: str, label: str) -> str:
+    return f"""              <!-- CTA button -->
+              <table cellpadding="0" cellspacing="0" role="presentation">
+                <tr>
+                  <td style="border-radius:10px;
+                             background: linear-gradient(135deg, {_GREEN} 0%, #2d8f4f 100%);">
+                    <a href="${url_field}"
+                       style="display:inline-block; padding:14px 32px;
+                              font-size:16px; font-weight:700; color:#ffffff;
+                              text-decoration:none; border-radius:10px;
+                              letter-spacing:0.2px;">
+                      {label}
+                    </a>
+                  </td>
+                </tr>
+              </table>
+
+              <!-- fallback link -->
+              <p style="margin:20px 0 0; font-size:12px; color:{_TEXT_MUTED};">
+                Si el botón no funciona, copia este enlace en tu navegador:<br />
+                <a href="${url_field}"
+                   style="color:{_PRIMARY}; word-break:break-all;">${url_field}</a>
+              </p>"""
+
+
+def _heading(text: str) -> str:
+    return f"""              <h1 style="margin:0 0 12px; font-size:22px; font-weight:700;
+                         color:{_TEXT}; line-height:1.3;">
+                {text}
+              </h1>"""
+
+
+def _paragraph(text: str, margin: str = "0 0 8px") -> str:
+    return f"""              <p style="margin:{margin}; font-size:15px; color:{_TEXT_MUTED}; line-height:1.6;">
+                {text}
+              </p>"""
+
+
+def _badge(field: str) -> str:
+    return f"""              <div style="display:inline-block; margin:12px 0 24px;
+                          background:{_BG}; border-left:4px solid {_PRIMARY};
+                          border-radius:6px; padding:10px 18px;">
+                <span style="font-size:16px; font-weight:600; color:{_PRIMARY};">
+                  ${field}
+                </span>
+              </div>"""
+
+
+email_templates = TemplateRegistry()
+
+INVITATION_TEMPLATE = email_templates.register(
+    EmailTemplate(
+        name="invitation",
+        subject="Invitación a VecinUs como $role_label",
+        title="Invitación a VecinUs",
+        html_body="\n\n".join(
+            [
+                _heading("¡Has recibido una invitación!"),
+                _paragraph("Alguien te ha invitado a unirte a su comunidad de vecinos como:"),
+                _badge("role_label"),
+                _paragraph(
+                    "Haz clic en el botón para crear tu cuenta y unirte a la comunidad.\n"
+                    "                Solo te llevará un momento.",
+                    margin="0 0 28px",
+                ),
+                _button("accept_url", "Aceptar invitación"),
+            ]
+        ),
+        text_body=(
+            "¡Has recibido una invitación!\n\n"
+            "Alguien te ha invitado a unirte a su comunidad de vecinos como: $role_label\n\n"
+            "Crea tu cuenta y únete a la comunidad desde este enlace:\n$accept_url\n\n"
+            "Si no esperabas esta invitación, puedes ignorar este email con total seguridad."
+        ),
+        footer=(
+            "Si no esperabas esta invitación, puedes ignorar este email con total seguridad.<br />\n"
+            "                El enlace quedará invalidado en cuanto sea utilizado."
+        ),
+        fixed=("role_label",),
+        slots=("accept_url",),
+    )
+)
@@ -0,0 +1,61 @@
+import threading
+from typing import Iterable
+
+from cachetools import TTLCache
+from supabase import Client
+
+# Cuántos correos se recuerdan y durante cuánto tiempo. Equivocarse solo
+# cambia si se manda o no el correo de invitación, así que basta con minutos.
+ACCOUNT_LOOKUP_CACHE_SIZE = 10000
+ACCOUNT_LOOKUP_CACHE_TTL_SECONDS = 300
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class AccountLookup:
+    """
+    Responde a "¿este correo ya tiene cuenta?" sin listar todos los usuarios.
+
+    La consulta la hace el RPC `registered_emails(p_emails text[])`
+    (migrations/007_invitation_email_lookups.sql), que busca los correos en
+    auth.users por su índice y devuelve los que existen; se llama
+    una vez por lote con todos los correos que no estén ya en la caché.
+    """
+
+    def __init__(self, maxsize: int = ACCOUNT_LOOKUP_CACHE_SIZE, ttl: float = ACCOUNT_LOOKUP_CACHE_TTL_SECONDS):
+        self._accounts: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def registered_emails(self, emails: Iterable[str], supabase_admin: Client) -> set[str]:
+        """Subconjunto (normalizado) de `emails` que ya tiene cuenta."""
+        wanted = {normalize_email(email) for email in emails}
+        with self._lock:
+            known = {email: self._accounts[email] for email in wanted if email in self._accounts}
+
+        missing = sorted(wanted - known.keys())
+        if missing:
+            res = supabase_admin.rpc("registered_emails", {"p_emails": missing}).execute()
+            found = {normalize_email(row["email"] if isinstance(row, dict) else row) for row in res.data or []}
+            with self._lock:
+                for email in missing:
+                    self._accounts[email] = email in found
+                    known[email] = email in found
+
+        return {email for email, registered in known.items() if registered}
+
+    def has_account(self, email: str, supabase_admin: Client) -> bool:
+        return normalize_email(email) in self.registered_emails([email], supabase_admin)
+
+    def mark_registered(self, email: str):
+        """Apunta una cuenta recién creada para no esperar a que caduque la caché."""
+        with self._lock:
+            self._accounts[normalize_email(email)] = True
+
+    def clear(self):
+        with self._lock:
+            self._accounts.clear()
+
+
+account_lookup = AccountLookup()
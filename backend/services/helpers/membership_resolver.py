@@ -0,0 +1,129 @@
+import threading
+from contextvars import ContextVar
+from uuid import UUID
+
+from cachetools import TTLCache
+from postgrest import AsyncPostgrestClient
+from supabase import Client
+
+# Membresías por usuario que se comparten entre peticiones y durante cuánto tiempo.
+# El TTL acota lo que tarda en verse un cambio hecho desde otro worker; en este
+# proceso los cambios se invalidan explícitamente con invalidate_memberships.
+USER_MEMBERSHIP_CACHE_SIZE = 4096
+USER_MEMBERSHIP_CACHE_TTL_SECONDS = 30
+
+MEMBERSHIP_COLUMNS = "id, profile_id, association_id, property_id, role"
+
+# Memo de la petición en curso: user_id -> membresías. Lo crea MembershipScopeMiddleware.
+_request_memberships: ContextVar[dict | None] = ContextVar("request_memberships", default=None)
+
+
+class UserMembershipCache:
+    """Caché en proceso (TTL + LRU) de todas las membresías de cada usuario."""
+
+    def __init__(self, maxsize: int = USER_MEMBERSHIP_CACHE_SIZE, ttl: float = USER_MEMBERSHIP_CACHE_TTL_SECONDS):
+        self._memberships: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> tuple | None:
+        with self._lock:
+            return self._memberships.get(str(user_id))
+
+    def set(self, user_id: str, rows) -> tuple:
+        rows = tuple(rows or [])
+        with self._lock:
+            self._memberships[str(user_id)] = rows
+        return rows
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._memberships.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._memberships.clear()
+
+
+user_memberships = UserMembershipCache()
+
+
+class MembershipScopeMiddleware:
+    """Abre un memo de membresías vacío por petición HTTP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_memberships.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_memberships.reset(token)
+
+
+def _remember(user_id: str, rows: tuple) -> tuple:
+    memo = _request_memberships.get()
+    if memo is not None:
+        memo[user_id] = rows
+    return rows
+
+
+def _recall(user_id: str) -> tuple | None:
+    memo = _request_memberships.get()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    return user_memberships.get(user_id)
+
+
+def get_user_memberships(supabase: Client, user_id: str) -> tuple:
+    """
+    Todas las membresías del usuario, cargadas con una única consulta por
+    petición (y compartidas entre peticiones durante el TTL de la caché).
+    """
+    user_id = str(user_id)
+    rows = _recall(user_id)
+    if rows is None:
+        res = supabase.table("memberships").select(MEMBERSHIP_COLUMNS).eq("profile_id", user_id).execute()
+        rows = user_memberships.set(user_id, res.data)
+    return _remember(user_id, rows)
+
+
+async def get_user_memberships_async(db: AsyncPostgrestClient, user_id: str) -> tuple:
+    """Igual que get_user_memberships, con el cliente PostgREST asíncrono."""
+    user_id = str(user_id)
+    rows = _recall(user_id)
+    if rows is None:
+        res = await db.table("memberships").select(MEMBERSHIP_COLUMNS).eq("profile_id", user_id).execute()
+        rows = user_memberships.set(user_id, res.data)
+    return _remember(user_id, rows)
+
+
+def find_association_membership(rows, association_id: UUID | str) -> dict | None:
+    return next((row for row in rows if str(row.get("association_id")) == str(association_id)), None)
+
+
+def find_property_membership(rows, property_id: UUID | str) -> dict | None:
+    return next((row for row in rows if str(row.get("property_id")) == str(property_id)), None)
+
+
+def get_association_membership(supabase: Client, association_id: UUID | str, user_id: str) -> dict | None:
+    """Membresía del usuario en la comunidad, o None si no pertenece a ella."""
+    return find_association_membership(get_user_memberships(supabase, user_id), association_id)
+
+
+def get_property_membership(supabase: Client, property_id: UUID | str, user_id: str) -> dict | None:
+    """Membresía del usuario ligada a la propiedad, o None."""
+    return find_property_membership(get_user_memberships(supabase, user_id), property_id)
+
+
+def invalidate_memberships(*user_ids: str):
+    """Olvida las membresías cacheadas de los usuarios tras un alta o baja."""
+    memo = _request_memberships.get()
+    for user_id in user_ids:
+        user_memberships.invalidate(str(user_id))
+        if memo is not None:
+            memo.pop(str(user_id), None)
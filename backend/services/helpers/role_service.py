@@ -3,18 +3,13 @@ from uuid import UUID
 from fastapi import HTTPException
 from supabase import Client
 
+from .membership_resolver import get_association_membership
+
 
 def get_user_role(supabase: Client, association_id: UUID, user_id: str) -> str:
-    response = (
-        supabase.table("memberships")
-        .select("role")
-        .eq("association_id", str(association_id))
-        .eq("profile_id", user_id)
-        .limit(1)
-        .execute()
-    )
+    membership = get_association_membership(supabase, association_id, user_id)
 
-    if not response.data:
+    if not membership:
         raise HTTPException(status_code=403, detail="User has no access to this association")
 
-    return response.data[0].get("role")
+    return membership.get("role")
@@ -115,9 +115,17 @@ class MockSupabaseTable:
         self._data = [item for item in self._data if str(item.get(column)) == str(value)]
         return self
 
+    def in_(self, column, values):
+        allowed = {str(value) for value in values}
+        self._data = [item for item in self._data if str(item.get(column)) in allowed]
+        return self
+
     def limit(self, *args, **kwargs):
         return self
 
+    def order(self, *args, **kwargs):
+        return self
+
     def update(self, data, *args, **kwargs):
         self._operation = "update"
         self._updated = []
@@ -171,6 +179,12 @@ class MockSupabaseClient:
         )
         return table
 
+    def rpc(self, name: str, params: dict):
+        self.rpc_calls = getattr(self, "rpc_calls", []) + [(name, params)]
+        response = MagicMock()
+        response.execute.return_value = MagicMock(data=self.mock_responses.get(f"rpc:{name}", []))
+        return response
+
 
 def make_mock_supabase(extra=None, rls_blocked=None):
     base = {
@@ -318,8 +332,6 @@ def test_invite_admin_success():
     app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
 
     admin_mock = make_mock_supabase()
-    admin_mock.auth = MagicMock()
-    admin_mock.auth.admin.list_users = MagicMock(return_value=[])
     app.dependency_overrides[get_supabase_admin] = lambda: admin_mock
 
     try:
@@ -390,8 +402,6 @@ def test_invite_tenant_success():
     app.dependency_overrides[get_supabase] = lambda: make_owner_supabase()
 
     admin_mock = make_owner_supabase()
-    admin_mock.auth = MagicMock()
-    admin_mock.auth.admin.list_users = MagicMock(return_value=[])
     app.dependency_overrides[get_supabase_admin] = lambda: admin_mock
 
     try:
@@ -436,6 +446,164 @@ def test_invite_tenant_not_owner_fails():
         app.dependency_overrides.clear()
 
 
+def test_invite_skips_email_for_registered_account():
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    app.dependency_overrides[get_supabase] = lambda: make_owner_supabase()
+
+    admin_mock = make_owner_supabase()
+    admin_mock.mock_responses["rpc:registered_emails"] = [{"email": "tenant@test.com"}]
+    app.dependency_overrides[get_supabase_admin] = lambda: admin_mock
+
+    try:
+        with patch("api.associations.associations.send_invitation_email") as send_mock:
+            for _ in range(2):
+                response = client.post(
+                    "/invite/tenant",
+                    json={
+                        "association_id": mock_association_id,
+                        "property_id": mock_property_id,
+                        "target_email": "Tenant@test.com",
+                    },
+                )
+                assert response.status_code == 200  # nosec B101
+        send_mock.assert_not_called()
+        # La segunda invitación al mismo correo sale de la caché
+        assert admin_mock.rpc_calls == [("registered_emails", {"p_emails": ["tenant@test.com"]})]  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Test: POST /invite/batch
+# ──────────────────────────────────────────────────────────────────────────────
+
+
+def test_invite_batch_success():
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
+
+    admin_mock = make_mock_supabase()
+    admin_mock.mock_responses["rpc:registered_emails"] = [{"email": "registered@test.com"}]
+    admin_mock.mock_responses["rpc:pending_invitation_emails"] = [{"email": "invited@test.com"}]
+    app.dependency_overrides[get_supabase_admin] = lambda: admin_mock
+
+    try:
+        with patch("api.associations.associations.send_invitation_emails") as send_mock:
+            response = client.post(
+                "/invite/batch",
+                json={
+                    "association_id": mock_association_id,
+                    "invitations": [
+                        {"target_email": "neighbor1@test.com", "role_to_grant": 2, "property_id": mock_property_id},
+                        {"target_email": "registered@test.com", "role_to_grant": 3},
+                        {"target_email": "Neighbor1@test.com", "role_to_grant": 2},
+                        {"target_email": "Invited@Test.com", "role_to_grant": 2},
+                    ],
+                },
+            )
+        assert response.status_code == 200  # nosec B101
+        data = response.json()
+        assert [inv["target_email"] for inv in data["created"]] == [  # nosec B101
+            "neighbor1@test.com",
+            "registered@test.com",
+        ]
+        # Repetido en la petición y con invitación pendiente
+        assert data["skipped"] == ["Neighbor1@test.com", "Invited@Test.com"]  # nosec B101
+        # La invitación pendiente se busca con los correos en minúsculas
+        pending_calls = [params for name, params in admin_mock.rpc_calls if name == "pending_invitation_emails"]
+        assert pending_calls == [  # nosec B101
+            {
+                "p_association_id": mock_association_id,
+                "p_emails": ["invited@test.com", "neighbor1@test.com", "registered@test.com"],
+            }
+        ]
+        assert [name for name, _ in admin_mock.rpc_calls].count("registered_emails") == 1  # nosec B101
+        # Un único encolado con los correos que aún no tienen cuenta
+        queued = send_mock.call_args.args[0]
+        assert [email for email, _, _ in queued] == ["neighbor1@test.com"]  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_invite_batch_cannot_grant_admin_role():
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
+    app.dependency_overrides[get_supabase_admin] = lambda: make_mock_supabase()
+    try:
+        response = client.post(
+            "/invite/batch",
+            json={
+                "association_id": mock_association_id,
+                "invitations": [{"target_email": "newadmin@test.com", "role_to_grant": 1}],
+            },
+        )
+        assert response.status_code == 400  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_invite_batch_non_admin_fails():
+    app.dependency_overrides[get_current_user] = lambda: mock_non_owner
+    app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
+    app.dependency_overrides[get_supabase_admin] = lambda: make_mock_supabase()
+    try:
+        response = client.post(
+            "/invite/batch",
+            json={
+                "association_id": mock_association_id,
+                "invitations": [{"target_email": "someone@test.com", "role_to_grant": 3}],
+            },
+        )
+        assert response.status_code == 403  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_invitation_email_status():
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
+    app.dependency_overrides[get_supabase_admin] = lambda: make_mock_supabase(
+        extra={
+            "email_outbox": [
+                {
+                    "kind": "invitation",
+                    "reference_id": mock_invitation_id,
+                    "status": "pending",
+                    "attempts": 1,
+                    "last_error": "429 rate limited",
+                    "next_attempt_at": "2026-02-22T00:01:00Z",
+                    "sent_at": None,
+                }
+            ]
+        }
+    )
+    try:
+        response = client.get(f"/invitations/{mock_invitation_id}/email-status")
+        assert response.status_code == 200  # nosec B101
+        data = response.json()
+        assert data["status"] == "pending"  # nosec B101
+        assert data["attempts"] == 1  # nosec B101
+        assert data["last_error"] == "429 rate limited"  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_invitation_email_status_not_queued_and_forbidden():
+    app.dependency_overrides[get_current_user] = lambda: mock_user
+    app.dependency_overrides[get_supabase] = lambda: make_mock_supabase()
+    app.dependency_overrides[get_supabase_admin] = lambda: make_mock_supabase()
+    try:
+        response = client.get(f"/invitations/{mock_invitation_id}/email-status")
+        assert response.status_code == 200  # nosec B101
+        assert response.json()["status"] == "not_queued"  # nosec B101
+
+        app.dependency_overrides[get_current_user] = lambda: mock_non_owner
+        response = client.get(f"/invitations/{mock_invitation_id}/email-status")
+        assert response.status_code == 403  # nosec B101
+    finally:
+        app.dependency_overrides.clear()
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Test: POST /auth/accept-invitation
 # ──────────────────────────────────────────────────────────────────────────────
@@ -519,10 +687,14 @@ def test_remove_member_success():
     app.dependency_overrides[get_supabase_admin] = lambda: make_mock_supabase()
 
     try:
-        response = client.delete(f"/members/{mock_membership_id}")
+        with patch("api.associations.associations.run_participant_sync") as mock_sync:
+            response = client.delete(f"/members/{mock_membership_id}")
         assert response.status_code == 200  # nosec B101
         data = response.json()
         assert data["message"] == f"Membership {mock_membership_id} deleted successfully"  # nosec B101
+        # Los canales de grupo se sincronizan en segundo plano
+        mock_sync.assert_called_once()  # nosec B101
+        assert mock_sync.call_args.args[0] == mock_association_id  # nosec B101
     finally:
         app.dependency_overrides.clear()
 
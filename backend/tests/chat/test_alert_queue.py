@@ -0,0 +1,147 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from services.chat.alert_queue import AlertDispatcher
+
+
+def _make_supabase(failures: int = 0):
+    """create_alerts_batch falla `failures` veces y después devuelve las alertas con un id."""
+    supabase = MagicMock()
+    errors = [RuntimeError("503 unavailable")] * failures
+
+    def execute():
+        if errors:
+            raise errors.pop()
+        rows = supabase.rpc.call_args.args[1]["payload"]
+        return MagicMock(data=[{"id": f"a-{row['user_id']}", **row} for row in rows])
+
+    supabase.rpc.return_value.execute.side_effect = execute
+    return supabase
+
+
+def _sent_rows(supabase):
+    return [call.args[1]["payload"] for call in supabase.rpc.call_args_list]
+
+
+@pytest.mark.anyio
+async def test_burst_of_messages_is_coalesced_per_recipient():
+    supabase = _make_supabase()
+    notifier = AsyncMock()
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, notifier=notifier, flush_interval=60)
+
+    dispatcher.enqueue(["u1", "u2"], "c1", "Ana", "Hola", "m1")
+    dispatcher.enqueue(["u1", "u2"], "c1", "Ana", "¿Venís a la junta?", "m2")
+    dispatcher.enqueue(["u1"], "c1", "Luis", "Yo sí", "m3")
+
+    assert await dispatcher.flush() == 2
+    rows = _sent_rows(supabase)
+    assert len(rows) == 1
+    by_user = {row["user_id"]: row for row in rows[0]}
+    assert by_user["u1"] == {
+        "user_id": "u1",
+        "title": "3 mensajes nuevos",
+        "content": "Yo sí",
+        "reference_id": "m3",
+        "message_ids": ["m1", "m2", "m3"],
+    }
+    assert by_user["u2"]["title"] == "2 mensajes nuevos"
+    assert by_user["u2"]["reference_id"] == "m2"
+    assert notifier.await_count == 2
+    await dispatcher.stop()
+
+
+@pytest.mark.anyio
+async def test_each_recipient_is_pushed_the_id_of_its_alert():
+    supabase = _make_supabase()
+    notifier = AsyncMock()
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, notifier=notifier, flush_interval=60)
+
+    dispatcher.enqueue(["u1", "u2"], "c1", "Ana", "Hola", "m1")
+    await dispatcher.flush()
+
+    pushes = {user_ids[0]: event for event, user_ids in (call.args for call in notifier.await_args_list)}
+    assert notifier.await_count == 2
+    assert pushes["u1"] == {
+        "event": "alert_created",
+        "channel_id": "c1",
+        "alert": {"id": "a-u1", "title": "Nuevo mensaje de Ana", "content": "Hola", "reference_id": "m1"},
+    }
+    assert pushes["u2"]["alert"]["id"] == "a-u2"
+    await dispatcher.stop()
+
+
+@pytest.mark.anyio
+async def test_transient_rpc_failures_are_retried():
+    supabase = _make_supabase(failures=2)
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, flush_interval=60)
+    dispatcher.enqueue(["u1"], "c1", "Ana", "Hola", "m1")
+
+    with patch("services.chat.alert_queue.ALERT_RETRY_BASE_DELAY", 0):
+        assert await dispatcher.flush() == 1
+
+    assert supabase.rpc.return_value.execute.call_count == 3
+    await dispatcher.stop()
+
+
+@pytest.mark.anyio
+async def test_edited_and_deleted_messages_update_pending_alerts():
+    supabase = _make_supabase()
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, flush_interval=60)
+    dispatcher.enqueue(["u1"], "c1", "Ana", "Hola", "m1")
+    dispatcher.enqueue(["u1"], "c2", "Ana", "Borrame", "m2")
+
+    assert dispatcher.update_reference("m1", "Hola, editado") == 1
+    assert dispatcher.discard_reference("m2") == 1
+    await dispatcher.flush()
+
+    assert _sent_rows(supabase) == [
+        [
+            {
+                "user_id": "u1",
+                "title": "Nuevo mensaje de Ana",
+                "content": "Hola, editado",
+                "reference_id": "m1",
+                "message_ids": ["m1"],
+            }
+        ]
+    ]
+    await dispatcher.stop()
+
+
+@pytest.mark.anyio
+async def test_deleting_latest_message_keeps_the_coalesced_alert():
+    supabase = _make_supabase()
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, flush_interval=60)
+    dispatcher.enqueue(["u1"], "c1", "Ana", "Hola", "m1")
+    dispatcher.enqueue(["u1"], "c1", "Luis", "Me equivoqué", "m2")
+
+    assert dispatcher.discard_reference("m2") == 1
+    await dispatcher.flush()
+
+    # La alerta sigue existiendo y vuelve a apuntar al mensaje que queda
+    assert _sent_rows(supabase) == [
+        [
+            {
+                "user_id": "u1",
+                "title": "Nuevo mensaje de Ana",
+                "content": "Hola",
+                "reference_id": "m1",
+                "message_ids": ["m1"],
+            }
+        ]
+    ]
+    await dispatcher.stop()
+
+
+@pytest.mark.anyio
+async def test_background_worker_flushes_on_interval():
+    supabase = _make_supabase()
+    dispatcher = AlertDispatcher(client_factory=lambda: supabase, flush_interval=0.01)
+
+    dispatcher.enqueue(["u1"], "c1", "Ana", "Hola", "m1")
+    await asyncio.sleep(0.1)
+
+    assert dispatcher.pending == 0
+    assert len(_sent_rows(supabase)) == 1
+    await dispatcher.stop()
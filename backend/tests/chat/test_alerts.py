@@ -10,6 +10,7 @@ os.environ["SUPABASE_URL"] = "http://localhost:8000"
 os.environ["SUPABASE_KEY"] = "dummy"
 os.environ["SUPABASE_SERVICE_KEY"] = "dummy"
 
+from api.chat.chat_helpers import encode_keyset_cursor  # noqa: E402
 from core.deps import get_current_user, get_supabase  # noqa: E402
 from main import app  # noqa: E402
 
@@ -24,52 +25,107 @@ mock_alert_id = str(uuid4())
 
 
 class MockSupabaseTableAlerts:
-    def __init__(self, table_name, data):
+    def __init__(self, table_name, data, calls):
         self.table_name = table_name
         self._data = data
+        self._rows = list(data)
+        self._calls = calls
+        self._operation = "select"
+        self._count = None
+        self._limit = None
+        self._orders = []
 
     def select(self, *args, **kwargs):
         self._operation = "select"
+        self._count = kwargs.get("count")
+        self._calls.append(("select", kwargs))
         return self
 
     def update(self, payload, *args, **kwargs):
         self._operation = "update"
         self._payload = payload
+        self._count = kwargs.get("count")
+        return self
+
+    def eq(self, column, value):
+        self._rows = [row for row in self._rows if str(row.get(column)) == str(value)]
+        return self
+
+    def in_(self, column, values):
+        self._rows = [row for row in self._rows if str(row.get(column)) in {str(v) for v in values}]
         return self
 
-    def eq(self, *args, **kwargs):
+    def lte(self, column, value):
+        self._rows = [row for row in self._rows if row.get(column) <= value]
         return self
 
-    def order(self, *args, **kwargs):
+    def or_(self, filters):
+        self._calls.append(("or", filters))
+        return self
+
+    def order(self, column, desc=False):
+        self._orders.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self._limit = size
         return self
 
     def execute(self):
         class MockResponse:
-            def __init__(self, data):
+            def __init__(self, data, count=None):
                 self.data = data
+                self.count = count
 
         if self._operation == "update":
-            # Just create a fake updated alert object
-            updated_alert = {**self._data[0], **self._payload} if self._data else {}
-            return MockResponse([updated_alert])
-        return MockResponse(self._data)
+            for row in self._rows:
+                row.update(self._payload)
+            return MockResponse([dict(row) for row in self._rows], len(self._rows) if self._count else None)
+
+        # Ordenaciones encadenadas: la primera es la principal
+        for column, desc in reversed(self._orders):
+            self._rows.sort(key=lambda row: row.get(column), reverse=desc)
+        rows = self._rows[: self._limit] if self._limit is not None else self._rows
+        return MockResponse(rows, len(self._rows) if self._count else None)
 
 
 class MockSupabaseClientAlerts:
+    def __init__(self):
+        self.calls = []
+        self.alerts = [
+            {
+                "id": mock_alert_id,
+                "user_id": mock_user["id"],
+                "title": "Aviso comunidad",
+                "content": "Agua cortada",
+                "is_read": False,
+                "created_at": "2026-02-22T00:00:00Z",
+            },
+            {
+                "id": str(uuid4()),
+                "user_id": mock_user["id"],
+                "title": "Reunión",
+                "content": "Junta el lunes",
+                "is_read": False,
+                "created_at": "2026-02-23T00:00:00Z",
+            },
+            {
+                "id": str(uuid4()),
+                "user_id": str(uuid4()),
+                "title": "Otro usuario",
+                "content": "No visible",
+                "is_read": False,
+                "created_at": "2026-02-24T00:00:00Z",
+            },
+        ]
+
     def table(self, name: str):
         if name == "alerts":
-            data = [
-                {
-                    "id": mock_alert_id,
-                    "user_id": mock_user["id"],
-                    "title": "Aviso comunidad",
-                    "content": "Agua cortada",
-                    "is_read": False,
-                    "created_at": "2026-02-22T00:00:00Z",
-                }
-            ]
-            return MockSupabaseTableAlerts(name, data)
-        return MockSupabaseTableAlerts(name, [])
+            return MockSupabaseTableAlerts(name, self.alerts, self.calls)
+        return MockSupabaseTableAlerts(name, [], self.calls)
+
+
+mock_supabase = MockSupabaseClientAlerts()
 
 
 def override_get_current_user():
@@ -77,11 +133,13 @@ def override_get_current_user():
 
 
 def override_get_supabase():
-    return MockSupabaseClientAlerts()
+    return mock_supabase
 
 
 @pytest.fixture(autouse=True)
 def setup_overrides():
+    global mock_supabase
+    mock_supabase = MockSupabaseClientAlerts()
     app.dependency_overrides[get_current_user] = override_get_current_user
     app.dependency_overrides[get_supabase] = override_get_supabase
 
@@ -100,9 +158,44 @@ def test_get_alerts():
     response = client.get("/alerts")
     assert response.status_code == 200
     data = response.json()
-    assert isinstance(data, list)
-    assert len(data) == 1
-    assert data[0]["title"] == "Aviso comunidad"
+    assert len(data["alerts"]) == 2
+    assert data["alerts"][0]["title"] == "Reunión"
+    assert data["alerts"][1]["title"] == "Aviso comunidad"
+    assert data["has_more"] is False
+    assert data["next_cursor"] is None
+
+
+def test_get_alerts_paginates_with_cursor():
+    response = client.get("/alerts?limit=1")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["alerts"]) == 1
+    assert data["has_more"] is True
+    assert data["next_cursor"] == encode_keyset_cursor(data["alerts"][0])
+
+    response = client.get(f"/alerts?limit=1&before={data['next_cursor']}")
+    assert response.status_code == 200
+    assert any(call[0] == "or" for call in mock_supabase.calls)
+
+
+def test_get_alerts_invalid_cursor():
+    response = client.get("/alerts?before=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid alert cursor"
+
+
+def test_unread_count_uses_a_head_count_query():
+    response = client.get("/alerts/unread-count")
+    assert response.status_code == 200
+    assert response.json()["unread_count"] == 2
+
+    # Cada lectura va a la base de datos: un COUNT sin traer filas
+    mock_supabase.alerts[0]["is_read"] = True
+    response = client.get("/alerts/unread-count")
+    assert response.json()["unread_count"] == 1
+    count_queries = [call for call in mock_supabase.calls if call[0] == "select" and call[1].get("count")]
+    assert len(count_queries) == 2
+    assert all(call[1].get("head") for call in count_queries)
 
 
 def test_mark_alert_read():
@@ -111,3 +204,33 @@ def test_mark_alert_read():
     data = response.json()
     assert data["id"] == mock_alert_id
     assert data["is_read"] is True
+
+    assert client.get("/alerts/unread-count").json()["unread_count"] == 1
+
+
+def test_mark_alert_read_not_found():
+    response = client.put(f"/alerts/{uuid4()}/read")
+    assert response.status_code == 404
+
+
+def test_mark_selected_alerts_read():
+    assert client.get("/alerts/unread-count").json()["unread_count"] == 2
+
+    response = client.put("/alerts/read", json={"alert_ids": [mock_alert_id]})
+    assert response.status_code == 200
+    assert response.json() == {"updated": 1, "unread_count": 1}
+
+
+def test_mark_all_alerts_read():
+    response = client.put("/alerts/read", json={})
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2, "unread_count": 0}
+    assert all(alert["is_read"] for alert in mock_supabase.alerts if alert["user_id"] == mock_user["id"])
+    # El usuario ajeno conserva su alerta sin leer
+    assert any(not alert["is_read"] for alert in mock_supabase.alerts)
+
+
+def test_mark_alerts_read_empty_list_is_noop():
+    response = client.put("/alerts/read", json={"alert_ids": []})
+    assert response.status_code == 200
+    assert response.json() == {"updated": 0, "unread_count": 2}
@@ -0,0 +1,152 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from services.chat.backplane import InProcessBackplane, RealtimeBackplane, build_backplane
+from services.chat.connection_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        return None
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+
+# Stand-in local del broker de Supabase Realtime: reparte los broadcasts
+# entre los canales suscritos al mismo topic, igual que el servidor real.
+class FakeRealtimeHub:
+    def __init__(self):
+        self.channels = []
+
+    def client(self):
+        return FakeRealtimeClient(self)
+
+
+class FakeRealtimeClient:
+    def __init__(self, hub):
+        self.hub = hub
+        self.connected = False
+
+    async def connect(self):
+        self.connected = True
+
+    async def close(self):
+        self.connected = False
+
+    def channel(self, topic, params=None):
+        channel = FakeRealtimeChannel(self.hub, topic, params or {})
+        self.hub.channels.append(channel)
+        return channel
+
+
+class FakeRealtimeChannel:
+    def __init__(self, hub, topic, params):
+        self.hub = hub
+        self.topic = topic
+        self.params = params
+        self.receive_self = params.get("config", {}).get("broadcast", {}).get("self", False)
+        self.callbacks = []
+        self.subscribed = False
+
+    def on_broadcast(self, event, callback):
+        self.callbacks.append((event, callback))
+        return self
+
+    async def subscribe(self):
+        self.subscribed = True
+        return self
+
+    async def send_broadcast(self, event, data):
+        for channel in self.hub.channels:
+            if channel.topic != self.topic or not channel.subscribed:
+                continue
+            if channel is self and not self.receive_self:
+                continue
+            for callback_event, callback in channel.callbacks:
+                if callback_event == event:
+                    callback({"event": event, "payload": data})
+
+
+@pytest.mark.anyio
+async def test_in_process_backplane_delivers_to_local_sockets():
+    manager = ConnectionManager(InProcessBackplane())
+    channel_id = str(uuid4())
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, channel_id)
+
+    await manager.broadcast({"content": "Hola", "channel_id": uuid4()}, channel_id)
+    # El envío lo hace la tarea escritora de la conexión
+    await asyncio.sleep(0.01)
+
+    assert len(websocket.sent) == 1
+    assert '"content": "Hola"' in websocket.sent[0]
+
+
+@pytest.mark.anyio
+async def test_realtime_backplane_fans_out_between_workers():
+    hub = FakeRealtimeHub()
+    worker_a = ConnectionManager(RealtimeBackplane(client_factory=hub.client))
+    worker_b = ConnectionManager(RealtimeBackplane(client_factory=hub.client))
+    channel_id = str(uuid4())
+
+    socket_a = FakeWebSocket()
+    socket_b = FakeWebSocket()
+    await worker_a.connect(socket_a, channel_id)
+    await worker_b.connect(socket_b, channel_id)
+
+    await worker_a.broadcast({"content": "Corte de agua"}, channel_id)
+    # La entrega remota se programa como tarea en el event loop
+    await asyncio.sleep(0.01)
+
+    # Cada socket recibe el mensaje exactamente una vez, esté en el worker que sea
+    assert len(socket_a.sent) == 1
+    assert len(socket_b.sent) == 1
+    assert "Corte de agua" in socket_b.sent[0]
+
+    await worker_a.stop()
+    await worker_b.stop()
+
+
+@pytest.mark.anyio
+async def test_realtime_backplane_ignores_own_messages_echoed_by_broker():
+    hub = FakeRealtimeHub()
+    backplane = RealtimeBackplane(client_factory=hub.client)
+    delivered = []
+
+    async def deliver(message, channel_id):
+        delivered.append((message, channel_id))
+
+    await backplane.start(deliver)
+    backplane._on_broadcast(
+        {"event": "message", "payload": {"channel_ids": ["c1"], "message": {}, "origin": backplane.node_id}}
+    )
+    await asyncio.sleep(0)
+
+    assert delivered == []
+
+
+@pytest.mark.anyio
+async def test_realtime_backplane_joins_a_private_channel():
+    hub = FakeRealtimeHub()
+    backplane = RealtimeBackplane(client_factory=hub.client)
+
+    async def deliver(message, channel_id):
+        return {"delivered": 0, "dropped": 0}
+
+    await backplane.start(deliver)
+
+    [channel] = hub.channels
+    assert channel.topic == "chat-fanout"  # nosec B101
+    assert channel.params["config"]["private"] is True  # nosec B101
+    await backplane.stop()
+
+
+def test_build_backplane_defaults_to_in_process():
+    assert isinstance(build_backplane("memory"), InProcessBackplane)
+    assert isinstance(build_backplane("unknown"), InProcessBackplane)
+    assert isinstance(build_backplane("realtime"), RealtimeBackplane)
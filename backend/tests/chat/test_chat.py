@@ -1,19 +1,32 @@
 import os
-from unittest.mock import patch
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4
 
+import jwt
 import pytest
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 
 # Set dummy env vars for pydantic settings before importing app
 os.environ["SUPABASE_URL"] = "http://localhost:8000"
 os.environ["SUPABASE_KEY"] = "dummy"
 
-from core.deps import get_current_user, get_supabase  # noqa: E402
+from api.chat.chat_helpers import (  # noqa: E402
+    decode_message_cursor,
+    direct_message_key,
+    encode_message_cursor,
+)
+from core.deps import get_async_db, get_current_user, get_supabase  # noqa: E402
+from core.jwt_verifier import JWKSUnavailable, token_verifier  # noqa: E402
 from main import app  # noqa: E402
+from services.chat.connection_manager import manager, user_channel  # noqa: E402
+from services.chat.membership_cache import channel_members  # noqa: E402
 
 client = TestClient(app)
 
+TEST_JWT_SECRET = "test-jwt-secret"
+
 # Mocked user data
 mock_user = {
     "id": str(uuid4()),
@@ -56,6 +69,16 @@ class MockSupabaseTable:
         self._inserted = inserted_rows
         return self
 
+    def upsert(self, row, on_conflict=None, ignore_duplicates=False, **kwargs):
+        # Con ignore_duplicates, un conflicto no devuelve filas (como PostgREST)
+        if ignore_duplicates and any(
+            str(item.get(on_conflict)) == str(row.get(on_conflict)) for item in self._all_data
+        ):
+            self._operation = "insert"
+            self._inserted = []
+            return self
+        return self.insert(row)
+
     def eq(self, column, value, **kwargs):
         # Apply simple filtering
         self._data = [item for item in self._data if str(item.get(column)) == str(value)]
@@ -66,7 +89,22 @@ class MockSupabaseTable:
         self._data = [item for item in self._data if str(item.get(column)) in string_values]
         return self
 
-    def order(self, *args, **kwargs):
+    def gt(self, column, value, **kwargs):
+        self._data = [item for item in self._data if item.get(column) > value]
+        return self
+
+    def or_(self, filters, **kwargs):
+        self._or_filters = filters
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self._order_by = getattr(self, "_order_by", []) + [(column, desc)]
+        return self
+
+    def limit(self, count, **kwargs):
+        for column, desc in reversed(getattr(self, "_order_by", [])):
+            self._data = sorted(self._data, key=lambda item: str(item.get(column)), reverse=desc)
+        self._data = self._data[:count]
         return self
 
     def update(self, *args, **kwargs):
@@ -105,18 +143,22 @@ class MockSupabaseTable:
 class MockSupabaseClient:
     def __init__(self, mock_responses):
         self.mock_responses = mock_responses
+        self.rpc_calls = []
 
     def table(self, name: str):
         return MockSupabaseTable(name, self.mock_responses.get(name, []))
 
     def rpc(self, name: str, params: dict):
+        self.rpc_calls.append((name, params))
+        data = self.mock_responses.get(f"rpc:{name}", [])
+
         class MockRPC:
             def execute(self):
                 class MockResponse:
                     def __init__(self, data):
                         self.data = data
 
-                return MockResponse([])
+                return MockResponse(data)
 
         return MockRPC()
 
@@ -131,6 +173,8 @@ mock_association_id = str(uuid4())
 mock_dm_channel_id = str(uuid4())
 mock_target_user_id = str(uuid4())
 
+mock_alert_dispatcher = MagicMock()
+
 # Add new mock IDs for testing unblock
 mock_dm_blocked_by_me = str(uuid4())
 mock_dm_blocked_by_other = str(uuid4())
@@ -222,17 +266,30 @@ def override_get_supabase():
 
 
 @pytest.fixture(autouse=True)
-def setup_overrides():
+def setup_overrides(async_mock_db):
+    channel_members.clear()
     app.dependency_overrides[get_current_user] = override_get_current_user
     app.dependency_overrides[get_supabase] = override_get_supabase
+    # Las rutas async usan el cliente asíncrono sobre los mismos datos del mock
+    app.dependency_overrides[get_async_db] = lambda: async_mock_db(app.dependency_overrides[get_supabase]())
 
     # Patch create_client directly where it is used in the chat router
     patcher = patch("api.chat.chat.create_client")
     mock_create_client = patcher.start()
     mock_create_client.return_value = override_get_supabase()
 
+    # Las alertas se crean en segundo plano; aquí solo comprobamos qué se encola
+    mock_alert_dispatcher.reset_mock()
+    dispatcher_patcher = patch("api.chat.chat.alert_dispatcher", mock_alert_dispatcher)
+    dispatcher_patcher.start()
+    secret_patcher = patch.object(token_verifier, "jwt_secret", TEST_JWT_SECRET)
+    secret_patcher.start()
+
     yield
 
+    secret_patcher.stop()
+    token_verifier.clear()
+    dispatcher_patcher.stop()
     patcher.stop()
     app.dependency_overrides.clear()
 
@@ -249,13 +306,244 @@ def test_get_channels():
     pass  # we handled this mostly.
 
 
+def test_sync_channel_returns_changes_since_high_water_mark():
+    kept_id, edited_id, deleted_id = str(uuid4()), str(uuid4()), str(uuid4())
+
+    def message(message_id, content):
+        return {
+            "id": message_id,
+            "channel_id": mock_channel_id,
+            "sender_id": mock_user["id"],
+            "content": content,
+            "created_at": "2026-02-22T00:00:00Z",
+            "sender": mock_user,
+        }
+
+    responses = override_get_supabase().mock_responses
+    responses["messages"] = [message(kept_id, "Antiguo"), message(edited_id, "Editado")]
+    responses["message_changes"] = [
+        {"id": 1, "channel_id": mock_channel_id, "message_id": kept_id, "change_type": "created"},
+        {"id": 2, "channel_id": mock_channel_id, "message_id": edited_id, "change_type": "created"},
+        {"id": 3, "channel_id": mock_channel_id, "message_id": deleted_id, "change_type": "created"},
+        {"id": 4, "channel_id": mock_channel_id, "message_id": edited_id, "change_type": "edited"},
+        {"id": 5, "channel_id": mock_channel_id, "message_id": deleted_id, "change_type": "deleted"},
+        {"id": 6, "channel_id": str(uuid4()), "message_id": str(uuid4()), "change_type": "created"},
+    ]
+    app.dependency_overrides[get_supabase] = lambda: MockSupabaseClient(responses)
+
+    response = client.get(f"/chat/channels/{mock_channel_id}/sync?since=1")
+    assert response.status_code == 200
+    data = response.json()
+    assert [m["content"] for m in data["messages"]] == ["Editado"]
+    assert data["deleted_ids"] == [deleted_id]
+    assert data["high_water_mark"] == 5
+    assert data["has_more"] is False
+
+    response = client.get(f"/chat/channels/{mock_channel_id}/sync?since=1&limit=2")
+    data = response.json()
+    assert data["high_water_mark"] == 3
+    assert data["has_more"] is True
+
+    response = client.get(f"/chat/channels/{mock_channel_id}/sync?since=5")
+    data = response.json()
+    assert data == {"messages": [], "deleted_ids": [], "high_water_mark": 5, "has_more": False}
+
+
+def test_sync_channel_without_access():
+    response = client.get(f"/chat/channels/{uuid4()}/sync?since=0")
+    assert response.status_code == 403
+
+
+def test_get_inbox_uses_single_rpc():
+    inbox_row = {
+        "id": mock_channel_id,
+        "association_id": mock_association_id,
+        "name": "General",
+        "is_direct_message": False,
+        "is_blocked": False,
+        "blocked_by": None,
+        "created_by": mock_user["id"],
+        "last_message": {
+            "id": str(uuid4()),
+            "channel_id": mock_channel_id,
+            "sender_id": mock_target_user_id,
+            "content": "Hola",
+            "created_at": "2026-02-23T00:00:00Z",
+            "sender": {"id": mock_target_user_id, "username": "vecino"},
+        },
+        "unread_count": 3,
+        "participant_count": 2,
+        "last_read_at": "2026-02-22T00:00:00Z",
+    }
+    supabase = MockSupabaseClient({"rpc:get_user_inbox": [inbox_row]})
+    app.dependency_overrides[get_supabase] = lambda: supabase
+
+    response = client.get("/chat/inbox")
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["last_message"]["sender"]["username"] == "vecino"
+    assert data[0]["unread_count"] == 3
+    assert data[0]["participant_count"] == 2
+    assert supabase.rpc_calls == [("get_user_inbox", {"p_user_id": mock_user["id"]})]
+
+
+def _search_hit(content, rank):
+    return {
+        "id": str(uuid4()),
+        "channel_id": mock_channel_id,
+        "sender_id": mock_user["id"],
+        "content": content,
+        "created_at": "2026-02-22T00:00:00Z",
+        "sender": mock_user,
+        "rank": rank,
+        "snippet": content.replace("piscina", "<b>piscina</b>"),
+    }
+
+
+def test_search_messages_paginates_ranked_results():
+    hits = [_search_hit("La piscina abre", 0.9), _search_hit("Piscina cerrada", 0.5), _search_hit("piscina", 0.1)]
+    supabase = MockSupabaseClient({"rpc:search_messages": hits})
+    app.dependency_overrides[get_supabase] = lambda: supabase
+
+    response = client.get("/chat/search?q=piscina&limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert [hit["rank"] for hit in data["results"]] == [0.9, 0.5]
+    assert "<b>piscina</b>" in data["results"][0]["snippet"]
+    assert data["has_more"] is True
+    assert data["next_offset"] == 2
+
+    name, params = supabase.rpc_calls[0]
+    assert name == "search_messages"
+    assert params == {
+        "p_user_id": mock_user["id"],
+        "p_query": "piscina",
+        "p_channel_id": None,
+        "p_limit": 3,
+        "p_offset": 0,
+    }
+
+
+def test_search_messages_in_foreign_channel_is_forbidden():
+    response = client.get(f"/chat/search?q=piscina&channel_id={uuid4()}")
+    assert response.status_code == 403
+
+
+def test_search_messages_rejects_blank_query():
+    response = client.get("/chat/search?q=%20%20%20")
+    assert response.status_code == 400
+
+
+def test_mark_channel_read():
+    response = client.put(f"/chat/channels/{mock_channel_id}/read")
+    assert response.status_code == 204
+
+
+def test_edit_message_of_another_user_is_forbidden():
+    message_id = str(uuid4())
+    supabase = override_get_supabase()
+    supabase.mock_responses["messages"] = [
+        {"id": message_id, "channel_id": mock_channel_id, "sender_id": mock_target_user_id, "content": "Hola"}
+    ]
+    app.dependency_overrides[get_supabase] = lambda: supabase
+
+    response = client.put(f"/chat/channels/{mock_channel_id}/messages/{message_id}", json={"content": "Cambiado"})
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Not authorized to perform this action on this message"
+
+
+def test_message_events_carry_the_sequence_written_by_the_trigger():
+    message_id = str(uuid4())
+    saved = {
+        "id": message_id,
+        "channel_id": mock_channel_id,
+        "sender_id": mock_user["id"],
+        "content": "Hola",
+        "created_at": "2026-02-22T00:00:00Z",
+        "change_seq": 41,
+    }
+    supabase = override_get_supabase()
+    supabase.mock_responses["messages"] = [saved]
+    supabase.mock_responses["message_changes"] = [
+        {"id": 41, "message_id": message_id, "change_type": "created"},
+        {"id": 42, "message_id": message_id, "change_type": "deleted"},
+    ]
+    app.dependency_overrides[get_supabase] = lambda: supabase
+
+    with (
+        patch("api.chat.chat.ChatRepository.insert_message", AsyncMock(return_value=saved)),
+        patch("api.chat.chat.manager.broadcast", AsyncMock()) as broadcast,
+    ):
+        response = client.post(
+            f"/chat/channels/{mock_channel_id}/messages", json={"channel_id": mock_channel_id, "content": "Hola"}
+        )
+        assert response.status_code == 200
+        assert broadcast.await_args_list[-1].args[0]["seq"] == 41
+
+        response = client.delete(f"/chat/channels/{mock_channel_id}/messages/{message_id}")
+        assert response.status_code == 204
+        assert broadcast.await_args_list[-1].args[0]["seq"] == 42
+        assert ("discard_alert_message", {"p_message_id": message_id}) in supabase.rpc_calls
+
+
+def test_mark_channel_read_without_access():
+    response = client.put(f"/chat/channels/{uuid4()}/read")
+    assert response.status_code == 403
+
+
 def test_get_channel_messages():
     response = client.get(f"/chat/channels/{mock_channel_id}/messages")
     assert response.status_code == 200
     data = response.json()
-    assert isinstance(data, list)
-    assert len(data) == 1
-    assert data[0]["content"] == "Hello"
+    assert isinstance(data["messages"], list)
+    assert len(data["messages"]) == 1
+    assert data["messages"][0]["content"] == "Hello"
+    assert data["has_more"] is False
+    assert data["next_cursor"] is None
+
+
+def test_get_channel_messages_returns_cursor_for_older_pages():
+    messages = [
+        {
+            "id": str(uuid4()),
+            "channel_id": mock_channel_id,
+            "sender_id": mock_user["id"],
+            "content": f"Mensaje {i}",
+            "created_at": f"2026-02-22T00:00:0{i}Z",
+            "sender": mock_user,
+        }
+        for i in range(3)
+    ]
+    app.dependency_overrides[get_supabase] = lambda: MockSupabaseClient(
+        {
+            "channel_participants": [{"channel_id": mock_channel_id, "user_id": mock_user["id"]}],
+            "messages": messages,
+        }
+    )
+
+    response = client.get(f"/chat/channels/{mock_channel_id}/messages?limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    # La página más reciente, en orden ascendente
+    assert [m["content"] for m in data["messages"]] == ["Mensaje 1", "Mensaje 2"]
+    assert data["has_more"] is True
+
+    created_at, message_id = decode_message_cursor(data["next_cursor"])
+    assert created_at == messages[1]["created_at"]
+    assert message_id == messages[1]["id"]
+
+
+def test_get_channel_messages_invalid_cursor():
+    response = client.get(f"/chat/channels/{mock_channel_id}/messages?before=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid message cursor"
+
+
+def test_get_channel_messages_before_and_after_rejected():
+    cursor = encode_message_cursor({"created_at": "2026-02-22T00:00:00Z", "id": str(uuid4())})
+    response = client.get(f"/chat/channels/{mock_channel_id}/messages?before={cursor}&after={cursor}")
+    assert response.status_code == 400
 
 
 def test_send_message():
@@ -283,6 +571,103 @@ def test_create_direct_message():
     assert "id" in data
 
 
+def _direct_message_client(existing_channel=None):
+    responses = override_get_supabase().mock_responses
+    if existing_channel:
+        responses["chat_channels"] = responses["chat_channels"] + [existing_channel]
+    return MockSupabaseClient(responses)
+
+
+def test_direct_message_key_is_order_independent():
+    assert direct_message_key("a", "u1", "u2") == direct_message_key("a", "u2", "u1")
+    assert direct_message_key("a", "u1", "u2") != direct_message_key("b", "u1", "u2")
+
+
+def test_create_direct_message_returns_existing_by_key():
+    existing_dm_id = str(uuid4())
+    existing = {
+        "id": existing_dm_id,
+        "association_id": mock_association_id,
+        "name": None,
+        "is_direct_message": True,
+        "is_blocked": False,
+        "blocked_by": None,
+        "created_by": mock_target_user_id,
+        "dm_key": direct_message_key(mock_association_id, mock_target_user_id, mock_user["id"]),
+    }
+    app.dependency_overrides[get_supabase] = lambda: _direct_message_client(existing)
+
+    response = client.post(
+        f"/chat/channels/{mock_channel_id}/direct",
+        json={"target_user_id": mock_target_user_id},
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == existing_dm_id
+
+
+def test_create_direct_message_existing_blocked():
+    existing = {
+        "id": str(uuid4()),
+        "association_id": mock_association_id,
+        "name": None,
+        "is_direct_message": True,
+        "is_blocked": True,
+        "blocked_by": mock_target_user_id,
+        "created_by": mock_target_user_id,
+        "dm_key": direct_message_key(mock_association_id, mock_user["id"], mock_target_user_id),
+    }
+    app.dependency_overrides[get_supabase] = lambda: _direct_message_client(existing)
+
+    response = client.post(
+        f"/chat/channels/{mock_channel_id}/direct",
+        json={"target_user_id": mock_target_user_id},
+    )
+    assert response.status_code == 403
+
+
+def test_create_direct_message_concurrent_insert_returns_winner():
+    winner_id = str(uuid4())
+    winner = {
+        "id": winner_id,
+        "association_id": mock_association_id,
+        "name": None,
+        "is_direct_message": True,
+        "is_blocked": False,
+        "blocked_by": None,
+        "created_by": mock_target_user_id,
+        "dm_key": direct_message_key(mock_association_id, mock_user["id"], mock_target_user_id),
+    }
+    supabase = _direct_message_client(winner)
+    lookups = []
+    original_table = supabase.table
+
+    def racing_table(name):
+        table = original_table(name)
+        if name == "chat_channels":
+            original_eq = table.eq
+
+            def eq(column, value, **kwargs):
+                # La primera búsqueda por dm_key llega antes de que el otro vecino inserte
+                if column == "dm_key" and not lookups:
+                    lookups.append(value)
+                    table._data = []
+                    return table
+                return original_eq(column, value, **kwargs)
+
+            table.eq = eq
+        return table
+
+    supabase.table = racing_table
+    app.dependency_overrides[get_supabase] = lambda: supabase
+
+    response = client.post(
+        f"/chat/channels/{mock_channel_id}/direct",
+        json={"target_user_id": mock_target_user_id},
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == winner_id
+
+
 def test_block_direct_message():
     # Make sure we use the ID of the DM channel we mocked
     response = client.post(f"/chat/channels/{mock_dm_channel_id}/block")
@@ -402,3 +787,95 @@ def test_delete_group_channel_not_admin():
     assert response.status_code == 403
 
     app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def _make_token(user_id: str, secret: str = TEST_JWT_SECRET, expires_in: int = 3600) -> str:
+    claims = {"sub": user_id, "role": "authenticated", "aud": "authenticated", "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def test_send_message_queues_alerts_in_background():
+    new_msg = {"channel_id": mock_channel_id, "content": "Aviso importante"}
+    response = client.post(f"/chat/channels/{mock_channel_id}/messages", json=new_msg)
+
+    assert response.status_code == 200
+    recipients, channel_id, sender_name, preview, reference_id = mock_alert_dispatcher.enqueue.call_args.args
+    # El remitente no recibe su propia alerta
+    assert recipients == [mock_target_user_id]
+    assert channel_id == mock_channel_id
+    assert preview == "Aviso importante"
+    assert reference_id == response.json()["id"]
+
+
+def test_user_websocket_subscribe_and_unsubscribe(async_mock_db):
+    with patch("api.chat.chat.create_async_user_db", return_value=async_mock_db(override_get_supabase())):
+        with client.websocket_connect(f"/chat/ws?token={_make_token(mock_user['id'])}") as websocket:
+            websocket.send_json({"action": "subscribe", "channel_id": mock_channel_id})
+            assert websocket.receive_json() == {"event": "subscribed", "channel_id": mock_channel_id}
+
+            websocket.send_json({"action": "unsubscribe", "channel_id": mock_channel_id})
+            assert websocket.receive_json() == {"event": "unsubscribed", "channel_id": mock_channel_id}
+
+
+def test_user_websocket_rejects_channels_without_access(async_mock_db):
+    foreign_channel_id = str(uuid4())
+    with patch("api.chat.chat.create_async_user_db", return_value=async_mock_db(override_get_supabase())):
+        with client.websocket_connect(f"/chat/ws?token={_make_token(mock_user['id'])}") as websocket:
+            websocket.send_json({"action": "subscribe", "channel_id": foreign_channel_id})
+            reply = websocket.receive_json()
+
+    assert reply["event"] == "error"
+    assert reply["channel_id"] == foreign_channel_id
+    assert reply["detail"] == "Access denied to this channel"
+
+
+def test_user_websocket_unregisters_connection_on_unexpected_error(async_mock_db):
+    failing_check = patch(
+        "api.chat.chat.ChatRepository.verify_channel_access", side_effect=RuntimeError("database unavailable")
+    )
+    with patch("api.chat.chat.create_async_user_db", return_value=async_mock_db(override_get_supabase())):
+        with failing_check, pytest.raises(RuntimeError):
+            with client.websocket_connect(f"/chat/ws?token={_make_token(mock_user['id'])}") as websocket:
+                websocket.send_json({"action": "subscribe", "channel_id": mock_channel_id})
+                websocket.receive_json()
+
+    assert user_channel(mock_user["id"]) not in manager.active_connections
+
+
+def test_user_websocket_is_closed_when_the_token_expires(async_mock_db):
+    token = _make_token(mock_user["id"], expires_in=1)
+    with patch("api.chat.chat.create_async_user_db", return_value=async_mock_db(override_get_supabase())):
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(f"/chat/ws?token={token}") as websocket:
+                websocket.send_json({"action": "subscribe", "channel_id": mock_channel_id})
+                assert websocket.receive_json() == {"event": "subscribed", "channel_id": mock_channel_id}
+                websocket.receive_json()
+
+    assert exc_info.value.code == 4001
+    assert user_channel(mock_user["id"]) not in manager.active_connections
+
+
+def test_user_websocket_requires_valid_token():
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/chat/ws?token=invalid") as websocket:
+            websocket.receive_json()
+
+    assert exc_info.value.code == 1008
+
+
+def test_user_websocket_asks_to_retry_when_the_jwks_is_unavailable():
+    with patch.object(token_verifier, "verify", side_effect=JWKSUnavailable("auth unreachable")):
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(f"/chat/ws?token={_make_token(mock_user['id'])}") as websocket:
+                websocket.receive_json()
+
+    assert exc_info.value.code == 1013
+
+
+def test_user_websocket_rejects_forged_signature():
+    forged = _make_token(mock_user["id"], secret="not-the-project-secret")
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect(f"/chat/ws?token={forged}") as websocket:
+            websocket.receive_json()
+
+    assert exc_info.value.code == 1008
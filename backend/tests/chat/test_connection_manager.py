@@ -0,0 +1,228 @@
+import asyncio
+import json
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from services.chat.backplane import InProcessBackplane
+from services.chat.connection_manager import ConnectionManager
+from services.chat.send_queue import CLOSE_CODE_TRY_AGAIN_LATER, BackpressurePolicy
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0, error: Exception | None = None):
+        self.delay = delay
+        self.error = error
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        return None
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+def _connections(manager, channel_id):
+    return {connection.websocket for connection in manager.active_connections.get(channel_id, ())}
+
+
+@pytest.mark.anyio
+async def test_dead_socket_is_evicted_without_affecting_others():
+    manager = ConnectionManager(InProcessBackplane())
+    channel_id = str(uuid4())
+    healthy = FakeWebSocket()
+    dead = FakeWebSocket(error=RuntimeError("socket closed"))
+    await manager.connect(healthy, channel_id)
+    await manager.connect(dead, channel_id)
+
+    result = await manager.broadcast({"content": "Hola"}, channel_id)
+    await asyncio.sleep(0.01)
+
+    assert result == {"delivered": 2, "dropped": 0}
+    assert len(healthy.sent) == 1
+    # El socket caído se expulsa del canal y no vuelve a recibir nada
+    assert dead.closed_with == 1000
+    assert _connections(manager, channel_id) == {healthy}
+
+
+@pytest.mark.anyio
+async def test_slow_socket_does_not_stall_the_channel():
+    manager = ConnectionManager(InProcessBackplane())
+    channel_id = str(uuid4())
+    fast = FakeWebSocket()
+    slow = FakeWebSocket(delay=1)
+    await manager.connect(slow, channel_id)
+    await manager.connect(fast, channel_id)
+
+    with patch("services.chat.send_queue.SEND_TIMEOUT_SECONDS", 0.05):
+        result = await manager.broadcast({"content": "Hola"}, channel_id)
+        await asyncio.sleep(0.01)
+        # El broadcast no espera al cliente lento
+        assert result == {"delivered": 2, "dropped": 0}
+        assert len(fast.sent) == 1
+        await asyncio.sleep(0.1)
+
+    assert _connections(manager, channel_id) == {fast}
+
+
+@pytest.mark.anyio
+async def test_broadcast_serialises_payload_once():
+    manager = ConnectionManager(InProcessBackplane())
+    channel_id = str(uuid4())
+    for _ in range(3):
+        await manager.connect(FakeWebSocket(), channel_id)
+
+    with patch("services.chat.connection_manager.json.dumps", return_value="{}") as mocked_dumps:
+        result = await manager.broadcast({"content": "Hola"}, channel_id)
+
+    assert result == {"delivered": 3, "dropped": 0}
+    mocked_dumps.assert_called_once()
+
+
+@pytest.mark.anyio
+async def test_broadcast_without_sockets_is_a_noop():
+    manager = ConnectionManager(InProcessBackplane())
+
+    result = await manager.broadcast({"content": "Hola"}, str(uuid4()))
+
+    assert result == {"delivered": 0, "dropped": 0}
+
+
+@pytest.mark.anyio
+async def test_full_queue_drops_oldest_payload():
+    manager = ConnectionManager(InProcessBackplane(), max_queue=2, policy=BackpressurePolicy.DROP_OLDEST)
+    channel_id = str(uuid4())
+    websocket = FakeWebSocket()
+    connection = await manager.connect(websocket, channel_id)
+
+    # Encolamos sin ceder el control al event loop: la tarea escritora aún no ha drenado nada
+    results = [await manager.deliver_local({"content": str(i)}, channel_id) for i in range(3)]
+    await asyncio.sleep(0.01)
+
+    assert results[-1] == {"delivered": 1, "dropped": 1}
+    assert connection.dropped == 1
+    assert [json.loads(p)["content"] for p in websocket.sent] == ["1", "2"]
+
+
+@pytest.mark.anyio
+async def test_full_queue_coalesces_edits_of_the_same_message():
+    manager = ConnectionManager(InProcessBackplane(), max_queue=2, policy=BackpressurePolicy.COALESCE)
+    channel_id = str(uuid4())
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, channel_id)
+    message_id = str(uuid4())
+
+    await manager.deliver_local({"content": "nuevo"}, channel_id)
+    await manager.deliver_local({"event": "message_edited", "message": {"id": message_id, "content": "v1"}}, channel_id)
+    await manager.deliver_local({"event": "message_deleted", "message_id": message_id}, channel_id)
+    await asyncio.sleep(0.01)
+
+    events = [json.loads(p) for p in websocket.sent]
+    # La edición obsoleta se sustituye por el borrado; el mensaje nuevo se conserva
+    assert events == [{"content": "nuevo"}, {"event": "message_deleted", "message_id": message_id}]
+
+
+@pytest.mark.anyio
+async def test_full_queue_disconnects_client_with_disconnect_policy():
+    manager = ConnectionManager(InProcessBackplane(), max_queue=1, policy=BackpressurePolicy.DISCONNECT)
+    channel_id = str(uuid4())
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, channel_id)
+
+    await manager.deliver_local({"content": "1"}, channel_id)
+    result = await manager.deliver_local({"content": "2"}, channel_id)
+    await asyncio.sleep(0.01)
+
+    assert result == {"delivered": 0, "dropped": 1}
+    assert websocket.closed_with == CLOSE_CODE_TRY_AGAIN_LATER
+    assert channel_id not in manager.active_connections
+
+
+@pytest.mark.anyio
+async def test_user_socket_receives_alerts_and_subscribed_channels():
+    manager = ConnectionManager(InProcessBackplane())
+    user_id = str(uuid4())
+    channel_a = str(uuid4())
+    channel_b = str(uuid4())
+    websocket = FakeWebSocket()
+    connection = await manager.connect_user(websocket, user_id)
+    manager.subscribe(connection, channel_a)
+    manager.subscribe(connection, channel_b)
+
+    await manager.broadcast({"channel_id": channel_a, "content": "A"}, channel_a)
+    await manager.broadcast({"channel_id": channel_b, "content": "B"}, channel_b)
+    await manager.notify_users({"event": "alert_created"}, [user_id, str(uuid4())])
+    manager.unsubscribe(connection, channel_a)
+    await manager.broadcast({"channel_id": channel_a, "content": "A2"}, channel_a)
+    await asyncio.sleep(0.01)
+
+    events = [json.loads(p) for p in websocket.sent]
+    assert events == [
+        {"channel_id": channel_a, "content": "A"},
+        {"channel_id": channel_b, "content": "B"},
+        {"event": "alert_created"},
+    ]
+
+
+@pytest.mark.anyio
+async def test_revoked_channels_are_dropped_from_the_user_socket():
+    manager = ConnectionManager(InProcessBackplane())
+    user_id = str(uuid4())
+    channel_a = str(uuid4())
+    channel_b = str(uuid4())
+    websocket = FakeWebSocket()
+    connection = await manager.connect_user(websocket, user_id)
+    manager.subscribe(connection, channel_a)
+    manager.subscribe(connection, channel_b)
+
+    await manager.revoke_channels(user_id, [channel_a])
+    await manager.broadcast({"channel_id": channel_a, "content": "A"}, channel_a)
+    await manager.broadcast({"channel_id": channel_b, "content": "B"}, channel_b)
+    await asyncio.sleep(0.01)
+
+    events = [json.loads(p) for p in websocket.sent]
+    assert events == [
+        {"event": "channel_access_revoked", "channel_ids": [channel_a]},
+        {"channel_id": channel_b, "content": "B"},
+    ]
+    assert channel_a not in manager.active_connections
+
+
+class UnreachableBackplane(InProcessBackplane):
+    def __init__(self):
+        super().__init__()
+        self.start_attempts = 0
+
+    async def start(self, deliver):
+        self.start_attempts += 1
+        raise ConnectionError("realtime unreachable")
+
+    async def publish(self, message: dict, channel_id: str):
+        raise ConnectionError("realtime unreachable")
+
+
+@pytest.mark.anyio
+async def test_unreachable_backplane_falls_back_to_local_delivery():
+    backplane = UnreachableBackplane()
+    manager = ConnectionManager(backplane)
+    channel_id = str(uuid4())
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, channel_id)
+
+    result = await manager.broadcast({"content": "Hola"}, channel_id)
+    alert = await manager.notify_users({"event": "alert_created"}, ["user-1"])
+    await asyncio.sleep(0.01)
+
+    assert result == {"delivered": 1, "dropped": 0}
+    assert alert == {"delivered": 0, "dropped": 0}
+    assert len(websocket.sent) == 1
+    # No se reintenta el arranque en cada mensaje
+    assert backplane.start_attempts == 1
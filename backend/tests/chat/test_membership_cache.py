@@ -0,0 +1,89 @@
+import time
+
+from services.chat.membership_cache import ChannelMembershipCache
+
+
+class CountingTable:
+    def __init__(self, client):
+        self.client = client
+        self.filters = {}
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = str(value)
+        return self
+
+    def execute(self):
+        class MockResponse:
+            def __init__(self, data):
+                self.data = data
+
+        self.client.queries += 1
+        rows = [row for row in self.client.rows if all(str(row.get(col)) == val for col, val in self.filters.items())]
+        return MockResponse(rows)
+
+
+class CountingSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def table(self, name):
+        return CountingTable(self)
+
+
+def test_access_checks_are_served_from_memory():
+    supabase = CountingSupabase([{"channel_id": "c1", "user_id": "u1"}, {"channel_id": "c1", "user_id": "u2"}])
+    cache = ChannelMembershipCache()
+
+    assert cache.is_member("c1", "u1", supabase) is True
+    assert cache.is_member("c1", "u2", supabase) is True
+    assert cache.get_members("c1", supabase) == frozenset({"u1", "u2"})
+    assert supabase.queries == 1
+
+
+def test_unknown_user_is_confirmed_against_the_database():
+    supabase = CountingSupabase([{"channel_id": "c1", "user_id": "u1"}])
+    cache = ChannelMembershipCache()
+    cache.get_members("c1", supabase)
+
+    # Participante añadido desde otro worker después de cachear el canal
+    supabase.rows.append({"channel_id": "c1", "user_id": "u3"})
+
+    assert cache.is_member("c1", "u3", supabase) is True
+    assert cache.is_member("c1", "intruso", supabase) is False
+    assert "u3" in cache.get_members("c1", supabase)
+
+
+def test_invalidate_forces_reload():
+    supabase = CountingSupabase([{"channel_id": "c1", "user_id": "u1"}])
+    cache = ChannelMembershipCache()
+    cache.get_members("c1", supabase)
+
+    supabase.rows.clear()
+    cache.invalidate("c1")
+
+    assert cache.get_members("c1", supabase) == frozenset()
+    assert supabase.queries == 2
+
+
+def test_entries_expire_and_least_recently_used_are_evicted():
+    supabase = CountingSupabase([])
+    cache = ChannelMembershipCache(maxsize=2, ttl=0.05)
+
+    cache.get_members("c1", supabase)
+    cache.get_members("c2", supabase)
+    cache.get_members("c1", supabase)
+    cache.get_members("c3", supabase)  # desaloja c2, el menos usado
+    assert supabase.queries == 3
+
+    cache.get_members("c1", supabase)
+    assert supabase.queries == 3
+    cache.get_members("c2", supabase)
+    assert supabase.queries == 4
+
+    time.sleep(0.06)
+    cache.get_members("c1", supabase)
+    assert supabase.queries == 5
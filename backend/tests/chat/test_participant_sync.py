@@ -0,0 +1,184 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from services.chat import participant_sync
+from services.chat.membership_cache import channel_members
+from services.chat.participant_sync import run_participant_sync, sync_association_participants
+
+
+class SyncTable:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.operation = "select"
+        self.filters = []
+        self.window = None
+        self.payload = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, {str(value)}))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append((column, {str(v) for v in values}))
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self.operation = "upsert"
+        self.payload = rows
+        return self
+
+    def delete(self):
+        self.operation = "delete"
+        return self
+
+    def _matches(self, row):
+        return all(str(row.get(column)) in values for column, values in self.filters)
+
+    def execute(self):
+        class MockResponse:
+            def __init__(self, data):
+                self.data = data
+
+        rows = self.client.tables[self.name]
+        self.client.calls.append((self.name, self.operation))
+        if self.operation == "upsert":
+            rows.extend(self.payload)
+            return MockResponse(self.payload)
+        if self.operation == "delete":
+            removed = [row for row in rows if self._matches(row)]
+            self.client.tables[self.name] = [row for row in rows if not self._matches(row)]
+            return MockResponse(removed)
+
+        matched = sorted(
+            (row for row in rows if self._matches(row)), key=lambda r: (r.get("channel_id", ""), r.get("user_id", ""))
+        )
+        if self.window:
+            matched = matched[self.window[0] : self.window[1] + 1]
+        return MockResponse(matched)
+
+
+class SyncSupabase:
+    def __init__(self, tables):
+        self.tables = tables
+        self.calls = []
+
+    def table(self, name):
+        return SyncTable(self, name)
+
+
+def make_supabase(members, participants):
+    return SyncSupabase(
+        {
+            "chat_channels": [
+                {"id": "general", "association_id": "a1", "is_direct_message": False},
+                {"id": "obras", "association_id": "a1", "is_direct_message": False},
+                {"id": "dm", "association_id": "a1", "is_direct_message": True},
+                {"id": "otra", "association_id": "a2", "is_direct_message": False},
+            ],
+            "memberships": [{"association_id": "a1", "profile_id": user_id} for user_id in members],
+            "channel_participants": participants,
+        }
+    )
+
+
+def participants_of(supabase, channel_id):
+    return {row["user_id"] for row in supabase.tables["channel_participants"] if row["channel_id"] == channel_id}
+
+
+def test_sync_adds_new_members_in_one_bulk_upsert():
+    supabase = make_supabase(
+        ["u1", "u2", "u3"],
+        [{"channel_id": "general", "user_id": "u1"}, {"channel_id": "dm", "user_id": "u1"}],
+    )
+
+    result = sync_association_participants("a1", supabase)
+
+    assert result == {"channels": 2, "added": 5, "removed": 0}
+    assert participants_of(supabase, "general") == {"u1", "u2", "u3"}
+    assert participants_of(supabase, "obras") == {"u1", "u2", "u3"}
+    assert participants_of(supabase, "dm") == {"u1"}
+    assert supabase.calls.count(("channel_participants", "upsert")) == 1
+
+
+def test_sync_removes_departed_member_from_all_channels_at_once():
+    supabase = make_supabase(
+        ["u1"],
+        [
+            {"channel_id": "general", "user_id": "u1"},
+            {"channel_id": "general", "user_id": "u2"},
+            {"channel_id": "obras", "user_id": "u1"},
+            {"channel_id": "obras", "user_id": "u2"},
+            {"channel_id": "dm", "user_id": "u2"},
+        ],
+    )
+
+    result = sync_association_participants("a1", supabase)
+
+    assert result == {"channels": 2, "added": 0, "removed": 2}
+    assert participants_of(supabase, "general") == {"u1"}
+    assert participants_of(supabase, "obras") == {"u1"}
+    # Los DMs no dependen de la membresía
+    assert participants_of(supabase, "dm") == {"u2"}
+    assert supabase.calls.count(("channel_participants", "delete")) == 1
+
+
+def test_sync_reads_participants_page_by_page(monkeypatch):
+    monkeypatch.setattr(participant_sync, "PARTICIPANT_PAGE_SIZE", 2)
+    members = ["u1", "u2", "u3"]
+    participants = [{"channel_id": channel, "user_id": user} for channel in ("general", "obras") for user in members]
+    supabase = make_supabase(members, participants)
+
+    result = sync_association_participants("a1", supabase)
+
+    assert result["added"] == 0 and result["removed"] == 0
+    assert supabase.calls.count(("channel_participants", "select")) == 4
+
+
+def test_sync_invalidates_membership_cache_of_changed_channels():
+    supabase = make_supabase(["u1", "u2"], [{"channel_id": "general", "user_id": "u1"}])
+    assert channel_members.get_members("general", supabase) == frozenset({"u1"})
+
+    sync_association_participants("a1", supabase)
+
+    assert channel_members.get_members("general", supabase) == frozenset({"u1", "u2"})
+    channel_members.clear()
+
+
+@pytest.mark.anyio
+async def test_background_job_drops_websocket_subscriptions_of_removed_participants():
+    supabase = make_supabase(
+        ["u1"],
+        [
+            {"channel_id": "general", "user_id": "u1"},
+            {"channel_id": "general", "user_id": "u2"},
+            {"channel_id": "obras", "user_id": "u2"},
+        ],
+    )
+
+    with patch.object(participant_sync.manager, "revoke_channels", AsyncMock()) as revoke:
+        await run_participant_sync("a1", supabase)
+
+    revoke.assert_awaited_once_with("u2", ["general", "obras"])
+
+
+@pytest.mark.anyio
+async def test_background_job_logs_errors_instead_of_raising():
+    class BrokenSupabase:
+        def table(self, name):
+            raise RuntimeError("db down")
+
+    with patch.object(participant_sync.manager, "revoke_channels", AsyncMock()) as revoke:
+        await run_participant_sync("a1", BrokenSupabase())
+
+    revoke.assert_not_awaited()
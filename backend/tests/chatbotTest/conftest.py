@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+
+class FakeCatalogQuery:
+    """Tabla chatbot_documents en memoria con los métodos de PostgREST que usa el servicio."""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self._filters = []
+        self._action = "select"
+        self._payload = None
+        self._order = None
+        self._limit = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self._filters.append((column, value))
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def upsert(self, row, on_conflict=None):
+        self._action, self._payload = "upsert", row
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def _matches(self, row):
+        return all(row.get(column) == value for column, value in self._filters)
+
+    def execute(self):
+        if self._action == "upsert":
+            key = (self._payload["comunidad_id"], self._payload["document_title"])
+            current = next((row for row in self.rows if (row["comunidad_id"], row["document_title"]) == key), None)
+            if current is None:
+                self.rows.append({"created_at": self._payload["updated_at"], **self._payload})
+            else:
+                current.update(self._payload)
+            return SimpleNamespace(data=[self._payload])
+
+        if self._action == "delete":
+            deleted = [row for row in self.rows if self._matches(row)]
+            self.rows[:] = [row for row in self.rows if not self._matches(row)]
+            return SimpleNamespace(data=deleted)
+
+        data = [dict(row) for row in self.rows if self._matches(row)]
+        if self._order:
+            column, desc = self._order
+            data.sort(key=lambda row: row.get(column) or "", reverse=desc)
+        if self._limit is not None:
+            data = data[: self._limit]
+        return SimpleNamespace(data=data)
+
+
+@pytest.fixture(autouse=True)
+def document_catalog():
+    # Importado aquí: core.config no debe cargarse antes de que los tests fijen sus variables de entorno
+    from services.chatBot import documents_ChatBotService
+
+    rows: list[dict] = []
+    with patch.object(documents_ChatBotService, "_get_catalog", lambda: FakeCatalogQuery(rows)), patch.object(
+        documents_ChatBotService, "_backfilled_namespaces", set()
+    ):
+        yield rows
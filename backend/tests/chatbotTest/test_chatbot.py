@@ -1,4 +1,6 @@
+import asyncio
 import os
+import time
 from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4
 
@@ -11,9 +13,11 @@ os.environ["SUPABASE_KEY"] = "dummy"
 os.environ["SUPABASE_SERVICE_KEY"] = "dummy"
 os.environ["SUPABASE_SCHEMA"] = "public"
 
-from core.deps import get_current_user, get_supabase  # noqa: E402
+from core.deps import get_async_db, get_current_user, get_supabase  # noqa: E402
 from main import app  # noqa: E402
 from services.chatBot.chatBotService import DISCLAIMER  # noqa: E402
+from services.chatBot.ingestion_jobs import document_ingestion  # noqa: E402
+from services.helpers.membership_resolver import user_memberships  # noqa: E402
 
 client = TestClient(app)
 
@@ -63,9 +67,10 @@ def override_get_supabase():
 
 
 @pytest.fixture(autouse=True)
-def setup_overrides():
+def setup_overrides(async_mock_db):
     app.dependency_overrides[get_current_user] = override_get_current_user_admin
     app.dependency_overrides[get_supabase] = override_get_supabase
+    app.dependency_overrides[get_async_db] = lambda: async_mock_db(override_get_supabase())
     yield
     app.dependency_overrides.clear()
 
@@ -73,17 +78,22 @@ def setup_overrides():
 # Helpers para mocks de Pinecone y Gemini
 
 
-def _make_mock_embedding(dim=768):
+def _make_mock_embedding(dim=768, count=1):
     embedding = MagicMock()
     embedding.values = [0.1] * dim
     response = MagicMock()
-    response.embeddings = [embedding]
+    response.embeddings = [embedding] * count
     return response
 
 
+def _mock_embed_content(model=None, contents=None, **kwargs):
+    # Un embedding por texto, tanto si llega uno solo como una lista
+    return _make_mock_embedding(count=len(contents) if isinstance(contents, list) else 1)
+
+
 def _make_mock_gemini_client(llm_answer=""):
     mock_client = MagicMock()
-    mock_client.models.embed_content.return_value = _make_mock_embedding()
+    mock_client.models.embed_content.side_effect = _mock_embed_content
 
     mock_llm_response = MagicMock()
     mock_llm_response.text = llm_answer
@@ -98,6 +108,24 @@ def _make_mock_pinecone_index(matches=None):
     return mock_index
 
 
+@pytest.fixture(autouse=True)
+def ingestion_jobs_table():
+    # La tabla document_ingestion_jobs no existe en los tests: los trabajos se consultan en memoria
+    with patch.object(document_ingestion, "_client_factory", MagicMock()) as factory:
+        yield factory
+
+
+def _wait_for_job(status_url, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(status_url)
+        assert response.status_code == 200  # nosec B101
+        job = response.json()
+        if job["status"] in ("completed", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
 def test_chatbot_pregunta_vacia_devuelve_400():
     payload = {"comunidad_id": COMMUNITY_ID, "question": "   "}
     response = client.post(f"/comunities/{COMMUNITY_ID}/chatbot", json=payload)
@@ -189,12 +217,15 @@ def test_chatbot_flujo_completo_con_subida_documento_admin():
         return_value=mock_gemini,
     ):
         upload_response = client.post(f"/comunities/{COMMUNITY_ID}/documents", files=archivos)
-        assert upload_response.status_code == 200  # nosec B101
+        assert upload_response.status_code == 202  # nosec B101
         upload_data = upload_response.json()
-        assert "indexado con" in upload_data["message"].lower()  # nosec B101
-        assert upload_data["chunks"] > 0  # nosec B101
+        assert upload_data["job_id"]  # nosec B101
         assert upload_data["uploaded_by"] == USER_ADMIN_ID  # nosec B101
 
+        job = _wait_for_job(upload_data["status_url"])
+        assert job["status"] == "completed"  # nosec B101
+        assert job["chunks"] > 0  # nosec B101
+
         upsert_payload = mock_pinecone.upsert.call_args.kwargs["vectors"][0]["metadata"]
         assert upsert_payload["uploaded_by"] == USER_ADMIN_ID  # nosec B101
         assert upsert_payload["uploaded_by_email"] == "admin@test.com"  # nosec B101
@@ -274,8 +305,6 @@ def test_listar_documentos_comunidad():
             }
         ],
         "namespace": COMMUNITY_ID,
-        "vector_count": 3,
-        "queried_vectors": 3,
         "truncated": False,
     }
 
@@ -287,6 +316,20 @@ def test_listar_documentos_comunidad():
         mocked_list.assert_called_once_with(COMMUNITY_ID, uploaded_by=None, limit=100)
 
 
+def test_listar_documentos_no_bloquea_el_event_loop():
+    def list_documents(*args, **kwargs):
+        # La reconstrucción del catálogo puede tardar: debe correr fuera del event loop
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        return {"documents": [], "namespace": COMMUNITY_ID, "truncated": False}
+
+    with patch("api.chatBot.documents.list_documents", side_effect=list_documents) as mocked_list:
+        response = client.get(f"/comunities/{COMMUNITY_ID}/documents")
+
+    assert response.status_code == 200  # nosec B101
+    mocked_list.assert_called_once()
+
+
 def test_borrar_documento_admin():
     mocked_delete_response = {
         "deleted_chunks": 2,
@@ -325,3 +368,175 @@ def test_listar_documentos_no_admin_devuelve_403():
     response = client.get(f"/comunities/{COMMUNITY_ID}/documents")
     assert response.status_code == 403  # nosec B101
     assert response.json()["detail"] == "Admin access required for this action"  # nosec B101
+
+
+def test_indexar_documento_agrupa_embeddings_y_upserts():
+    from services.chatBot import documents_ChatBotService as service
+
+    mock_pinecone = _make_mock_pinecone_index()
+    mock_gemini = _make_mock_gemini_client()
+    texto = " ".join(f"Punto {i} del acta de la junta de vecinos." for i in range(400))
+
+    with patch.object(service, "_get_index", return_value=mock_pinecone), patch.object(
+        service, "_get_client", return_value=mock_gemini
+    ), patch.object(service, "EMBEDDING_BATCH_SIZE", 4), patch.object(service, "UPSERT_BATCH_SIZE", 5):
+        chunks = service.index_document(COMMUNITY_ID, "Acta larga", texto)
+
+    embed_calls = mock_gemini.models.embed_content.call_args_list
+    assert chunks > 4  # nosec B101
+    assert len(embed_calls) == -(-chunks // 4)  # nosec B101
+    assert all(len(call.kwargs["contents"]) <= 4 for call in embed_calls)  # nosec B101
+
+    upserted = [vector for call in mock_pinecone.upsert.call_args_list for vector in call.kwargs["vectors"]]
+    assert mock_pinecone.upsert.call_count == -(-chunks // 5)  # nosec B101
+    assert len({vector["id"] for vector in upserted}) == len(upserted) == chunks  # nosec B101
+
+
+def test_embeddings_incompletos_lanzan_error():
+    from services.chatBot import documents_ChatBotService as service
+
+    mock_gemini = _make_mock_gemini_client()
+    mock_gemini.models.embed_content.side_effect = None
+    mock_gemini.models.embed_content.return_value = _make_mock_embedding(count=1)
+
+    with patch.object(service, "_get_client", return_value=mock_gemini), patch.object(
+        service, "EMBEDDING_RETRY_BASE_DELAY", 0
+    ):
+        with pytest.raises(ValueError):
+            service._embed_chunks(["uno", "dos"])
+
+    assert mock_gemini.models.embed_content.call_count == service.EMBEDDING_MAX_RETRIES  # nosec B101
+
+
+def test_subida_documento_informa_progreso_por_etapas(ingestion_jobs_table):
+    from services.chatBot import documents_ChatBotService as service
+
+    mock_pinecone = _make_mock_pinecone_index()
+    mock_gemini = _make_mock_gemini_client()
+    texto = " ".join(f"Punto {i} del reglamento de la piscina." for i in range(200))
+
+    with patch.object(service, "_get_index", return_value=mock_pinecone), patch.object(
+        service, "_get_client", return_value=mock_gemini
+    ):
+        response = client.post(
+            f"/comunities/{COMMUNITY_ID}/documents", json={"title": "Reglamento piscina", "content": texto}
+        )
+        assert response.status_code == 202  # nosec B101
+        job = _wait_for_job(response.json()["status_url"])
+
+    assert job["status"] == "completed"  # nosec B101
+    assert job["document_title"] == "Reglamento piscina"  # nosec B101
+    assert job["progress_done"] == job["progress_total"] == job["chunks"]  # nosec B101
+
+    table = ingestion_jobs_table.return_value.table.return_value
+    assert table.insert.call_args.args[0]["status"] == "queued"  # nosec B101
+    stages = [call.args[0]["status"] for call in table.update.call_args_list]
+    assert stages[0] == "extracting" and stages[-1] == "completed"  # nosec B101
+    assert {"chunking", "embedding", "upserting"} <= set(stages)  # nosec B101
+
+
+def test_subida_documento_vacio_termina_en_fallo():
+    archivos = {"file": ("vacio.txt", b"   ", "text/plain")}
+
+    response = client.post(f"/comunities/{COMMUNITY_ID}/documents", files=archivos)
+    assert response.status_code == 202  # nosec B101
+    job = _wait_for_job(response.json()["status_url"])
+
+    assert job["status"] == "failed"  # nosec B101
+    assert job["error"] == "El documento esta vacio o no se pudo extraer el texto."  # nosec B101
+
+
+def test_estado_trabajo_de_otra_comunidad_devuelve_404():
+    with patch("services.chatBot.ingestion_jobs.index_document", return_value=1):
+        response = client.post(f"/comunities/{COMMUNITY_ID}/documents", json={"title": "Acta", "content": "Texto"})
+        _wait_for_job(response.json()["status_url"])
+    job_id = response.json()["job_id"]
+
+    otra_comunidad = MockSupabaseClient()
+    otra_comunidad._memberships = [{"association_id": "2", "profile_id": USER_ADMIN_ID, "role": 1}]
+    app.dependency_overrides[get_supabase] = lambda: otra_comunidad
+    user_memberships.clear()
+
+    response = client.get(f"/comunities/2/documents/jobs/{job_id}")
+    assert response.status_code == 404  # nosec B101
+    assert response.json()["detail"] == "Document job not found in this community"  # nosec B101
+
+
+def test_progreso_se_empuja_al_usuario_que_sube_el_documento():
+    import asyncio
+
+    from services.chatBot.ingestion_jobs import DocumentIngestionQueue
+
+    async def scenario():
+        notifier = AsyncMock()
+        queue = DocumentIngestionQueue(client_factory=MagicMock(), notifier=notifier, workers=1)
+        queue.start()
+        with patch("services.chatBot.ingestion_jobs.index_document", return_value=3):
+            job = queue.submit(COMMUNITY_ID, "Acta", b"Texto del acta", "txt", uploaded_by=USER_ADMIN_ID)
+            while not job.finished:
+                await asyncio.sleep(0.01)
+        await queue.stop()
+        await asyncio.sleep(0)
+        return job, notifier
+
+    job, notifier = asyncio.run(scenario())
+
+    assert job.status == "completed" and job.chunks == 3  # nosec B101
+    events = [call.args for call in notifier.await_args_list]
+    assert all(recipients == [USER_ADMIN_ID] for _, recipients in events)  # nosec B101
+    assert events[-1][0] == {"event": "document_job_updated", "job": job.as_row()}  # nosec B101
+
+
+def test_al_arrancar_se_dan_por_fallidos_los_trabajos_huerfanos():
+    import asyncio
+
+    from services.chatBot.ingestion_jobs import INTERRUPTED_JOB_ERROR, DocumentIngestionQueue
+
+    factory = MagicMock()
+
+    async def scenario():
+        queue = DocumentIngestionQueue(client_factory=factory, workers=1)
+        queue.start()
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+    update = factory.return_value.table.return_value.update
+    assert update.call_args.args[0]["status"] == "failed"  # nosec B101
+    assert update.call_args.args[0]["error"] == INTERRUPTED_JOB_ERROR  # nosec B101
+    filters = update.return_value.not_.in_
+    assert filters.call_args.args == ("status", ["completed", "failed"])  # nosec B101
+    assert filters.return_value.lt.call_args.args[0] == "updated_at"  # nosec B101
+
+
+def test_estado_de_trabajo_sin_avanzar_en_la_tabla_se_da_por_fallido():
+    from datetime import datetime, timedelta, timezone
+
+    from services.chatBot.ingestion_jobs import INTERRUPTED_JOB_ERROR, DocumentIngestionQueue
+
+    stale = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    row = {"id": "job-1", "status": "embedding", "error": None, "updated_at": stale}
+    factory = MagicMock()
+    query = factory.return_value.table.return_value.select.return_value.eq.return_value.limit.return_value
+    query.execute.return_value = MagicMock(data=[row])
+
+    job = DocumentIngestionQueue(client_factory=factory, workers=1).lookup("job-1")
+
+    assert job["status"] == "failed" and job["error"] == INTERRUPTED_JOB_ERROR  # nosec B101
+    assert factory.return_value.table.return_value.update.called  # nosec B101
+
+
+def test_actualizar_documento_encola_un_trabajo_incremental():
+    archivos = {"file": ("Estatutos_v2.txt", b"Nueva version de los estatutos", "text/plain")}
+
+    with patch("services.chatBot.ingestion_jobs.index_document", return_value=4) as mocked_index:
+        response = client.put(
+            f"/comunities/{COMMUNITY_ID}/documents", params={"document_title": "Estatutos.txt"}, files=archivos
+        )
+        assert response.status_code == 202  # nosec B101
+        job = _wait_for_job(response.json()["status_url"])
+
+    assert job["status"] == "completed" and job["document_title"] == "Estatutos.txt"  # nosec B101
+    assert mocked_index.call_args.args[1] == "Estatutos.txt"  # nosec B101
+    assert mocked_index.call_args.kwargs["incremental"] is True  # nosec B101
+    assert mocked_index.call_args.kwargs["source_filename"] == "Estatutos_v2.txt"  # nosec B101
@@ -0,0 +1,267 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from services.chatBot import documents_ChatBotService as service
+
+NAMESPACE = "1"
+TITLE = "Estatutos"
+
+
+class FakePineconeIndex:
+    """Índice en memoria con la parte de la API que usa index_document."""
+
+    def __init__(self):
+        self.vectors = {}
+        self.upserted = []
+        self.deleted = []
+        self.fetched = 0
+
+    def upsert(self, vectors, namespace):
+        for vector in vectors:
+            self.vectors[vector["id"]] = vector
+        self.upserted.extend(vector["id"] for vector in vectors)
+
+    def fetch(self, ids, namespace):
+        self.fetched += 1
+        return {"vectors": {chunk_id: self.vectors[chunk_id] for chunk_id in ids if chunk_id in self.vectors}}
+
+    def query(self, namespace, vector, top_k, include_metadata, filter=None):
+        excluded = set((filter or {}).get("document_title", {}).get("$nin", []))
+        matches = [
+            {"id": chunk_id, "metadata": vector["metadata"]}
+            for chunk_id, vector in self.vectors.items()
+            if vector["metadata"]["document_title"] not in excluded
+        ]
+        return {"matches": matches[:top_k]}
+
+    def delete(self, namespace, ids):
+        self.deleted.append(list(ids))
+        for chunk_id in ids:
+            self.vectors.pop(chunk_id, None)
+
+
+def _mock_gemini_client():
+    def embed_content(model=None, contents=None, **kwargs):
+        response = MagicMock()
+        response.embeddings = [MagicMock(values=[0.1, 0.2]) for _ in contents]
+        return response
+
+    mock_client = MagicMock()
+    mock_client.models.embed_content.side_effect = embed_content
+    return mock_client
+
+
+def _articulos(n: int, cambio: int | None = None) -> str:
+    return " ".join(f"Articulo {i}: {'texto cambiado' if i == cambio else 'texto original'}." for i in range(n))
+
+
+def _hashes(chunks: list[str]) -> list[str]:
+    return [service._content_hash(chunk) for chunk in chunks]
+
+
+def _ids(chunks: list[str]) -> list[str]:
+    return service._chunk_ids(NAMESPACE, TITLE, _hashes(chunks))
+
+
+def _indexar_por_posicion(index, title: str, texto: str, **metadata) -> int:
+    """Guarda el documento en el índice como antes del catálogo: ids por posición y sin content_hash."""
+    chunks = service._chunk_text(texto)
+    vectors = [
+        {
+            "id": service._build_legacy_chunk_id(NAMESPACE, title, i),
+            "values": [0.3, 0.4],
+            "metadata": {"comunidad_id": NAMESPACE, "document_title": title, "texto": chunk, **metadata},
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+    index.upsert(vectors, NAMESPACE)
+    index.upserted.clear()
+    return len(chunks)
+
+
+def _embedded_texts(mock_gemini) -> list[str]:
+    return [text for call in mock_gemini.models.embed_content.call_args_list for text in call.kwargs["contents"]]
+
+
+@pytest.fixture
+def index():
+    return FakePineconeIndex()
+
+
+@pytest.fixture
+def gemini():
+    return _mock_gemini_client()
+
+
+@pytest.fixture(autouse=True)
+def patch_clients(index, gemini):
+    with patch.object(service, "_get_index", return_value=index), patch.object(
+        service, "_get_client", return_value=gemini
+    ):
+        yield
+
+
+def test_actualizar_solo_sube_los_chunks_que_cambian(index, gemini):
+    anteriores = service._chunk_text(_articulos(200))
+    total = service.index_document(NAMESPACE, TITLE, _articulos(200))
+    gemini.models.embed_content.reset_mock()
+    index.upserted.clear()
+
+    texto = _articulos(200, cambio=150)
+    chunks = service._chunk_text(texto)
+    assert service.index_document(NAMESPACE, TITLE, texto, incremental=True) == total  # nosec B101
+
+    ids = _ids(chunks)
+    cambiados = [i for i, chunk in enumerate(chunks) if chunk not in anteriores]
+    # Solo el chunk del cambio y, si se movió su corte, los siguientes hasta volver a coincidir
+    assert "cambiado" in chunks[cambiados[0]] and len(cambiados) <= 3  # nosec B101
+    assert index.upserted == [ids[i] for i in cambiados]  # nosec B101
+    assert _embedded_texts(gemini) == [chunks[i] for i in cambiados]  # nosec B101
+    assert index.deleted == [[chunk_id for chunk_id in _ids(anteriores) if chunk_id not in ids]]  # nosec B101
+    assert sorted(index.vectors) == sorted(ids)  # nosec B101
+
+
+def test_insertar_un_parrafo_solo_sube_los_chunks_nuevos(index, gemini):
+    texto = "\n\n".join(
+        f"Articulo {i}. " + " ".join(f"Apartado {i}.{j} del reglamento." for j in range(i % 7 + 1)) for i in range(600)
+    )
+    anteriores = service._chunk_text(texto)
+    service.index_document(NAMESPACE, TITLE, texto)
+    gemini.models.embed_content.reset_mock()
+    index.upserted.clear()
+
+    insertado = texto.replace("Articulo 20. ", "Articulo 20. Nuevo apartado aprobado en la junta.\n\nArticulo 20 bis. ")
+    chunks = service._chunk_text(insertado)
+    service.index_document(NAMESPACE, TITLE, insertado, incremental=True)
+
+    # Todos los chunks posteriores a la inserción se desplazan, pero conservan su id
+    nuevos = [chunk for chunk in chunks if chunk not in anteriores]
+    assert len(anteriores) > 100 and len(nuevos) <= 2  # nosec B101
+    assert _embedded_texts(gemini) == nuevos  # nosec B101
+    assert index.upserted == [
+        chunk_id for chunk, chunk_id in zip(chunks, _ids(chunks)) if chunk in nuevos
+    ]  # nosec B101
+    assert len(index.deleted) == 1 and len(index.deleted[0]) <= 2  # nosec B101
+    assert sorted(index.vectors) == sorted(_ids(chunks))  # nosec B101
+
+
+def test_chunks_se_cortan_entre_frases_sin_pasar_del_maximo():
+    chunks = service._chunk_text(_articulos(300))
+
+    assert len(chunks) > 1  # nosec B101
+    assert all(chunk.endswith(".") for chunk in chunks)  # nosec B101
+    overlap = service.CHUNK_OVERLAP_MAX_CHARS + 1
+    assert all(len(chunk) <= service.CHUNK_MAX_CHARS + overlap for chunk in chunks)  # nosec B101
+
+
+def test_actualizar_borra_de_una_vez_los_chunks_sobrantes(index):
+    anteriores = _ids(service._chunk_text(_articulos(4000)))
+    service.index_document(NAMESPACE, TITLE, _articulos(4000))
+
+    nuevos = service.index_document(NAMESPACE, TITLE, _articulos(100), incremental=True)
+
+    actuales = _ids(service._chunk_text(_articulos(100)))
+    assert index.deleted == [[chunk_id for chunk_id in anteriores if chunk_id not in actuales]]  # nosec B101
+    assert len(index.vectors) == nuevos  # nosec B101
+
+
+def test_documento_con_ids_por_posicion_se_convierte_sin_recalcular_embeddings(index, gemini, document_catalog):
+    texto = _articulos(50)
+    total = _indexar_por_posicion(index, TITLE, texto)
+
+    service.index_document(NAMESPACE, TITLE, texto, incremental=True)
+
+    gemini.models.embed_content.assert_not_called()
+    ids = _ids(service._chunk_text(texto))
+    assert index.upserted == ids  # nosec B101
+    assert index.deleted == [[service._build_legacy_chunk_id(NAMESPACE, TITLE, i) for i in range(total)]]  # nosec B101
+    assert all(index.vectors[chunk_id]["values"] == [0.3, 0.4] for chunk_id in ids)  # nosec B101
+    assert document_catalog[0]["chunk_hashes"] == _hashes(service._chunk_text(texto))  # nosec B101
+
+
+def test_actualizar_notifica_la_etapa_de_comparacion():
+    etapas = []
+    service.index_document(NAMESPACE, TITLE, _articulos(20))
+    service.index_document(
+        NAMESPACE, TITLE, _articulos(20), incremental=True, on_progress=lambda stage, done, total: etapas.append(stage)
+    )
+
+    assert etapas[:2] == ["chunking", "diffing"]  # nosec B101
+
+
+def test_el_catalogo_registra_y_lista_los_documentos(index, gemini, document_catalog):
+    chunks = service.index_document(NAMESPACE, TITLE, _articulos(50), uploaded_by="u1", source_filename="e.pdf")
+    service.index_document(NAMESPACE, "Normas piscina", _articulos(5), uploaded_by="u2")
+    gemini.models.embed_content.reset_mock()
+
+    result = service.list_documents(NAMESPACE)
+
+    assert [doc["document_title"] for doc in result["documents"]] == ["Normas piscina", TITLE]  # nosec B101
+    estatutos = result["documents"][1]
+    assert estatutos["chunks"] == chunks and estatutos["source_filename"] == "e.pdf"  # nosec B101
+    assert estatutos["content_hash"] == service._content_hash(_articulos(50))  # nosec B101
+    assert result["truncated"] is False  # nosec B101
+    assert service.list_documents(NAMESPACE, limit=1)["truncated"] is True  # nosec B101
+    assert [doc["document_title"] for doc in service.list_documents(NAMESPACE, uploaded_by="u1")["documents"]] == [
+        TITLE
+    ]  # nosec B101
+    gemini.models.embed_content.assert_not_called()
+
+
+def test_borrar_usa_el_catalogo_para_deducir_los_ids(index, document_catalog):
+    chunks = service.index_document(NAMESPACE, TITLE, _articulos(50))
+
+    result = service.delete_document(NAMESPACE, TITLE)
+
+    assert result["deleted_chunks"] == chunks  # nosec B101
+    assert index.deleted == [_ids(service._chunk_text(_articulos(50)))]  # nosec B101
+    assert index.vectors == {} and document_catalog == []  # nosec B101
+
+
+def test_reindexar_una_version_mas_corta_borra_los_chunks_sobrantes(index):
+    service.index_document(NAMESPACE, TITLE, _articulos(50))
+
+    nuevos = service.index_document(NAMESPACE, TITLE, _articulos(10))
+
+    assert len(index.vectors) == nuevos  # nosec B101
+    assert service.list_documents(NAMESPACE)["documents"][0]["chunks"] == nuevos  # nosec B101
+
+
+def test_actualizar_un_documento_identico_no_lee_pinecone(index, gemini):
+    service.index_document(NAMESPACE, TITLE, _articulos(50))
+    gemini.models.embed_content.reset_mock()
+    index.upserted.clear()
+    index.fetched = 0
+
+    service.index_document(NAMESPACE, TITLE, _articulos(50), incremental=True)
+
+    assert index.fetched == 0 and index.upserted == []  # nosec B101
+    gemini.models.embed_content.assert_not_called()
+
+
+def test_reconstruir_el_catalogo_con_documentos_antiguos(index, document_catalog):
+    chunks = _indexar_por_posicion(index, TITLE, _articulos(50), uploaded_by="u1")
+    _indexar_por_posicion(index, "Normas piscina", _articulos(5))
+
+    assert service.rebuild_catalog(NAMESPACE) == 2  # nosec B101
+    assert service.rebuild_catalog(NAMESPACE) == 0  # nosec B101
+
+    documents = {doc["document_title"]: doc for doc in service.list_documents(NAMESPACE)["documents"]}
+    assert documents[TITLE]["chunks"] == chunks and documents[TITLE]["uploaded_by"] == "u1"  # nosec B101
+
+
+def test_listar_una_comunidad_sin_catalogo_registra_sus_documentos(index, gemini, document_catalog):
+    chunks = _indexar_por_posicion(index, TITLE, _articulos(50), uploaded_by="u1")
+
+    documents = service.list_documents(NAMESPACE)["documents"]
+
+    assert [(doc["document_title"], doc["chunks"]) for doc in documents] == [(TITLE, chunks)]  # nosec B101
+    assert [row["document_title"] for row in document_catalog] == [TITLE]  # nosec B101
+
+
+def test_comunidad_sin_documentos_solo_consulta_pinecone_una_vez(index, gemini):
+    with patch.object(service, "rebuild_catalog", wraps=service.rebuild_catalog) as rebuild:
+        assert service.list_documents(NAMESPACE)["documents"] == []  # nosec B101
+        assert service.list_documents(NAMESPACE)["documents"] == []  # nosec B101
+
+    rebuild.assert_called_once_with(NAMESPACE)
@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from services.chatBot import chatBotService
+from services.chatBot import documents_ChatBotService as documents_service
+from services.chatBot.embedding_cache import EmbeddingCache, embedding_key
+
+MODEL = "gemini-embedding-001"
+
+
+def _mock_gemini_client():
+    def embed_content(model=None, contents=None, **kwargs):
+        texts = contents if isinstance(contents, list) else [contents]
+        response = MagicMock()
+        response.embeddings = [MagicMock(values=[float(len(text)), 0.5]) for text in texts]
+        return response
+
+    mock_client = MagicMock()
+    mock_client.models.embed_content.side_effect = embed_content
+    return mock_client
+
+
+def test_la_clave_ignora_espacios_pero_no_el_modelo():
+    assert embedding_key(MODEL, "Horario  de la\npiscina ") == embedding_key(
+        MODEL, "Horario de la piscina"
+    )  # nosec B101
+    assert embedding_key(MODEL, "Horario de la piscina") != embedding_key(
+        "otro-modelo", "Horario de la piscina"
+    )  # nosec B101
+
+
+def test_los_embeddings_sobreviven_a_un_reinicio(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache(path=path).put_many(MODEL, ["uno", "dos"], [[0.25, 0.5], [1.0, -2.0]])
+
+    reopened = EmbeddingCache(path=path)
+    assert reopened.get_many(MODEL, ["dos", "tres", "uno"]) == [[1.0, -2.0], None, [0.25, 0.5]]  # nosec B101
+    assert reopened.metrics()["hits"] == 2  # nosec B101
+
+
+def test_la_base_local_descarta_los_menos_usados(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path=path, memory_size=1, max_entries=2)
+    cache.put(MODEL, "viejo", [1.0])
+    cache.put(MODEL, "usado", [2.0])
+    cache.get(MODEL, "usado")
+    cache.put(MODEL, "nuevo", [3.0])
+
+    reopened = EmbeddingCache(path=path)
+    assert reopened.get_many(MODEL, ["viejo", "usado", "nuevo"]) == [None, [2.0], [3.0]]  # nosec B101
+
+
+def test_reindexar_el_mismo_documento_no_vuelve_a_pedir_embeddings():
+    mock_gemini = _mock_gemini_client()
+    texto = " ".join(f"Articulo {i} de los estatutos." for i in range(150))
+
+    with patch.object(documents_service, "_get_client", return_value=mock_gemini), patch.object(
+        documents_service, "_get_index", return_value=MagicMock()
+    ):
+        chunks = documents_service.index_document("1", "Estatutos", texto)
+        calls = mock_gemini.models.embed_content.call_count
+        assert documents_service.index_document("1", "Estatutos v2", texto) == chunks  # nosec B101
+
+    assert calls > 0  # nosec B101
+    assert mock_gemini.models.embed_content.call_count == calls  # nosec B101
+
+
+@pytest.mark.parametrize("pregunta", ["A que hora cierra la piscina?", "  A que hora cierra  la piscina?"])
+def test_preguntas_repetidas_usan_la_cache(pregunta):
+    mock_gemini = _mock_gemini_client()
+
+    with patch.object(chatBotService, "_get_client", return_value=mock_gemini):
+        first = chatBotService._get_gemini_embedding("A que hora cierra la piscina?")
+        second = chatBotService._get_gemini_embedding(pregunta)
+
+    assert first == second  # nosec B101
+    assert mock_gemini.models.embed_content.call_count == 1  # nosec B101
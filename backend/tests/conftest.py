@@ -0,0 +1,58 @@
+import pytest
+from services.helpers.account_lookup import account_lookup
+from services.helpers.membership_resolver import user_memberships
+
+
+class AsyncMockQuery:
+    """Envuelve una consulta del mock síncrono con la interfaz del cliente PostgREST asíncrono."""
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        method = getattr(self._query, name)
+
+        def call(*args, **kwargs):
+            return AsyncMockQuery(method(*args, **kwargs))
+
+        return call
+
+    async def execute(self):
+        return self._query.execute()
+
+
+class AsyncMockDB:
+    """Cliente PostgREST asíncrono sobre un mock síncrono de Supabase (mismos datos)."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name: str):
+        return AsyncMockQuery(self._client.table(name))
+
+    def rpc(self, name: str, params: dict):
+        return AsyncMockQuery(self._client.rpc(name, params))
+
+
+@pytest.fixture
+def async_mock_db():
+    """Construye el cliente asíncrono de pruebas: async_mock_db(mock_sincrono)."""
+    return AsyncMockDB
+
+
+@pytest.fixture(autouse=True)
+def clear_process_caches():
+    # Importada aquí: core.config no debe cargarse antes de que los tests fijen sus variables de entorno
+    from services.chatBot.embedding_cache import embedding_cache
+
+    # Sin tocar la base local de embeddings del desarrollador
+    embedding_cache.path = ":memory:"
+
+    # Los tests reutilizan los mismos ids y correos con datos simulados distintos
+    user_memberships.clear()
+    account_lookup.clear()
+    embedding_cache.clear()
+    yield
+    user_memberships.clear()
+    account_lookup.clear()
+    embedding_cache.clear()
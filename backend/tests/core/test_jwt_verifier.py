@@ -0,0 +1,201 @@
+import json
+import os
+import time
+from unittest.mock import patch
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:8000")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+import jwt  # noqa: E402
+import pytest  # noqa: E402
+from core.deps import authenticate_token  # noqa: E402
+from core.jwt_verifier import JWKSUnavailable, TokenVerifier, TokenVerifierMisconfigured  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from jwt.algorithms import ECAlgorithm  # noqa: E402
+
+SECRET = "project-secret"
+USER_ID = "7c4d2a3e-0000-4000-8000-000000000001"
+
+
+def make_claims(**overrides) -> dict:
+    claims = {"sub": USER_ID, "role": "authenticated", "aud": "authenticated", "exp": int(time.time()) + 3600}
+    claims.update(overrides)
+    return claims
+
+
+def make_ec_key(kid: str):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(ECAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "alg": "ES256", "use": "sig"})
+    return private_key, jwk
+
+
+def test_hs256_token_is_verified_with_the_project_secret():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url="")
+    token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+
+    assert verifier.verify(token)["sub"] == USER_ID
+
+    forged = jwt.encode(make_claims(), "other-secret", algorithm="HS256")
+    with pytest.raises(jwt.InvalidSignatureError):
+        verifier.verify(forged)
+
+
+def test_expired_and_unsigned_tokens_are_rejected():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url="")
+
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verifier.verify(jwt.encode(make_claims(exp=int(time.time()) - 10), SECRET, algorithm="HS256"))
+
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        verifier.verify(jwt.encode(make_claims(), None, algorithm="none"))
+
+
+def test_hs256_without_secret_is_a_configuration_error():
+    verifier = TokenVerifier(jwt_secret="", jwks_url="")
+    with pytest.raises(TokenVerifierMisconfigured):
+        verifier.verify(jwt.encode(make_claims(), SECRET, algorithm="HS256"))
+
+
+def test_verified_tokens_skip_the_signature_check():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url="")
+    token = jwt.encode(make_claims(), SECRET, algorithm="HS256")
+
+    with patch("core.jwt_verifier.jwt.decode", wraps=jwt.decode) as decode:
+        for _ in range(3):
+            verifier.verify(token)
+
+    assert decode.call_count == 1
+
+
+def test_cached_token_still_expires():
+    verifier = TokenVerifier(jwt_secret=SECRET, jwks_url="")
+    token = jwt.encode(make_claims(exp=int(time.time()) + 60), SECRET, algorithm="HS256")
+    verifier.verify(token)
+
+    with patch("core.jwt_verifier.time.time", return_value=time.time() + 120):
+        with pytest.raises(jwt.ExpiredSignatureError):
+            verifier.verify(token)
+
+
+def test_asymmetric_tokens_use_the_cached_jwks():
+    private_key, jwk = make_ec_key("key-1")
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        return {"keys": [jwk]}
+
+    verifier = TokenVerifier(jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=fetch)
+    for user in ("a", "b"):
+        token = jwt.encode(make_claims(sub=user), private_key, algorithm="ES256", headers={"kid": "key-1"})
+        assert verifier.verify(token)["sub"] == user
+
+    assert fetches == ["https://example.supabase.co/jwks"]
+
+
+def test_unknown_kid_refreshes_the_jwks_once():
+    old_key, old_jwk = make_ec_key("old")
+    new_key, new_jwk = make_ec_key("new")
+    published = {"keys": [old_jwk]}
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        return published
+
+    verifier = TokenVerifier(jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=fetch)
+    verifier.verify(jwt.encode(make_claims(sub="a"), old_key, algorithm="ES256", headers={"kid": "old"}))
+
+    # Rotación de claves: el nuevo kid aún no está en caché
+    published = {"keys": [old_jwk, new_jwk]}
+    with patch("core.jwt_verifier.time.monotonic", return_value=time.monotonic() + 60):
+        payload = verifier.verify(jwt.encode(make_claims(sub="b"), new_key, algorithm="ES256", headers={"kid": "new"}))
+
+    assert payload["sub"] == "b"
+    assert len(fetches) == 2
+
+    with pytest.raises(jwt.InvalidKeyError):
+        verifier.verify(jwt.encode(make_claims(sub="c"), new_key, algorithm="ES256", headers={"kid": "missing"}))
+    assert len(fetches) == 2
+
+
+def test_jwks_outage_is_not_an_invalid_token():
+    private_key, jwk = make_ec_key("key-1")
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        raise ConnectionError("auth unreachable")
+
+    verifier = TokenVerifier(jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=fetch)
+    token = jwt.encode(make_claims(), private_key, algorithm="ES256", headers={"kid": "key-1"})
+
+    for _ in range(2):
+        with pytest.raises(JWKSUnavailable):
+            verifier.verify(token)
+    # Tras un fallo no se reintenta la descarga en cada petición
+    assert len(fetches) == 1
+
+
+def test_jwks_outage_keeps_using_the_last_good_keys():
+    private_key, jwk = make_ec_key("key-1")
+    new_key, _ = make_ec_key("new")
+    responses = [{"keys": [jwk]}, RuntimeError("503 Service Unavailable")]
+
+    def fetch(url):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    verifier = TokenVerifier(jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=fetch)
+    verifier.verify(jwt.encode(make_claims(sub="a"), private_key, algorithm="ES256", headers={"kid": "key-1"}))
+
+    with patch("core.jwt_verifier.time.monotonic", return_value=time.monotonic() + 60):
+        # Un kid nuevo no se puede comprobar sin descargar el JWKS
+        with pytest.raises(JWKSUnavailable):
+            verifier.verify(jwt.encode(make_claims(sub="b"), new_key, algorithm="ES256", headers={"kid": "new"}))
+        token = jwt.encode(make_claims(sub="c"), private_key, algorithm="ES256", headers={"kid": "key-1"})
+        assert verifier.verify(token)["sub"] == "c"
+
+
+def test_jwks_outage_is_reported_as_503():
+    with patch("core.deps.token_verifier.verify", side_effect=JWKSUnavailable("auth unreachable")):
+        with pytest.raises(HTTPException) as exc_info:
+            authenticate_token("token")
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers == {"Retry-After": "30"}
+
+
+def test_prepare_loads_the_jwks_before_the_first_request():
+    private_key, jwk = make_ec_key("key-1")
+    fetches = []
+
+    def fetch(url):
+        fetches.append(url)
+        return {"keys": [jwk]}
+
+    verifier = TokenVerifier(jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=fetch)
+    verifier.prepare()
+    verifier.verify(jwt.encode(make_claims(), private_key, algorithm="ES256", headers={"kid": "key-1"}))
+
+    assert len(fetches) == 1
+
+
+def test_prepare_fails_fast_when_hs256_has_no_secret():
+    # Un proyecto con el secreto legacy publica un JWKS vacío
+    verifier = TokenVerifier(
+        jwt_secret="", jwks_url="https://example.supabase.co/jwks", fetch_jwks=lambda url: {"keys": []}
+    )
+    with pytest.raises(TokenVerifierMisconfigured):
+        verifier.prepare()
+
+    with pytest.raises(TokenVerifierMisconfigured):
+        TokenVerifier(jwt_secret="", jwks_url="").prepare()
+
+    TokenVerifier(
+        jwt_secret=SECRET, jwks_url="https://example.supabase.co/jwks", fetch_jwks=lambda url: {"keys": []}
+    ).prepare()
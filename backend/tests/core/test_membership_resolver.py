@@ -0,0 +1,94 @@
+import asyncio
+import os
+from unittest.mock import MagicMock
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:8000")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "dummy-service")
+
+import pytest  # noqa: E402
+from api.chat.chat_helpers import verify_association_admin, verify_association_membership  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from services.helpers.membership_resolver import (  # noqa: E402
+    MembershipScopeMiddleware,
+    _request_memberships,
+    get_association_membership,
+    get_property_membership,
+    get_user_memberships,
+    invalidate_memberships,
+)
+from services.helpers.role_service import get_user_role  # noqa: E402
+
+USER_ID = "user-1"
+ROWS = [
+    {"id": "m1", "profile_id": USER_ID, "association_id": "assoc-1", "property_id": "prop-1", "role": "2"},
+    {"id": "m2", "profile_id": USER_ID, "association_id": "assoc-2", "property_id": None, "role": "1"},
+]
+
+
+def make_supabase(rows=ROWS):
+    supabase = MagicMock()
+    query = supabase.table.return_value
+    query.select.return_value = query
+    query.eq.return_value = query
+    query.execute.return_value = MagicMock(data=list(rows))
+    return supabase
+
+
+def test_all_helpers_share_one_membership_query():
+    supabase = make_supabase()
+
+    verify_association_membership("assoc-1", USER_ID, supabase)
+    verify_association_admin("assoc-2", USER_ID, supabase)
+    assert get_user_role(supabase, "assoc-1", USER_ID) == "2"
+    assert get_property_membership(supabase, "prop-1", USER_ID)["id"] == "m1"
+
+    assert supabase.table.call_count == 1
+    supabase.table.return_value.eq.assert_called_once_with("profile_id", USER_ID)
+
+
+def test_helpers_keep_their_errors():
+    supabase = make_supabase()
+
+    with pytest.raises(HTTPException) as exc:
+        verify_association_membership("assoc-3", USER_ID, supabase)
+    assert exc.value.status_code == 403
+
+    with pytest.raises(HTTPException) as exc:
+        verify_association_admin("assoc-1", USER_ID, supabase)
+    assert exc.value.status_code == 403
+
+    with pytest.raises(HTTPException) as exc:
+        get_user_role(supabase, "assoc-3", USER_ID)
+    assert exc.value.detail == "User has no access to this association"
+
+
+def test_invalidate_reloads_memberships():
+    supabase = make_supabase()
+    assert get_association_membership(supabase, "assoc-3", USER_ID) is None
+
+    supabase.table.return_value.execute.return_value = MagicMock(
+        data=ROWS + [{"id": "m3", "profile_id": USER_ID, "association_id": "assoc-3", "property_id": None, "role": "3"}]
+    )
+    assert get_association_membership(supabase, "assoc-3", USER_ID) is None
+
+    invalidate_memberships(USER_ID)
+    assert get_association_membership(supabase, "assoc-3", USER_ID)["id"] == "m3"
+    assert supabase.table.call_count == 2
+
+
+def test_middleware_opens_a_memo_per_request():
+    seen = []
+
+    async def app(scope, receive, send):
+        memo = _request_memberships.get()
+        seen.append(memo)
+        get_user_memberships(make_supabase(), USER_ID)
+
+    middleware = MembershipScopeMiddleware(app)
+    asyncio.run(middleware({"type": "http"}, None, None))
+    asyncio.run(middleware({"type": "http"}, None, None))
+
+    assert seen[0] is not seen[1]
+    assert [row["id"] for row in seen[0][USER_ID]] == ["m1", "m2"]
+    assert _request_memberships.get() is None
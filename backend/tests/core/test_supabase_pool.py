@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+import httpx
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:8000")
+os.environ.setdefault("SUPABASE_KEY", "dummy")
+
+from core.supabase_pool import SupabaseClientPool  # noqa: E402
+
+ANON_KEY = "anon-key"
+
+
+def make_pool(seen):
+    def handler(request: httpx.Request):
+        seen.append(request)
+        return httpx.Response(200, json=[{"id": 1}])
+
+    return SupabaseClientPool(transport=httpx.MockTransport(handler))
+
+
+def test_user_clients_share_one_http_client_and_overlay_token():
+    seen = []
+    pool = make_pool(seen)
+
+    alice = pool.user(ANON_KEY, "token-alice")
+    bob = pool.user(ANON_KEY, "token-bob")
+
+    assert alice.postgrest.session is pool.http_client
+    assert bob.postgrest.session is pool.http_client
+
+    alice.table("alerts").select("*").execute()
+    bob.table("alerts").select("*").execute()
+
+    assert [request.headers["Authorization"] for request in seen] == ["Bearer token-alice", "Bearer token-bob"]
+    assert all(request.headers["apikey"] == ANON_KEY for request in seen)
+    pool.close()
+
+
+def test_overlay_does_not_leak_between_requests():
+    pool = make_pool([])
+
+    alice = pool.user(ANON_KEY, "token-alice")
+    pool.user(ANON_KEY, "token-bob")
+
+    assert alice.options.headers["Authorization"] == "Bearer token-alice"
+    assert pool.user(ANON_KEY, "token-carol").options.headers["Authorization"] == "Bearer token-carol"
+    pool.close()
+
+
+def test_admin_client_is_reused():
+    pool = make_pool([])
+
+    assert pool.admin("service-key") is pool.admin("service-key")
+    assert pool.anon(ANON_KEY) is not pool.anon(ANON_KEY)
+    pool.close()
+
+
+def test_metrics_report_pool_size_and_traffic():
+    pool = make_pool([])
+    pool.max_connections = 10
+
+    pool.user(ANON_KEY, "token").table("alerts").select("*").execute()
+    metrics = pool.metrics()
+
+    assert metrics["max_connections"] == 10
+    assert metrics["requests"] == 1
+    assert metrics["responses_2xx"] == 1
+    assert metrics["user_overlays"] == 1
+    pool.close()
+
+
+def test_async_user_clients_share_async_pool_and_overlay_token():
+    seen = []
+
+    def handler(request: httpx.Request):
+        seen.append(request)
+        return httpx.Response(200, json=[{"id": 1}])
+
+    pool = SupabaseClientPool(async_transport=httpx.MockTransport(handler))
+
+    async def scenario():
+        alice = pool.async_user(ANON_KEY, "token-alice")
+        bob = pool.async_user(ANON_KEY, "token-bob")
+        assert alice.session is bob.session
+
+        await alice.table("messages").select("*").execute()
+        await bob.rpc("get_user_inbox", {"p_user_id": "u1"}).execute()
+        await pool.aclose()
+
+    asyncio.run(scenario())
+
+    assert [request.headers["Authorization"] for request in seen] == ["Bearer token-alice", "Bearer token-bob"]
+    assert pool.metrics()["requests"] == 2
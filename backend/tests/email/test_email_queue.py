@@ -0,0 +1,288 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+from core.config import settings
+from services.email_queue import (
+    EMAIL_FAILED,
+    EMAIL_PENDING,
+    EMAIL_SENDING,
+    EMAIL_SENT,
+    EmailConfigurationError,
+    EmailQueue,
+    OutboundEmail,
+    ResendTransport,
+    TokenBucket,
+)
+from services.email_service import build_invitation_email
+
+
+class StubTransport:
+    """Transporte local: guarda los lotes, falla con los errores indicados y rechaza los destinatarios dados."""
+
+    def __init__(self, errors=None, rejected=None):
+        self.batches = []
+        self.keys = []
+        self.errors = list(errors or [])
+        self.rejected = rejected or {}
+
+    def send_batch(self, rows, idempotency_key):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append([row["to_email"] for row in rows])
+        self.keys.append(idempotency_key)
+        return {i: self.rejected[row["to_email"]] for i, row in enumerate(rows) if row["to_email"] in self.rejected}
+
+
+class OutboxQuery:
+    def __init__(self, client):
+        self.client = client
+        self._values = None
+
+    def insert(self, rows):
+        inserted = []
+        for row in rows:
+            row = {"id": str(uuid4()), "next_attempt_at": None, **row}
+            self.client.rows.append(row)
+            inserted.append(row)
+        self.client.inserts += 1
+        self._result = inserted
+        return self
+
+    def update(self, values):
+        self._values = values
+        return self
+
+    def in_(self, column, values):
+        self._result = []
+        for row in self.client.rows:
+            if str(row[column]) in values:
+                row.update(self._values)
+                self._result.append(row)
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": self._result})()
+
+
+class FakeOutboxClient:
+    def __init__(self):
+        self.rows = []
+        self.inserts = 0
+
+    def table(self, name):
+        assert name == "email_outbox"
+        return OutboxQuery(self)
+
+    def rpc(self, name, params):
+        assert name == "claim_email_outbox"
+        now = datetime.now(timezone.utc)
+        lease_expired = now - timedelta(seconds=params["p_lease_seconds"])
+        # Igual que el RPC: primero el lote abandonado más antiguo, entero y con su batch_key
+        abandoned = sorted(
+            (row for row in self.rows if row["status"] == EMAIL_SENDING and row["claimed_at"] < lease_expired),
+            key=lambda row: row["claimed_at"],
+        )
+        claimed = [row for row in abandoned if abandoned and row.get("batch_key") == abandoned[0].get("batch_key")]
+        batch_key = str(uuid4())
+        for row in self.rows:
+            ready = row["next_attempt_at"] is None or datetime.fromisoformat(row["next_attempt_at"]) <= now
+            if row["status"] == EMAIL_PENDING and ready and len(claimed) < params["p_limit"]:
+                row["batch_key"] = batch_key
+                claimed.append(row)
+        for row in claimed:
+            row["status"] = EMAIL_SENDING
+            row["claimed_at"] = now
+        query = OutboxQuery(self)
+        query._result = [dict(row) for row in claimed]
+        return query
+
+    def make_ready(self):
+        for row in self.rows:
+            row["next_attempt_at"] = None
+
+
+def make_emails(count):
+    return [OutboundEmail(to=f"vecino{i}@test.com", subject="Hola", html="<p>Hola</p>") for i in range(count)]
+
+
+def make_queue(client, transport, **kwargs):
+    return EmailQueue(transport, client_factory=lambda: client, rate_per_second=1000, **kwargs)
+
+
+@pytest.mark.anyio
+async def test_enqueued_emails_are_sent_in_provider_batches():
+    client = FakeOutboxClient()
+    transport = StubTransport()
+    queue = make_queue(client, transport, batch_size=2)
+
+    queue.enqueue(make_emails(5))
+    assert client.inserts == 1
+    assert all(row["status"] == EMAIL_PENDING for row in client.rows)
+
+    assert await queue.drain() == 5
+    assert [len(batch) for batch in transport.batches] == [2, 2, 1]
+    assert all(row["status"] == EMAIL_SENT and row["sent_at"] for row in client.rows)
+    assert queue.metrics()["sent"] == 5
+
+
+@pytest.mark.anyio
+async def test_failed_batches_are_retried_with_backoff():
+    client = FakeOutboxClient()
+    transport = StubTransport(errors=[RuntimeError("429 rate limited")])
+    queue = make_queue(client, transport)
+
+    queue.enqueue(make_emails(2))
+    assert await queue.drain() == 0
+
+    row = client.rows[0]
+    assert row["status"] == EMAIL_PENDING
+    assert row["attempts"] == 1
+    assert row["last_error"] == "429 rate limited"
+    assert datetime.fromisoformat(row["next_attempt_at"]) > datetime.now(timezone.utc) + timedelta(seconds=20)
+
+    # No se reintenta antes de tiempo
+    assert await queue.drain() == 0
+    client.make_ready()
+    assert await queue.drain() == 2
+    assert all(row["status"] == EMAIL_SENT for row in client.rows)
+
+
+@pytest.mark.anyio
+async def test_emails_fail_after_max_attempts_or_configuration_errors():
+    client = FakeOutboxClient()
+    transport = StubTransport(errors=[RuntimeError("boom")] * 2)
+    queue = make_queue(client, transport, max_attempts=2)
+
+    queue.enqueue(make_emails(1))
+    await queue.drain()
+    client.make_ready()
+    await queue.drain()
+    assert client.rows[0]["status"] == EMAIL_FAILED
+    assert client.rows[0]["attempts"] == 2
+
+    client = FakeOutboxClient()
+    queue = make_queue(client, StubTransport(errors=[EmailConfigurationError("RESEND_API_KEY is not set")]))
+    queue.enqueue(make_emails(1))
+    await queue.drain()
+    assert client.rows[0]["status"] == EMAIL_FAILED
+    assert client.rows[0]["attempts"] == 1
+
+
+@pytest.mark.anyio
+async def test_rows_abandoned_in_sending_are_reclaimed_after_the_lease():
+    client = FakeOutboxClient()
+    transport = StubTransport()
+    queue = make_queue(client, transport)
+    queue.enqueue(make_emails(2))
+
+    # Un worker reclamó las filas y murió antes de marcarlas
+    client.rows[0].update(status=EMAIL_SENDING, claimed_at=datetime.now(timezone.utc) - timedelta(seconds=10))
+    client.rows[1].update(
+        status=EMAIL_SENDING, claimed_at=datetime.now(timezone.utc) - timedelta(hours=1), batch_key="lote-1"
+    )
+
+    assert await queue.drain() == 1
+    assert transport.batches == [[client.rows[1]["to_email"]]]
+    assert client.rows[0]["status"] == EMAIL_SENDING
+
+
+@pytest.mark.anyio
+async def test_reclaimed_batch_is_resent_with_its_original_idempotency_key():
+    client = FakeOutboxClient()
+    transport = StubTransport()
+    queue = make_queue(client, transport)
+    queue.enqueue(make_emails(3))
+
+    # El primer worker envió el lote de las tres filas y cayó antes de marcarlas
+    client.rpc("claim_email_outbox", {"p_limit": 100, "p_lease_seconds": 300})
+    first_key = client.rows[0]["batch_key"]
+    for row in client.rows:
+        row["claimed_at"] = datetime.now(timezone.utc) - timedelta(hours=1)
+    queue.enqueue(make_emails(1))
+
+    assert await queue.drain() == 4
+    assert transport.keys[0] == first_key
+    assert transport.batches[0] == ["vecino0@test.com", "vecino1@test.com", "vecino2@test.com"]
+    assert transport.keys[1] != first_key
+
+
+@pytest.mark.anyio
+async def test_rejected_recipient_does_not_fail_the_rest_of_the_batch():
+    client = FakeOutboxClient()
+    transport = StubTransport(rejected={"vecino1@test.com": "Invalid `to` field"})
+    queue = make_queue(client, transport)
+
+    queue.enqueue(make_emails(3))
+
+    assert await queue.drain() == 2
+    statuses = {row["to_email"]: row["status"] for row in client.rows}
+    assert statuses == {
+        "vecino0@test.com": EMAIL_SENT,
+        "vecino1@test.com": EMAIL_FAILED,
+        "vecino2@test.com": EMAIL_SENT,
+    }
+    rejected = client.rows[1]
+    assert rejected["attempts"] == 1 and rejected["last_error"] == "Invalid `to` field"
+    # No vuelve a entrar en ningún lote
+    client.make_ready()
+    assert await queue.drain() == 0
+    assert len(transport.batches) == 1
+
+
+@pytest.mark.anyio
+async def test_background_sender_is_woken_from_request_threads():
+    client = FakeOutboxClient()
+    transport = StubTransport()
+    queue = make_queue(client, transport, poll_interval=60)
+    queue.start()
+
+    # Los endpoints síncronos encolan desde el threadpool
+    await asyncio.to_thread(queue.enqueue, make_emails(3))
+    for _ in range(100):
+        if transport.batches:
+            break
+        await asyncio.sleep(0.01)
+
+    assert transport.batches == [["vecino0@test.com", "vecino1@test.com", "vecino2@test.com"]]
+    await queue.stop()
+    assert queue.metrics()["running"] is False
+
+
+@pytest.mark.anyio
+async def test_token_bucket_limits_provider_calls():
+    bucket = TokenBucket(rate=20, capacity=1)
+    started = time.monotonic()
+    for _ in range(3):
+        await bucket.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+def test_invitation_email_points_to_the_invitation():
+    email = build_invitation_email("nuevo@test.com", "inv-1", "Inquilino")
+    assert email.kind == "invitation"
+    assert email.reference_id == "inv-1"
+    assert email.subject == "Invitación a VecinUs como Inquilino"
+    assert "accept-invitation?token=inv-1" in email.html
+
+
+def test_resend_transport_sends_permissive_batches_and_reports_rejections():
+    rows = [
+        {"to_email": "vecino0@test.com", "subject": "Hola", "html": "<p>Hola</p>"},
+        {"to_email": "no-es-un-correo", "subject": "Hola", "html": "<p>Hola</p>", "text": "Hola"},
+    ]
+    response = {"data": [{"id": "e1"}], "errors": [{"index": 1, "message": "Invalid `to` field"}]}
+
+    # Otros tests sustituyen el módulo resend en sys.modules: se parchea el que usa la cola
+    with patch.object(settings, "RESEND_API_KEY", "re_test"), patch("services.email_queue.resend") as resend:
+        resend.Batch.send.return_value = response
+        rejected = ResendTransport("Vecinus <no-reply@test.com>").send_batch(rows, "lote-1")
+
+    assert rejected == {1: "Invalid `to` field"}
+    messages, options = resend.Batch.send.call_args.args
+    assert options == {"idempotency_key": "lote-1", "batch_validation": "permissive"}
+    assert [message["to"] for message in messages] == [["vecino0@test.com"], ["no-es-un-correo"]]
+    assert messages[1]["text"] == "Hola" and "text" not in messages[0]
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+import pytest
+from services.email_service import build_invitation_email
+from services.email_templates import EmailTemplate, TemplateRegistry
+
+
+def test_invitation_shells_are_precompiled_per_role():
+    with patch.object(EmailTemplate, "compile", side_effect=AssertionError("should be cached")):
+        for role_label in ("Propietario", "Inquilino", "Presidente", "Empleado"):
+            email = build_invitation_email("nuevo@test.com", "inv-1", role_label)
+            assert role_label in email.html
+            assert role_label in email.text
+
+
+def test_invitation_email_has_html_and_plain_text():
+    email = build_invitation_email("nuevo@test.com", "inv-1", "Inquilino")
+
+    assert email.subject == "Invitación a VecinUs como Inquilino"
+    assert email.html.startswith("<!DOCTYPE html>")
+    assert email.html.count("/auth/accept-invitation?token=inv-1") == 3
+    assert "/auth/accept-invitation?token=inv-1" in email.text
+    assert "<" not in email.text
+
+
+def test_slot_values_are_escaped_only_in_html():
+    registry = TemplateRegistry()
+    registry.register(
+        EmailTemplate(
+            name="note",
+            subject="Nota de $author",
+            html_body="<p>$note</p>",
+            text_body="$note",
+            fixed=("author",),
+            slots=("note",),
+        )
+    )
+
+    rendered = registry.render("note", {"author": "Ana & Luis"}, {"note": "<b>hola</b>"})
+    assert rendered.subject == "Nota de Ana & Luis"
+    assert "<p>&lt;b&gt;hola&lt;/b&gt;</p>" in rendered.html
+    assert rendered.text.startswith("<b>hola</b>")
+    assert registry.cached_shells == 1
+
+    with pytest.raises(KeyError):
+        registry.render("note", {"author": "Ana"}, {})
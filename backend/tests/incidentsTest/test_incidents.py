@@ -844,7 +844,9 @@ def test_post_incident_create_in_db_fails():
     memberships_table = MagicMock()
     memberships_table.select.return_value = memberships_table
     memberships_table.eq.return_value = memberships_table
-    memberships_table.execute.return_value = MagicMock(data=[{"id": mock_tenant_membership_id, "role": "3"}])
+    memberships_table.execute.return_value = MagicMock(
+        data=[{"id": mock_tenant_membership_id, "association_id": mock_association_id, "role": "3"}]
+    )
 
     incidents_table = MagicMock()
     incidents_table.insert.return_value = incidents_table
@@ -59,6 +59,9 @@ interface Message {
 
 type NativeFile = { uri: string; name: string; type: string };
 
+const INGESTION_POLL_INTERVAL_MS = 1500;
+const INGESTION_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
 type TabItemProps = {
   label: string;
   icon: React.ReactNode;
@@ -310,6 +313,35 @@ export default function ChatBotScreen() {
     }
   };
 
+  // El backend indexa el documento en segundo plano: se consulta su estado hasta que termina
+  const waitForIngestion = async (statusUrl: string, title: string) => {
+    const deadline = Date.now() + INGESTION_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) =>
+        setTimeout(resolve, INGESTION_POLL_INTERVAL_MS),
+      );
+      try {
+        const response = await fetch(`${API_URL}${statusUrl}`, {
+          headers: { Authorization: `Bearer ${authHeaderToken}` },
+        });
+        if (!response.ok) continue;
+        const job = await response.json();
+        if (job.status === "completed") {
+          showToast(`"${job.document_title || title}" indexado correctamente.`);
+          void fetchDocuments();
+          return;
+        }
+        if (job.status === "failed") {
+          Alert.alert("Error", job.error || "No se pudo indexar el documento.");
+          return;
+        }
+      } catch {
+        // Error de red puntual: se vuelve a intentar en la siguiente vuelta
+      }
+    }
+    void fetchDocuments();
+  };
+
   const handleUploadDocument = async () => {
     if (!selectedFile && (!docTitle.trim() || !docContent.trim())) {
       Alert.alert(
@@ -373,12 +405,16 @@ export default function ChatBotScreen() {
       }
 
       const data = await response.json();
-      showToast(data.message || `"${docTitle}" indexado correctamente.`);
+      showToast(data.message || `"${docTitle}" recibido.`);
 
       setSelectedFile(null);
       setDocTitle("");
       setDocContent("");
-      void fetchDocuments();
+      if (data.status_url) {
+        void waitForIngestion(data.status_url, docTitle);
+      } else {
+        void fetchDocuments();
+      }
     } catch (error: unknown) {
       const message = error instanceof Error ? error.message : "Error al subir";
       Alert.alert("Error", message);